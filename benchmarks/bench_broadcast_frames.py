@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: custo de CPU por broadcast de `conversation_update`.
+
+Compara o caminho antigo (`conv.dict()` + `json.dumps` por agente, como o
+`send_json` do Starlette fazia) com o frame codificado uma única vez por
+`chat_frames.encode_event`, variando o tamanho da conversa e o número de agentes.
+
+Uso:
+    python benchmarks/bench_broadcast_frames.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_frames import encode_event, orjson  # noqa: E402
+from main_api import ClientInfo, Conversation  # noqa: E402
+
+MESSAGE_COUNTS = (10, 100, 1000)
+AGENT_COUNTS = (1, 10, 50, 200)
+
+
+def build_conversation(n_messages: int) -> Conversation:
+    messages = [
+        {
+            "id": str(uuid.uuid4()),
+            "content": f"Mensagem de teste número {i} com acentuação: orçamento, atenção.",
+            "sender": "client" if i % 2 else "agent",
+            "timestamp": datetime.now().isoformat(),
+            "status": "sent",
+        }
+        for i in range(n_messages)
+    ]
+    return Conversation(
+        id=str(uuid.uuid4()),
+        clientName="Cliente Benchmark",
+        lastMessage="Olá",
+        unread=0,
+        time="12:00",
+        status="active",
+        clientInfo=ClientInfo(email="cliente@exemplo.com", phone="11999999999", project="Site", urgency="alta"),
+        messages=messages,
+        tags=["Novo Cliente"],
+        agent_name="João Atendente",
+    )
+
+
+def legacy_broadcast(conv: Conversation, n_agents: int):
+    message = {"type": "conversation_update", "conversation": conv.model_dump()}
+    for _ in range(n_agents):
+        json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def frame_broadcast(conv: Conversation, n_agents: int):
+    frame = encode_event("conversation_update", conversation=conv)
+    for _ in range(n_agents):
+        _ = frame  # o mesmo frame é entregue a todas as filas de saída
+
+
+def measure(fn, conv: Conversation, n_agents: int, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(conv, n_agents)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Encoder rápido: {'orjson' if orjson else 'json (stdlib)'}")
+    print(f"{'mensagens':>10} {'agentes':>8} {'antigo (µs)':>13} {'frame (µs)':>12} {'ganho':>7}")
+    for n_messages in MESSAGE_COUNTS:
+        conv = build_conversation(n_messages)
+        for n_agents in AGENT_COUNTS:
+            repeat = max(1, args.repeat // max(1, n_messages * n_agents // 1000))
+            legacy = measure(legacy_broadcast, conv, n_agents, repeat)
+            framed = measure(frame_broadcast, conv, n_agents, repeat)
+            print(f"{n_messages:>10} {n_agents:>8} {legacy:>13.1f} {framed:>12.1f} {legacy / framed:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Benchmark: latência do WebSocket do chat durante um pico de logins.
+
+Sobe `uvicorn main_api:app` duas vezes: com PASSWORD_HASH_WORKERS=0 (argon2
+rodando no event loop, como antes) e com o pool padrão. Em cada rodada um
+cliente manda uma mensagem a cada `--interval` ms para um agente conectado e
+mede quanto cada uma leva para chegar, enquanto `--logins` requisições
+POST /token disparam ao mesmo tempo (`--concurrency` por vez).
+
+Requer os pacotes `websockets` e `httpx`.
+
+Uso:
+    python benchmarks/bench_login_latency.py --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+
+from main_api import create_access_token  # noqa: E402
+
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Servidor não subiu a tempo")
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_round(port: int, logins: int, concurrency: int, interval: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    url = f"ws://127.0.0.1:{port}/ws/chat"
+    email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "senha-do-benchmark"
+
+    async with httpx.AsyncClient(base_url=base, timeout=120) as http:
+        r = await http.post("/register", json={"email": email, "password": password, "name": "Bench"})
+        r.raise_for_status()
+
+        agent = await websockets.connect(url)
+        await agent.send(json.dumps({"type": "agent_auth", "token": create_access_token({"sub": AGENT_EMAIL})}))
+        guest = await websockets.connect(url)
+        await guest.send(json.dumps({"type": "user_join", "userData": {"name": "Bench"}}))
+        async for raw in guest:
+            data = json.loads(raw)
+            if data.get("type") == "transfer_status" and data.get("status") == "connected":
+                break
+
+        latencies = []
+        stop = asyncio.Event()
+
+        async def agent_loop():
+            async for raw in agent:
+                data = json.loads(raw)
+                if data.get("type") == "client_message":
+                    latencies.append((time.perf_counter() - float(data["message"])) * 1000)
+
+        async def guest_loop():
+            while not stop.is_set():
+                await guest.send(json.dumps({"type": "user_message", "message": repr(time.perf_counter())}))
+                await asyncio.sleep(interval / 1000)
+
+        results = {"ok": 0, "busy": 0, "error": 0}
+        slots = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with slots:
+                r = await http.post("/token", data={"username": email, "password": password})
+            key = "ok" if r.status_code == 200 else "busy" if r.status_code == 503 else "error"
+            results[key] += 1
+
+        agent_task = asyncio.create_task(agent_loop())
+        guest_task = asyncio.create_task(guest_loop())
+        await asyncio.sleep(0.5)
+        latencies.clear()  # Só conta as mensagens enviadas durante o pico
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await guest_task
+        await asyncio.sleep(0.2)
+        agent_task.cancel()
+        await agent.close()
+        await guest.close()
+
+    return {
+        "logins_per_s": logins / elapsed,
+        "logins": results,
+        "messages": len(latencies),
+        "p50_ms": statistics.median(latencies) if latencies else None,
+        "p99_ms": percentile(latencies, 99) if latencies else None,
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="logins simultâneos")
+    parser.add_argument("--interval", type=float, default=10.0, help="ms entre mensagens do cliente")
+    args = parser.parse_args()
+
+    print(f"{'modo':>10} {'logins/s':>9} {'msgs':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  logins")
+    for label, workers in (("no loop", "0"), ("pool", None)):
+        port = free_port()
+        env = dict(os.environ)
+        if workers is not None:
+            env["PASSWORD_HASH_WORKERS"] = workers
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main_api:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_ready(port))
+            r = asyncio.run(run_round(port, args.logins, args.concurrency, args.interval))
+            print(f"{label:>10} {r['logins_per_s']:>9.1f} {r['messages']:>6} {r['p50_ms']:>8.1f} "
+                  f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}  {r['logins']}")
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark: mensagens/s do chat com o backend Redis, de 1 a N workers.
+
+Para cada quantidade de workers sobe `uvicorn main_api:app --workers N` com
+CHAT_BACKEND=redis, conecta agentes e clientes por WebSocket (o kernel espalha
+as conexões entre os workers, então boa parte das sessões cruza workers via
+pub/sub) e mede quantas `client_message` por segundo chegam aos agentes.
+
+Requer um Redis acessível em REDIS_URL e o pacote `websockets`.
+
+Uso:
+    REDIS_URL=redis://localhost:6379/0 python benchmarks/bench_redis_workers.py --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import websockets  # noqa: E402
+
+from main_api import create_access_token  # noqa: E402
+
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Servidor não subiu a tempo")
+
+
+async def run_round(url: str, agents: int, guests: int, messages: int) -> float:
+    token = create_access_token({"sub": AGENT_EMAIL})
+    received = 0
+    done = asyncio.Event()
+    total = guests * messages
+
+    async def agent_loop(ws):
+        nonlocal received
+        async for raw in ws:
+            if json.loads(raw).get("type") == "client_message":
+                received += 1
+                if received >= total:
+                    done.set()
+
+    agent_sockets = []
+    for _ in range(agents):
+        ws = await websockets.connect(url)
+        await ws.send(json.dumps({"type": "agent_auth", "token": token, "capacity": 5}))
+        agent_sockets.append(ws)
+    await asyncio.sleep(0.5)
+    agent_tasks = [asyncio.create_task(agent_loop(ws)) for ws in agent_sockets]
+
+    guest_sockets = []
+    for i in range(guests):
+        ws = await websockets.connect(url)
+        await ws.send(json.dumps({"type": "user_join", "userData": {"name": f"Bench {i}"}}))
+        guest_sockets.append(ws)
+
+    async def wait_connected(ws):
+        async for raw in ws:
+            data = json.loads(raw)
+            if data.get("type") == "transfer_status" and data.get("status") == "connected":
+                return
+
+    await asyncio.wait_for(asyncio.gather(*(wait_connected(ws) for ws in guest_sockets)), 30)
+
+    async def guest_send(ws):
+        for n in range(messages):
+            await ws.send(json.dumps({"type": "user_message", "message": f"msg {n}", "timestamp": time.time()}))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(guest_send(ws) for ws in guest_sockets))
+    await asyncio.wait_for(done.wait(), 120)
+    elapsed = time.perf_counter() - start
+
+    for ws in guest_sockets + agent_sockets:
+        await ws.close()
+    for task in agent_tasks:
+        task.cancel()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--guests", type=int, default=100, help="deve caber em agents * 5")
+    parser.add_argument("--messages", type=int, default=200, help="mensagens por cliente")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'msgs/s':>10}")
+    for workers in args.workers:
+        port = free_port()
+        env = dict(os.environ, CHAT_BACKEND="redis", CHAT_REDIS_PREFIX=f"bench:{uuid.uuid4().hex[:8]}")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main_api:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_ready(port))
+            time.sleep(1.0)  # Dá tempo de todos os workers assinarem os canais
+            rate = asyncio.run(run_round(f"ws://127.0.0.1:{port}/ws/chat", args.agents, args.guests, args.messages))
+            print(f"{workers:>8} {rate:>10.0f}")
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
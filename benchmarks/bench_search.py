@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Benchmark: busca textual de conversas (GET /conversations/search).
+
+Grava `--conversations` conversas com `--messages` mensagens cada num
+WriteBehindStore (o índice é mantido a cada gravação, como no servidor),
+mede o custo de indexar e depois a latência de algumas buscas típicas do
+painel: nome, e-mail, telefone sem pontuação, termos com e sem acento e
+prefixo (busca enquanto digita).
+
+Uso:
+    python benchmarks/bench_search.py --conversations 20000 --messages 6
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_store import MemoryConversationStore, WriteBehindStore  # noqa: E402
+from main_api import ClientInfo, Conversation  # noqa: E402
+
+FIRST_NAMES = ["João", "Maria", "José", "Ana", "Luís", "Márcia", "Sérgio", "Fábio", "Letícia", "Cláudio"]
+LAST_NAMES = ["Silva", "Souza", "Conceição", "Araújo", "Gonçalves", "Magalhães", "Brandão", "Simões"]
+PROJECTS = ["site", "ecommerce", "sistema", "aplicativo", "landing"]
+PHRASES = [
+    "Olá, preciso de um orçamento para um site institucional",
+    "Qual o prazo de entrega do projeto?",
+    "Vocês fazem integração com o sistema de pagamento?",
+    "Gostaria de migrar minha loja virtual para outra plataforma",
+    "O aplicativo precisa funcionar no Android e no iOS",
+    "Podemos marcar uma reunião na quinta-feira?",
+    "Segue o contrato assinado, obrigado pela atenção",
+    "A hospedagem está inclusa no valor?",
+    "Preciso de manutenção mensal e suporte técnico",
+    "O formulário de contato não está enviando e-mails",
+]
+
+QUERIES = ["orçamento", "orcamento", "joao silva", "conceicao", "Magalhães aplicativo",
+           "pagamento integração", "3199", "cliente123@", "reun", "hospedagem valor"]
+
+
+def make_conversation(rng: random.Random, i: int, messages: int) -> Conversation:
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    return Conversation(
+        id=str(uuid.uuid4()),
+        clientName=name,
+        lastMessage="",
+        unread=0,
+        time="10:30",
+        status="closed",
+        clientInfo=ClientInfo(email=f"cliente{i}@exemplo.com", phone=f"(31) 9{i:04d}-{rng.randrange(10000):04d}",
+                              source="site", timeOnPage="3 min", project=rng.choice(PROJECTS), urgency="media"),
+        messages=[{"id": str(uuid.uuid4()), "content": rng.choice(PHRASES), "sender": "client",
+                   "timestamp": "2025-01-01T10:01:00", "status": "sent"} for _ in range(messages)],
+        tags=[],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    conversations = [make_conversation(rng, i, args.messages) for i in range(args.conversations)]
+    store = WriteBehindStore(MemoryConversationStore(), Conversation, max_closed=args.conversations)
+    started = time.perf_counter()
+    for conv in conversations:
+        store.save(conv)
+    index_time = time.perf_counter() - started
+
+    # Atualização incremental: uma mensagem nova numa conversa já indexada
+    conv = conversations[0]
+    started = time.perf_counter()
+    for _ in range(1000):
+        conv.messages.append({"content": rng.choice(PHRASES), "sender": "agent"})
+        store.text_index.update(conv)
+    append_time = (time.perf_counter() - started) / 1000
+
+    index = store.text_index
+    total_messages = args.conversations * args.messages
+    print(f"conversas: {args.conversations}  mensagens: {total_messages}  termos: {len(index._postings)}")
+    print(f"indexação (save de todas):   {index_time * 1000:9.1f} ms")
+    print(f"mensagem nova (incremental): {append_time * 1e6:9.1f} µs")
+    print(f"{'busca':<24} {'total':>7} {'mediana':>10} {'p95':>10}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            _, total = index.search(query, 0, 20)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{query!r:<24} {total:>7} {statistics.median(timings) * 1000:>8.2f}ms {p95 * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Benchmark: tempo de restauração do snapshot de warm restart.
+
+Monta um WriteBehindStore com `--conversations` conversas no store em
+memória, das quais `--hot` continuam no cache quente (em espera, em
+atendimento ou fechadas há pouco), grava o snapshot e mede quanto leva para
+um processo novo abri-lo e restaurar. Como comparação, mede também o
+caminho ingênuo: decodificar todas as conversas em objetos Pydantic.
+
+Uso:
+    python benchmarks/bench_snapshot_restore.py --conversations 50000 --hot 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_snapshot import Snapshot, Snapshotter  # noqa: E402
+from chat_store import MemoryConversationStore, WriteBehindStore  # noqa: E402
+from main_api import ClientInfo, Conversation  # noqa: E402
+
+
+def make_conversation(i: int, status: str) -> Conversation:
+    return Conversation(
+        id=str(uuid.uuid4()),
+        clientName=f"Cliente {i}",
+        lastMessage="Conversa encerrada." if status == "closed" else "Olá, preciso de um orçamento.",
+        unread=0,
+        time="10:30",
+        status=status,
+        clientInfo=ClientInfo(email=f"cliente{i}@exemplo.com", phone="(31) 99999-0000", source="site",
+                              timeOnPage="3 min", project="site", urgency="media"),
+        messages=[
+            {"text": "Quero um site novo", "isBot": False, "timestamp": "2025-01-01T10:00:00"},
+            {"text": "Claro! Qual o prazo?", "isBot": True, "timestamp": "2025-01-01T10:00:05"},
+            {"id": str(uuid.uuid4()), "content": "Preciso de um orçamento", "sender": "client",
+             "timestamp": "2025-01-01T10:01:00", "status": "sent"},
+        ],
+        tags=["Novo Cliente"],
+    )
+
+
+async def build(path: str, total: int, hot: int) -> float:
+    store = WriteBehindStore(MemoryConversationStore(), Conversation, max_closed=total)
+    for i in range(total):
+        store.save(make_conversation(i, "closed" if i >= hot // 2 else "waiting"))
+    await store.flush()
+    # Tudo além das `hot` mais recentes sai do cache, como faria a retenção
+    store.evict([conv_id for conv_id in list(store.cache)[hot:]])
+    snapshotter = Snapshotter(lambda: ({"events": None, "queue": [], "sessions": {}}, store.snapshot_records()),
+                              path=path, interval=0)
+    started = time.perf_counter()
+    await snapshotter.stop()
+    return time.perf_counter() - started
+
+
+def restore(path: str):
+    started = time.perf_counter()
+    snapshot = Snapshot.open(path)
+    store = WriteBehindStore(MemoryConversationStore(), Conversation)
+    restored = store.restore(snapshot)
+    snapshot.close()
+    return time.perf_counter() - started, restored, len(store.store.docs)
+
+
+def decode_all(path: str) -> float:
+    snapshot = Snapshot.open(path)
+    started = time.perf_counter()
+    for _, offset, length, _ in snapshot.records:
+        Conversation.model_validate_json(snapshot.load(offset, length))
+    elapsed = time.perf_counter() - started
+    snapshot.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50000)
+    parser.add_argument("--hot", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat_state.snapshot")
+        save_time = asyncio.run(build(path, args.conversations, args.hot))
+        size = os.path.getsize(path)
+        restore_time, restored, archived = restore(path)
+        naive_time = decode_all(path)
+
+    print(f"conversas: {args.conversations}  quentes: {args.hot}  arquivo: {size / 1024:.0f} KiB")
+    print(f"gravação (desligamento):        {save_time * 1000:8.1f} ms")
+    print(f"restauração (cache + store):    {restore_time * 1000:8.1f} ms  ({restored} decodificadas, {archived} no store)")
+    print(f"decodificar tudo (comparação):  {naive_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Benchmark: memória e custo da transcrição das conversas (ver chat_transcript).
+
+Monta `--conversations` conversas com `--messages` mensagens cada de duas
+formas: a lista de dicts de antes (id uuid e horário ISO como strings) e a
+`Transcript` em colunas, registrando cada mensagem com `add` como faz o
+`ConnectionManager`. Compara a memória alocada (tracemalloc), o custo do
+append e o de serializar a conversa (flush do store / `conversation_update`).
+
+Uso:
+    python benchmarks/bench_transcript.py --conversations 500 --messages 200
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_transcript import Transcript  # noqa: E402
+from main_api import ClientInfo, Conversation  # noqa: E402
+
+PHRASES = [
+    "Olá, preciso de um orçamento para um site institucional",
+    "Qual o prazo de entrega do projeto?",
+    "Claro! Em média 30 dias depois da aprovação do layout.",
+    "A hospedagem está inclusa no valor?",
+    "Sim, o primeiro ano de hospedagem está incluso.",
+]
+
+
+def as_dicts(messages: int) -> list:
+    return [{"id": str(uuid.uuid4()), "content": PHRASES[i % len(PHRASES)],
+             "sender": "client" if i % 2 else "agent", "timestamp": datetime.now().isoformat(), "status": "sent"}
+            for i in range(messages)]
+
+
+def as_transcript(messages: int) -> Transcript:
+    transcript = Transcript()
+    for i in range(messages):
+        transcript.add(PHRASES[i % len(PHRASES)], "client" if i % 2 else "agent")
+    return transcript
+
+
+def allocated(build, conversations: int, messages: int):
+    gc.collect()
+    started = time.perf_counter()
+    [build(messages) for _ in range(conversations)]
+    elapsed = time.perf_counter() - started  # Medido fora do tracemalloc, que deixa cada alocação bem mais lenta
+    gc.collect()
+    tracemalloc.start()
+    built = [build(messages) for _ in range(conversations)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, size, elapsed
+
+
+def conversation(messages) -> Conversation:
+    return Conversation(
+        id=str(uuid.uuid4()), clientName="Márcia Gonçalves", lastMessage="", unread=0, time="10:30",
+        status="active", clientInfo=ClientInfo(email="marcia@clinica.com.br", phone="(31) 99876-5432"),
+        messages=messages, tags=[],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    total = args.conversations * args.messages
+    print(f"conversas: {args.conversations}  mensagens: {total}")
+    print(f"{'formato':<14} {'memória':>10} {'bytes/msg':>10} {'append':>10} {'serializar':>12}")
+    for label, build in (("list[dict]", as_dicts), ("Transcript", as_transcript)):
+        built, size, elapsed = allocated(build, args.conversations, args.messages)
+        conv = conversation(built[0])
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            conv.model_dump_json()
+        serialize = (time.perf_counter() - started) / args.repeat
+        print(f"{label:<14} {size / 2 ** 20:>8.1f}MB {size / total:>10.0f} {elapsed / total * 1e6:>8.2f}µs "
+              f"{serialize * 1000:>10.2f}ms")
+        del built
+
+
+if __name__ == "__main__":
+    main()
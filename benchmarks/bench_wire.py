@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Benchmark: bytes no fio e CPU por formato de frame do /ws/chat (ver chat_wire).
+
+Para cada payload típico (mensagem curta, `new_conversation` com histórico da
+IA, `conversation_update` de uma conversa longa e o snapshot que o agente
+recebe ao conectar) compara JSON (padrão), MessagePack, JSON + deflate e
+MessagePack + deflate: tamanho do frame, custo de codificar no servidor
+(a partir do frame JSON já montado, como acontece em `WireSocket`) e de
+decodificar do lado do cliente.
+
+Uso:
+    python benchmarks/bench_wire.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_frames import encode_event, encode_frame  # noqa: E402
+from chat_wire import decode_payload, encode_payload, msgpack  # noqa: E402
+from main_api import ClientInfo, Conversation  # noqa: E402
+
+AI_TURNS = [
+    ("Olá! Sou a assistente virtual da WP Web Soluções. Como posso ajudar?", True),
+    ("Quero fazer um site para minha clínica odontológica", False),
+    ("Ótimo! Vocês já têm domínio e hospedagem? Precisam de agendamento online?", True),
+    ("Temos domínio, mas não hospedagem. Agendamento online seria ótimo.", False),
+    ("Perfeito. Qual o prazo ideal para o site ficar pronto e qual a faixa de investimento?", True),
+    ("Uns dois meses, até uns cinco mil reais se possível", False),
+]
+
+
+def ai_history(turns: int):
+    return [{"text": AI_TURNS[i % len(AI_TURNS)][0], "isBot": AI_TURNS[i % len(AI_TURNS)][1],
+             "timestamp": datetime.now().isoformat()} for i in range(turns)]
+
+
+def conversation(messages: int) -> Conversation:
+    history = ai_history(12) + [
+        {"id": str(uuid.uuid4()), "content": f"Mensagem {i}: podemos seguir com o orçamento e o cronograma?",
+         "sender": "client" if i % 2 else "agent", "timestamp": datetime.now().isoformat(), "status": "sent"}
+        for i in range(messages)
+    ]
+    return Conversation(
+        id=str(uuid.uuid4()), clientName="Márcia Gonçalves", lastMessage="Obrigada!", unread=2, time="10:30",
+        status="active",
+        clientInfo=ClientInfo(email="marcia@clinica.com.br", phone="(31) 99876-5432", source="Google",
+                              timeOnPage="4 min", project="site", urgency="alta"),
+        messages=history, tags=["Novo Cliente"], agent_name="João Atendente",
+    )
+
+
+def payloads():
+    yield "agent_message", encode_frame({"type": "agent_message", "guest_id": str(uuid.uuid4()), "message": {
+        "id": str(uuid.uuid4()), "content": "Claro, já te envio a proposta.", "sender": "agent",
+        "timestamp": datetime.now().isoformat(), "status": "sent"}})
+    yield "new_conversation", encode_frame({"type": "new_conversation", "guest_id": str(uuid.uuid4()),
+                                            "userData": {"name": "Márcia", "email": "marcia@clinica.com.br"},
+                                            "conversationHistory": ai_history(20)})
+    yield "conversation_update", encode_event("conversation_update", conversation=conversation(100))
+    yield "snapshot (50 conv.)", encode_event("snapshot", epoch="a1b2c3", seq=1,
+                                              conversations=[conversation(20) for _ in range(50)])
+
+
+def modes():
+    yield "json", "json", False
+    if msgpack is not None:
+        yield "msgpack", "msgpack", False
+    yield "json+deflate", "json", True
+    if msgpack is not None:
+        yield "msgpack+deflate", "msgpack", True
+
+
+def client_decode(payload):
+    return json.loads(payload) if isinstance(payload, str) else decode_payload(payload)
+
+
+def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if msgpack is None:
+        print("msgpack não instalado: medindo só JSON e JSON + deflate")
+    print(f"{'payload':<22} {'formato':<16} {'bytes':>9} {'%json':>6} {'codificar':>11} {'decodificar':>12}")
+    for name, frame in payloads():
+        json_size = len(frame.encode("utf-8"))
+        repeat = max(5, args.repeat // (1 + json_size // 100_000))
+        for label, protocol, deflate in modes():
+            payload = encode_payload(frame, protocol, deflate)
+            size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+            encode = 0.0 if protocol == "json" and not deflate else \
+                timed(lambda: encode_payload(frame, protocol, deflate), repeat)
+            decode = timed(lambda: client_decode(payload), repeat)
+            print(f"{name:<22} {label:<16} {size:>9} {size / json_size:>6.0%} "
+                  f"{encode * 1e6:>9.1f}µs {decode * 1e6:>10.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
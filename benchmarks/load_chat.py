@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Teste de carga do chat: N agentes e M clientes em WebSockets reais.
+
+O app (`main_api:app`) sobe neste processo com `uvicorn.Server`; a carga roda
+num processo filho, para que a memória medida aqui seja só a do servidor.
+Cada cliente entra (`user_join`), espera um agente (o tempo na fila é medido),
+manda `--messages` mensagens a cada `--interval` segundos e sai, o que libera
+a vaga para o próximo da fila. Os agentes respondem cada mensagem com
+`agent_typing` + `agent_message`. Com `--churn`, parte dos clientes cai no
+meio do atendimento e entra de novo.
+
+Mede:
+- vazão (mensagens entregues por segundo, nos dois sentidos);
+- latência p50/p99/máx cliente -> agente e agente -> cliente;
+- espera na fila (do `user_join` ao `transfer_status: connected`);
+- memória do servidor por conexão (RSS e, com --tracemalloc, heap Python).
+
+O resultado vai para um JSON (padrão: benchmarks/results/load_chat-<commit>.json)
+e `--compare outro.json` mostra a diferença para uma rodada anterior.
+
+Requer o pacote `websockets`.
+
+Uso:
+    python benchmarks/load_chat.py --agents 20 --guests 100 --messages 20
+    python benchmarks/load_chat.py --compare benchmarks/results/load_chat-abc1234.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource  # Sem /proc: usa o pico (maxrss, em KiB no Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(values) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": round(statistics.median(ordered), 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=ROOT) != 0
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ---
+# --- Processo filho: agentes e clientes
+# ---
+
+def client_process(conn, params: dict):
+    asyncio.run(run_clients(conn, params))
+
+
+async def run_clients(conn, params: dict):
+    import websockets
+
+    url, rng = params["url"], random.Random(params["seed"])
+    loop = asyncio.get_running_loop()
+    stats = {"g2a_ms": [], "a2g_ms": [], "queue_wait_ms": [], "sent": 0, "to_agent": 0,
+             "to_guest": 0, "churned": 0, "errors": 0}
+
+    async def agent_loop(ws):
+        try:
+            async for raw in ws:
+                data = json.loads(raw)
+                if data.get("type") != "client_message":
+                    continue
+                now = time.perf_counter()
+                stats["to_agent"] += 1
+                stats["g2a_ms"].append((now - float(data["message"])) * 1000)
+                guest_id = data.get("guest_id")
+                await ws.send(json.dumps({"type": "agent_typing", "typing": True, "guest_id": guest_id}))
+                await ws.send(json.dumps({"type": "agent_message", "message": repr(time.perf_counter()),
+                                          "guest_id": guest_id}))
+        except websockets.ConnectionClosed:
+            pass
+
+    agents = []
+    for _ in range(params["agents"]):
+        ws = await websockets.connect(url, max_queue=None)
+        await ws.send(json.dumps({"type": "agent_auth", "token": params["token"], "capacity": params["capacity"]}))
+        agents.append(ws)
+    agent_tasks = [asyncio.create_task(agent_loop(ws)) for ws in agents]
+
+    async def join(index: int):
+        ws = await websockets.connect(url, max_queue=None)
+        joined_at = time.perf_counter()
+        await ws.send(json.dumps({"type": "user_join", "userData": {
+            "name": f"Carga {index}", "email": f"carga{index}@example.com", "phone": "0"}}))
+        return ws, joined_at
+
+    async def session(ws, joined_at: float, churn: bool):
+        connected = asyncio.Event()
+        replies = 0
+
+        async def reader():
+            nonlocal replies
+            try:
+                async for raw in ws:
+                    data = json.loads(raw)
+                    kind = data.get("type")
+                    if kind == "transfer_status" and data.get("status") == "connected":
+                        stats["queue_wait_ms"].append((time.perf_counter() - joined_at) * 1000)
+                        connected.set()
+                    elif kind == "agent_message":
+                        stats["to_guest"] += 1
+                        stats["a2g_ms"].append((time.perf_counter() - float(data["message"])) * 1000)
+                        replies += 1
+            except websockets.ConnectionClosed:
+                pass
+
+        task = asyncio.create_task(reader())
+        try:
+            await asyncio.wait_for(connected.wait(), params["timeout"])
+            count = rng.randint(1, params["messages"] - 1) if churn and params["messages"] > 1 else params["messages"]
+            for _ in range(count):
+                await ws.send(json.dumps({"type": "user_message", "message": repr(time.perf_counter())}))
+                stats["sent"] += 1
+                await asyncio.sleep(params["interval"])
+            if not churn:
+                deadline = time.perf_counter() + params["timeout"]
+                while replies < count and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.05)
+        except (asyncio.TimeoutError, websockets.ConnectionClosed):
+            stats["errors"] += 1
+        finally:
+            await ws.close()
+            task.cancel()
+
+    async def guest(index: int, ws, joined_at: float):
+        churn = rng.random() < params["churn"]
+        await session(ws, joined_at, churn)
+        if churn:
+            # Caiu no meio do atendimento: volta e faz a sessão completa
+            stats["churned"] += 1
+            ws, joined_at = await join(index)
+            await session(ws, joined_at, False)
+
+    guests = [await join(i) for i in range(params["guests"])]
+    await asyncio.sleep(0.5)
+    conn.send("peak")  # Todas as conexões abertas: o servidor mede a memória
+    await loop.run_in_executor(None, conn.recv)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(guest(i, ws, joined_at) for i, (ws, joined_at) in enumerate(guests)))
+    elapsed = time.perf_counter() - start
+
+    for ws in agents:
+        await ws.close()
+    for task in agent_tasks:
+        task.cancel()
+    stats["elapsed_s"] = elapsed
+    conn.send(stats)
+
+
+# ---
+# --- Processo principal: servidor e medição
+# ---
+
+async def run_benchmark(args) -> dict:
+    import uvicorn
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import main_api
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main_api.app, host="127.0.0.1", port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_bytes()
+    traced_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+    params = {
+        "url": f"ws://127.0.0.1:{port}/ws/chat",
+        "token": main_api.create_access_token({"sub": AGENT_EMAIL}),
+        "agents": args.agents, "guests": args.guests, "capacity": args.capacity,
+        "messages": args.messages, "interval": args.interval, "churn": args.churn,
+        "timeout": args.timeout, "seed": args.seed,
+    }
+    parent, child = multiprocessing.get_context("spawn").Pipe()
+    proc = multiprocessing.get_context("spawn").Process(target=client_process, args=(child, params), daemon=True)
+    proc.start()
+    loop = asyncio.get_running_loop()
+    try:
+        assert await loop.run_in_executor(None, parent.recv) == "peak"
+        connections = args.agents + args.guests
+        memory = {
+            "connections": connections,
+            "rss_delta_bytes": rss_bytes() - rss_before,
+        }
+        memory["rss_per_connection_bytes"] = memory["rss_delta_bytes"] // connections
+        if args.tracemalloc:
+            traced = tracemalloc.get_traced_memory()[0] - traced_before
+            memory["traced_delta_bytes"] = traced
+            memory["traced_per_connection_bytes"] = traced // connections
+        parent.send("go")
+        stats = await loop.run_in_executor(None, parent.recv)
+    finally:
+        proc.join(timeout=10)
+        server.should_exit = True
+        await serve_task
+
+    delivered = stats["to_agent"] + stats["to_guest"]
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {k: v for k, v in params.items() if k not in ("url", "token")},
+        "results": {
+            "elapsed_s": round(stats["elapsed_s"], 3),
+            "throughput_msgs_per_s": round(delivered / stats["elapsed_s"], 1),
+            "messages": {"sent": stats["sent"], "to_agent": stats["to_agent"], "to_guest": stats["to_guest"]},
+            "guest_to_agent_ms": summarize(stats["g2a_ms"]),
+            "agent_to_guest_ms": summarize(stats["a2g_ms"]),
+            "queue_wait_ms": summarize(stats["queue_wait_ms"]),
+            "churned": stats["churned"],
+            "errors": stats["errors"],
+            "memory": memory,
+        },
+    }
+
+
+COMPARED = [
+    ("throughput_msgs_per_s", ("throughput_msgs_per_s",)),
+    ("g->a p50 ms", ("guest_to_agent_ms", "p50")),
+    ("g->a p99 ms", ("guest_to_agent_ms", "p99")),
+    ("a->g p50 ms", ("agent_to_guest_ms", "p50")),
+    ("a->g p99 ms", ("agent_to_guest_ms", "p99")),
+    ("fila p50 ms", ("queue_wait_ms", "p50")),
+    ("fila p99 ms", ("queue_wait_ms", "p99")),
+    ("RSS/conexão", ("memory", "rss_per_connection_bytes")),
+]
+
+
+def lookup(results: dict, path):
+    for key in path:
+        results = (results or {}).get(key)
+    return results
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"commit {report['commit']}  {report['params']}")
+    header = f"{'métrica':<24}{'atual':>14}"
+    if baseline:
+        header += f"{'base (' + baseline['commit'] + ')':>22}{'Δ%':>9}"
+    print(header)
+    for label, path in COMPARED:
+        value = lookup(report["results"], path)
+        line = f"{label:<24}{value if value is not None else '-':>14}"
+        if baseline:
+            base = lookup(baseline["results"], path)
+            delta = f"{(value - base) / base * 100:+.1f}" if value is not None and base else "-"
+            line += f"{base if base is not None else '-':>22}{delta:>9}"
+        print(line)
+    results = report["results"]
+    print(f"mensagens {results['messages']}  churn {results['churned']}  erros {results['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--guests", type=int, default=100)
+    parser.add_argument("--capacity", type=int, default=3, help="chats simultâneos por agente")
+    parser.add_argument("--messages", type=int, default=20, help="mensagens por cliente")
+    parser.add_argument("--interval", type=float, default=0.5,
+                        help="segundos entre mensagens de um cliente (respeite os limites de chat_limits)")
+    parser.add_argument("--churn", type=float, default=0.1, help="fração de clientes que cai e volta")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="mede o heap Python (deixa o servidor mais lento)")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    parser.add_argument("--compare", help="JSON de uma rodada anterior para comparar")
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = asyncio.run(run_benchmark(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_chat-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"resultado salvo em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,710 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+from pydantic import BaseModel
+
+from chat_frames import dumps, encode_frame
+from chat_index import DEFAULT_PAGE_SIZE, conversation_keys
+from chat_queue import WaitingGuest, WaitingQueue
+from chat_search import DEFAULT_SEARCH_LIMIT, SearchIndex
+from chat_store import RETENTION_MAX_AGE, RETENTION_MAX_CLOSED, WriteBehindStore
+
+logger = logging.getLogger("chat.backend")
+
+# --- Configuração do backend de estado ---
+# "memory" (padrão): tudo no processo, um único worker.
+# "redis": fila, sessões e conversas no Redis + relay entre workers via pub/sub.
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("CHAT_REDIS_PREFIX", "chat")
+PRIORITY_STRIDE = 2 ** 40  # Separa as faixas de prioridade no score da fila
+REDIS_RETENTION_INTERVAL = float(os.getenv("CHAT_REDIS_RETENTION_INTERVAL", "30"))  # Segundos entre varreduras das fechadas
+REDIS_ARCHIVE_BATCH = 200  # Conversas fechadas arquivadas por varredura
+REDIS_RECONNECT_MIN = 0.5  # Segundos até a primeira tentativa de reassinar o pub/sub depois de uma queda
+REDIS_RECONNECT_MAX = 30.0  # Teto do backoff (dobra a cada falha seguida)
+# Campos que acompanham as mensagens: uma cópia atrasada não os sobrescreve (ver RedisBackend.save_conversation)
+MESSAGE_DERIVED_FIELDS = ("lastMessage", "time", "unread")
+
+RelayHandler = Callable[[dict], Awaitable[None]]
+
+
+class RemotePeer:
+    """Ponta de uma sessão que está conectada em outro worker.
+
+    Imita a parte da interface de `WebSocket` que o `ConnectionManager` usa
+    (`send_json`, `send_text`, `close`), publicando cada operação no canal do
+    worker dono do socket de verdade.
+    """
+
+    __slots__ = ("backend", "worker_id", "kind", "peer_id")
+
+    def __init__(self, backend: "RedisBackend", worker_id: str, kind: str, peer_id: str):
+        self.backend = backend
+        self.worker_id = worker_id
+        self.kind = kind  # "guest" ou "agent"
+        self.peer_id = peer_id
+
+    def send_frame(self, frame: str):
+        self.backend.relay(self.worker_id, {"op": "deliver", "kind": self.kind, "id": self.peer_id, "frame": frame})
+
+    async def send_text(self, frame: str):
+        self.send_frame(frame)
+
+    async def send_json(self, message: dict):
+        self.send_frame(encode_frame(message))
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        self.backend.relay(self.worker_id, {"op": "close", "kind": self.kind, "id": self.peer_id, "code": code})
+
+    def __repr__(self) -> str:
+        return f"RemotePeer({self.kind}:{self.peer_id}@{self.worker_id})"
+
+
+class InMemoryBackend:
+    """Backend padrão: estado no próprio processo (um worker só, sem relay).
+
+    As conversas ficam no cache do `WriteBehindStore`, que as persiste no
+    store configurado (memória, SQLite ou MongoDB).
+    """
+
+    distributed = False
+
+    def __init__(self, conversations: WriteBehindStore, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.conversations = conversations
+        self.queue = WaitingQueue()
+        self.sessions: Dict[str, dict] = {}
+        self.agents: Dict[str, dict] = {}
+
+    async def start(self, on_relay: RelayHandler):
+        await self.conversations.start()
+
+    async def stop(self):
+        await self.conversations.stop()
+
+    # --- Fila de espera ---
+    async def enqueue_guest(self, guest_id: str, join_data: dict, priority: int = 0, websocket=None) -> int:
+        entry = self.queue.push(websocket, join_data, guest_id, priority=priority)
+        entry.worker_id = self.worker_id
+        return self.queue.position(guest_id)
+
+    async def dequeue_guest(self) -> Optional[WaitingGuest]:
+        return self.queue.pop()
+
+    async def remove_waiting_guest(self, guest_id: str) -> Optional[WaitingGuest]:
+        return self.queue.remove_guest(guest_id)
+
+    async def append_waiting_history(self, guest_id: str, history_entry: dict) -> bool:
+        entry = self.queue.get(guest_id)
+        if entry is None:
+            return False
+        history = entry.join_data.get("conversationHistory")
+        if history is None: history = []
+        history.append(history_entry)
+        entry.join_data["conversationHistory"] = history
+        return True
+
+    async def queue_position(self, guest_id: str) -> Optional[int]:
+        return self.queue.position(guest_id)
+
+    async def queue_positions_from(self, start: int) -> Dict[str, int]:
+        """Posição de cada cliente da posição `start` para trás (ver WaitingQueue.positions_from)."""
+        return self.queue.positions_from(start)
+
+    def take_queue_changes(self) -> Optional[int]:
+        """Primeira posição da fila afetada desde a última chamada, ou None."""
+        return self.queue.take_changed()
+
+    async def queue_length(self) -> int:
+        return len(self.queue)
+
+    async def attach_waiting_guest(self, guest_id: str, websocket=None) -> Optional[int]:
+        """Liga (ou solta, com None) o socket de um cliente que está na fila. Devolve a posição."""
+        if self.queue.attach(guest_id, websocket) is None:
+            return None
+        return self.queue.position(guest_id)
+
+    def export_queue(self) -> List[dict]:
+        """Fila na ordem de atendimento, para o snapshot de warm restart."""
+        now = time.monotonic()
+        return [{"guest_id": entry.guest_id, "join_data": entry.join_data, "priority": entry.priority,
+                 "waited": now - entry.enqueued_at} for entry in self.queue]
+
+    def restore_queue(self, entries: List[dict]):
+        """Recoloca na fila, na mesma ordem e sem socket, os clientes de um snapshot."""
+        now = time.monotonic()
+        for item in entries:
+            entry = self.queue.push(None, item["join_data"], item["guest_id"], priority=item.get("priority", 0))
+            entry.enqueued_at = now - item.get("waited", 0.0)
+            entry.worker_id = self.worker_id
+
+    # --- Sessões e agentes ---
+    async def set_session(self, guest_id: str, session: dict):
+        self.sessions[guest_id] = session
+
+    async def clear_session(self, guest_id: str):
+        self.sessions.pop(guest_id, None)
+
+    async def register_agent(self, agent_id: str, info: dict):
+        self.agents[agent_id] = info
+
+    async def unregister_agent(self, agent_id: str):
+        self.agents.pop(agent_id, None)
+
+    # --- Conversas ---
+    async def save_conversation(self, conv: BaseModel):
+        self.conversations.save(conv)
+
+    async def replace_messages(self, conv: BaseModel):
+        # Em memória a conversa é o próprio objeto: não há lista separada para encurtar
+        self.conversations.save(conv)
+
+    async def get_conversation(self, conv_id: str) -> Optional[BaseModel]:
+        return await self.conversations.get(conv_id)
+
+    async def list_conversations(self, include_archived: bool = False) -> List[BaseModel]:
+        return await self.conversations.list(include_archived)
+
+    async def query_conversations(self, filters: Optional[Dict[str, str]] = None, since: Optional[int] = None,
+                                  cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                                  epoch: Optional[str] = None) -> Tuple[List[BaseModel], Optional[int], int, str]:
+        """Página de conversas, cursor da próxima, versão atual e epoch (ver ConversationIndex).
+
+        `since` de outro `epoch` não se compara com as versões daqui: vira
+        `since=0` (todas as conversas, em modo delta).
+        """
+        index = self.conversations.index
+        if since is not None and epoch is not None and epoch != index.epoch:
+            since = 0
+        items, next_cursor = self.conversations.query(filters, since, cursor, limit)
+        return items, next_cursor, index.version, index.epoch
+
+    async def search_conversations(self, query: str, offset: int = 0,
+                                   limit: int = DEFAULT_SEARCH_LIMIT) -> Tuple[List[BaseModel], int]:
+        """Busca textual (ver SearchIndex): página de conversas por relevância e o total."""
+        return await self.conversations.search(query, offset, limit)
+
+    # --- Relay entre workers (não existe com um único processo) ---
+    def relay(self, worker_id: str, op: dict):
+        raise RuntimeError(f"Worker remoto {worker_id} não existe no backend em memória.")
+
+    def broadcast(self, frame: str, key: Optional[Any] = None):
+        pass
+
+    def announce_waiting(self):
+        pass
+
+
+class RedisBackend:
+    """Estado compartilhado no Redis para rodar vários workers/servidores.
+
+    - Fila: sorted set `{prefix}:queue` (score = prioridade + ordem de chegada) e
+      hash `{prefix}:queue:data` com o `join_data` e o worker dono do cliente;
+    - Sessões, agentes online e conversas: hashes `{prefix}:sessions`,
+      `{prefix}:agents` e `{prefix}:conversations`. Se houver um `store`, as
+      conversas também são persistidas por ele (write-behind);
+    - Conversas: o hash `{prefix}:conversations` guarda cada conversa sem as
+      mensagens, que ficam numa lista `{prefix}:conversations:messages:{id}`:
+      uma mensagem nova é um RPUSH, não a regravação do JSON inteiro;
+    - Retenção: as fechadas entram no sorted set `{prefix}:conversations:closed`
+      (score = quando fecharam) e, passado RETENTION_MAX_AGE ou além de
+      RETENTION_MAX_CLOSED, são gravadas no store e apagadas do Redis
+      (`get_conversation` passa a lê-las do store);
+    - Listagem: contador `{prefix}:conversations:version` (com o epoch em
+      `{prefix}:conversations:epoch`, recriado se o Redis perder os dados), sorted set
+      `{prefix}:conversations:versions` (id -> versão) e um set por valor
+      filtrável em `{prefix}:conversations:idx:{campo}:{valor}`;
+    - Relay: cada worker escuta `{prefix}:worker:{id}` e `{prefix}:broadcast`.
+      As publicações saem por uma fila interna drenada por uma task, então o
+      caminho quente nunca espera pelo Redis para repassar uma mensagem.
+    """
+
+    distributed = True
+
+    def __init__(self, conversation_model: Type[BaseModel], url: str = REDIS_URL,
+                 prefix: str = REDIS_PREFIX, client: Optional[aioredis.Redis] = None,
+                 worker_id: Optional[str] = None, store: Optional[WriteBehindStore] = None):
+        self.conversation_model = conversation_model
+        self.store = store
+        self.client = client or aioredis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.k_queue = f"{prefix}:queue"
+        self.k_queue_data = f"{prefix}:queue:data"
+        self.k_queue_seq = f"{prefix}:queue:seq"
+        self.k_sessions = f"{prefix}:sessions"
+        self.k_agents = f"{prefix}:agents"
+        self.k_conversations = f"{prefix}:conversations"
+        self.k_conv_version = f"{prefix}:conversations:version"
+        self.k_conv_epoch = f"{prefix}:conversations:epoch"
+        self.k_conv_versions = f"{prefix}:conversations:versions"
+        self.k_conv_keys = f"{prefix}:conversations:keys"
+        self.k_conv_closed = f"{prefix}:conversations:closed"
+        self.k_broadcast = f"{prefix}:broadcast"
+        self._outgoing: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pubsub = None
+        self._queue_changed_from: Optional[int] = None
+
+    def worker_channel(self, worker_id: str) -> str:
+        return f"{self.prefix}:worker:{worker_id}"
+
+    async def start(self, on_relay: RelayHandler):
+        if self.store is not None:
+            await self.store.start()
+        self._outgoing = asyncio.Queue()
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.worker_channel(self.worker_id), self.k_broadcast)
+        self._tasks = [
+            asyncio.create_task(self._listener(on_relay)),
+            asyncio.create_task(self._publisher()),
+        ]
+        if self.store is not None:  # Sem store não há para onde arquivar: as fechadas ficam no Redis
+            self._tasks.append(asyncio.create_task(self._retention()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self.store is not None:
+            await self.store.stop()
+
+    async def _listener(self, on_relay: RelayHandler):
+        """Entrega os relays deste worker; se a conexão do pub/sub cai, reassina com backoff.
+
+        O que foi publicado durante a queda se perdeu: ao voltar, a fila é
+        dada como alterada (`queue_changed`) para as posições serem revistas.
+        """
+        delay = REDIS_RECONNECT_MIN
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    await self._pubsub.subscribe(self.worker_channel(self.worker_id), self.k_broadcast)
+                    logger.info("Pub/sub do Redis reassinado", extra={"event": "relay_resubscribed"})
+                    await on_relay({"op": "queue_changed"})
+                async for message in self._pubsub.listen():
+                    delay = REDIS_RECONNECT_MIN
+                    try:
+                        op = json.loads(message["data"])
+                        if op.get("origin") == self.worker_id:
+                            continue  # Broadcast que este próprio worker publicou
+                        await on_relay(op)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.warning("Erro ao processar relay do Redis: %s", e, extra={"event": "relay_error"})
+                raise ConnectionError("pub/sub encerrado")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Pub/sub do Redis caiu (%s); reassinando em %.1fs", e, delay,
+                             extra={"event": "relay_disconnected", "retry_in": delay})
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REDIS_RECONNECT_MAX)
+
+    async def _publisher(self):
+        while True:
+            channel, payload = await self._outgoing.get()
+            try:
+                await self.client.publish(channel, payload)
+            except Exception as e:
+                logger.warning("Erro ao publicar no Redis (%s): %s", channel, e, extra={"event": "publish_error"})
+
+    def _publish(self, channel: str, op: dict):
+        op["origin"] = self.worker_id
+        self._outgoing.put_nowait((channel, dumps(op)))
+
+    # --- Fila de espera ---
+    async def enqueue_guest(self, guest_id: str, join_data: dict, priority: int = 0, websocket=None) -> int:
+        seq = await self.client.incr(self.k_queue_seq)
+        score = -priority * PRIORITY_STRIDE + seq
+        data = dumps({"join_data": join_data, "worker_id": self.worker_id, "priority": priority,
+                      "enqueued_ts": time.time()})
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.k_queue_data, guest_id, data)
+            pipe.zadd(self.k_queue, {guest_id: score})
+            pipe.zrank(self.k_queue, guest_id)
+            pipe.zcard(self.k_queue)
+            *_, rank, length = await pipe.execute()
+        if rank + 1 < length:
+            self._mark_queue_changed(rank + 2)  # Passou na frente de quem já esperava
+        return rank + 1
+
+    async def dequeue_guest(self) -> Optional[WaitingGuest]:
+        # ZPOPMIN é atômico: só um worker recebe cada cliente
+        popped = await self.client.zpopmin(self.k_queue)
+        if not popped:
+            return None
+        guest_id = popped[0][0]
+        self._mark_queue_changed(1)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hget(self.k_queue_data, guest_id)
+            pipe.hdel(self.k_queue_data, guest_id)
+            raw, _ = await pipe.execute()
+        return self._waiting_entry(guest_id, raw)
+
+    async def remove_waiting_guest(self, guest_id: str) -> Optional[WaitingGuest]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrank(self.k_queue, guest_id)
+            pipe.zrem(self.k_queue, guest_id)
+            rank, removed = await pipe.execute()
+        if not removed:
+            return None
+        self._mark_queue_changed(rank + 1)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hget(self.k_queue_data, guest_id)
+            pipe.hdel(self.k_queue_data, guest_id)
+            raw, _ = await pipe.execute()
+        return self._waiting_entry(guest_id, raw)
+
+    async def append_waiting_history(self, guest_id: str, history_entry: dict) -> bool:
+        raw = await self.client.hget(self.k_queue_data, guest_id)
+        if raw is None:
+            return False
+        data = json.loads(raw)
+        join_data = data["join_data"]
+        history = join_data.get("conversationHistory")
+        if history is None: history = []
+        history.append(history_entry)
+        join_data["conversationHistory"] = history
+        # Só regrava se o cliente ainda estiver na fila (não foi retirado nesse meio tempo)
+        if await self.client.zscore(self.k_queue, guest_id) is None:
+            return False
+        await self.client.hset(self.k_queue_data, guest_id, dumps(data))
+        return True
+
+    async def queue_position(self, guest_id: str) -> Optional[int]:
+        rank = await self.client.zrank(self.k_queue, guest_id)
+        return None if rank is None else rank + 1
+
+    async def queue_positions_from(self, start: int) -> Dict[str, int]:
+        guest_ids = await self.client.zrange(self.k_queue, start - 1, -1)
+        return {guest_id: start + i for i, guest_id in enumerate(guest_ids)}
+
+    def take_queue_changes(self) -> Optional[int]:
+        """Primeira posição afetada pelas operações deste worker na fila; as dos outros chegam pelo relay."""
+        changed, self._queue_changed_from = self._queue_changed_from, None
+        return changed
+
+    def _mark_queue_changed(self, position: int):
+        if self._queue_changed_from is None or position < self._queue_changed_from:
+            self._queue_changed_from = position
+
+    async def queue_length(self) -> int:
+        return await self.client.zcard(self.k_queue)
+
+    async def attach_waiting_guest(self, guest_id: str, websocket=None) -> Optional[int]:
+        # O socket fica só no worker; no Redis basta saber se o cliente continua na fila
+        return await self.queue_position(guest_id)
+
+    def _waiting_entry(self, guest_id: str, raw: Optional[str]) -> WaitingGuest:
+        data = json.loads(raw) if raw else {}
+        # Relógio de parede gravado por quem enfileirou -> monotônico deste processo
+        waited = max(0.0, time.time() - data.get("enqueued_ts", time.time()))
+        return WaitingGuest(
+            websocket=None,
+            join_data=data.get("join_data") or {},
+            guest_id=guest_id,
+            enqueued_at=time.monotonic() - waited,
+            priority=data.get("priority", 0),
+            worker_id=data.get("worker_id"),
+        )
+
+    # --- Sessões e agentes ---
+    async def set_session(self, guest_id: str, session: dict):
+        await self.client.hset(self.k_sessions, guest_id, dumps(session))
+
+    async def clear_session(self, guest_id: str):
+        await self.client.hdel(self.k_sessions, guest_id)
+
+    async def register_agent(self, agent_id: str, info: dict):
+        await self.client.hset(self.k_agents, agent_id, dumps({**info, "worker_id": self.worker_id}))
+
+    async def unregister_agent(self, agent_id: str):
+        await self.client.hdel(self.k_agents, agent_id)
+
+    # --- Conversas ---
+    def conversation_index_key(self, name: str, value: str) -> str:
+        return f"{self.prefix}:conversations:idx:{name}:{value}"
+
+    def messages_key(self, conv_id: str) -> str:
+        return f"{self.prefix}:conversations:messages:{conv_id}"
+
+    async def save_conversation(self, conv: BaseModel):
+        """Grava os campos e acrescenta as mensagens novas; a lista nunca encolhe aqui.
+
+        A cópia em mãos pode estar atrasada: outro worker pode ter acrescentado
+        mensagens depois que ela foi lida. Sob WATCH da lista, vão para o Redis
+        só as mensagens que esta cópia acrescentou (a partir de
+        `messages.persisted`, o tamanho da lista quando ela foi carregada; sem
+        essa informação, as que passam do tamanho gravado). Se a cópia ficou
+        para trás e não traz mensagens próprias, os MESSAGE_DERIVED_FIELDS
+        gravados são mantidos; status, agente e tags vêm da cópia (a intenção
+        de quem salva). Para encurtar a lista de propósito: `replace_messages`.
+        """
+        keys = [f"{name}:{value}" for name, value in conversation_keys(conv)]
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hget(self.k_conv_keys, conv.id)
+            pipe.incr(self.k_conv_version)
+            old_raw, version = await pipe.execute()
+        old = json.loads(old_raw) if old_raw else []
+        messages = conv.messages
+        messages_key = self.messages_key(conv.id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(messages_key)
+                    stored = await pipe.llen(messages_key)
+                    start = min(stored if messages.persisted is None else messages.persisted, len(messages))
+                    head = conv.model_dump_json(exclude={"messages"})
+                    if stored > start == len(messages):
+                        head = self._keep_message_fields(head, await pipe.hget(self.k_conversations, conv.id))
+                    pipe.multi()
+                    pipe.hset(self.k_conversations, conv.id, head)
+                    if start < len(messages):
+                        pipe.rpush(messages_key, *(dumps(message) for message in messages[start:]))
+                    self._queue_conversation_keys(pipe, conv, version, old, keys)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue  # Outro worker mexeu na lista entre a leitura e a gravação: relê
+        messages.persisted = len(messages)
+        if self.store is not None:
+            self.store.save(conv)
+
+    async def replace_messages(self, conv: BaseModel):
+        """Regrava a lista de mensagens inteira a partir da cópia (pode encurtá-la).
+
+        Operação explícita, para quem quer mesmo descartar mensagens: o
+        `save_conversation` só acrescenta.
+        """
+        keys = [f"{name}:{value}" for name, value in conversation_keys(conv)]
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hget(self.k_conv_keys, conv.id)
+            pipe.incr(self.k_conv_version)
+            old_raw, version = await pipe.execute()
+        messages = conv.messages
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.k_conversations, conv.id, conv.model_dump_json(exclude={"messages"}))
+            pipe.delete(self.messages_key(conv.id))
+            if messages:
+                pipe.rpush(self.messages_key(conv.id), *(dumps(message) for message in messages))
+            self._queue_conversation_keys(pipe, conv, version, json.loads(old_raw) if old_raw else [], keys)
+            await pipe.execute()
+        messages.persisted = len(messages)
+        if self.store is not None:
+            self.store.save(conv)
+
+    def _queue_conversation_keys(self, pipe, conv: BaseModel, version: int, old: List[str], keys: List[str]):
+        """Versão, retenção e índices de filtro da conversa, na transação de quem grava."""
+        pipe.zadd(self.k_conv_versions, {conv.id: version})
+        if conv.status == "closed":
+            pipe.zadd(self.k_conv_closed, {conv.id: time.time()}, nx=True)
+        else:
+            pipe.zrem(self.k_conv_closed, conv.id)
+        if old != keys:
+            for key in set(old) - set(keys):
+                pipe.srem(self.conversation_index_key(*key.split(":", 1)), conv.id)
+            for key in set(keys) - set(old):
+                pipe.sadd(self.conversation_index_key(*key.split(":", 1)), conv.id)
+            pipe.hset(self.k_conv_keys, conv.id, json.dumps(keys))
+
+    @staticmethod
+    def _keep_message_fields(head: str, current: Optional[str]) -> str:
+        if not current:
+            return head
+        fields, stored = json.loads(head), json.loads(current)
+        for name in MESSAGE_DERIVED_FIELDS:
+            if name in stored:
+                fields[name] = stored[name]
+        return dumps(fields)
+
+    def _conversation(self, head: str, messages: List[str]) -> BaseModel:
+        # A lista vem antes dos campos: num registro antigo (JSON completo, sem lista) vale o "messages" dele
+        conv = self.conversation_model.model_validate_json('{"messages":[%s],%s' % (",".join(messages), head[1:]))
+        conv.messages.persisted = len(messages)
+        return conv
+
+    async def _load_live(self, conv_ids: List[str]) -> List[Optional[BaseModel]]:
+        """Conversas do Redis (campos + lista de mensagens), None para as que não estão lá."""
+        if not conv_ids:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hmget(self.k_conversations, conv_ids)
+            for conv_id in conv_ids:
+                pipe.lrange(self.messages_key(conv_id), 0, -1)
+            heads, *lists = await pipe.execute()
+        return [self._conversation(head, messages) if head else None for head, messages in zip(heads, lists)]
+
+    async def get_conversation(self, conv_id: str) -> Optional[BaseModel]:
+        conv, = await self._load_live([conv_id])
+        if conv is not None:
+            return conv
+        if self.store is not None:
+            return await self.store.get(conv_id)
+        return None
+
+    async def list_conversations(self, include_archived: bool = False) -> List[BaseModel]:
+        live = [conv for conv in await self._load_live(await self.client.hkeys(self.k_conversations)) if conv]
+        if self.store is None:
+            return live
+        # Histórico persistido + estado vivo do Redis (que tem prioridade)
+        merged = {conv.id: conv for conv in await self.store.list(include_archived)}
+        merged.update((conv.id, conv) for conv in live)
+        return list(merged.values())
+
+    async def _retention(self):
+        while True:
+            await asyncio.sleep(REDIS_RETENTION_INTERVAL)
+            try:
+                await self.archive_closed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Erro ao arquivar conversas fechadas: %s", e, extra={"event": "archive_error"})
+
+    async def archive_closed(self, max_closed: int = RETENTION_MAX_CLOSED, max_age: float = RETENTION_MAX_AGE) -> int:
+        """Grava no store e apaga do Redis as fechadas além do limite de idade/quantidade.
+
+        Qualquer worker pode varrer: a conversa é lida do Redis e gravada no
+        store deste worker antes de sair do Redis. Se alguma for reaberta
+        nesse meio tempo (sai de `closed`), a remoção é abortada e a varredura
+        seguinte tenta de novo. Devolve quantas saíram do Redis.
+        """
+        overflow = await self.client.zcard(self.k_conv_closed) - max_closed
+        expired = await self.client.zrangebyscore(self.k_conv_closed, "-inf", time.time() - max_age,
+                                                  start=0, num=REDIS_ARCHIVE_BATCH)
+        if overflow > 0:
+            expired += await self.client.zrange(self.k_conv_closed, 0, min(overflow, REDIS_ARCHIVE_BATCH) - 1)
+        conv_ids = list(dict.fromkeys(expired))[:REDIS_ARCHIVE_BATCH]
+        if not conv_ids:
+            return 0
+        found = await self._load_live(conv_ids)
+        await self.store.archive([conv for conv in found if conv is not None])
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.k_conv_closed)
+                still_closed = await pipe.zmscore(self.k_conv_closed, conv_ids)
+                old_keys = await pipe.hmget(self.k_conv_keys, conv_ids)
+                pipe.multi()
+                archived = 0
+                for conv_id, score, keys_raw in zip(conv_ids, still_closed, old_keys):
+                    if score is None:
+                        continue
+                    for key in json.loads(keys_raw) if keys_raw else ():
+                        pipe.srem(self.conversation_index_key(*key.split(":", 1)), conv_id)
+                    pipe.hdel(self.k_conversations, conv_id)
+                    pipe.delete(self.messages_key(conv_id))
+                    pipe.hdel(self.k_conv_keys, conv_id)
+                    pipe.zrem(self.k_conv_versions, conv_id)
+                    pipe.zrem(self.k_conv_closed, conv_id)
+                    archived += 1
+                await pipe.execute()
+            except WatchError:
+                return 0
+        if archived:
+            logger.info("%d conversa(s) fechada(s) arquivada(s) fora do Redis", archived,
+                        extra={"event": "conversations_archived", "count": archived})
+        return archived
+
+    async def conversations_epoch(self) -> str:
+        current = await self.client.get(self.k_conv_epoch)
+        if current is None:
+            await self.client.set(self.k_conv_epoch, uuid.uuid4().hex[:12], nx=True)
+            current = await self.client.get(self.k_conv_epoch)
+        return current
+
+    async def query_conversations(self, filters: Optional[Dict[str, str]] = None, since: Optional[int] = None,
+                                  cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                                  epoch: Optional[str] = None) -> Tuple[List[BaseModel], Optional[int], int, str]:
+        """Mesma semântica de InMemoryBackend.query_conversations, com os índices no Redis."""
+        current_epoch = await self.conversations_epoch()
+        if since is not None and epoch is not None and epoch != current_epoch:
+            since = 0
+        filters = {name: value for name, value in (filters or {}).items() if value is not None}
+        if filters:
+            ids = await self.client.sinter([self.conversation_index_key(n, v) for n, v in filters.items()])
+            ids = list(ids)
+            scores = await self.client.zmscore(self.k_conv_versions, ids) if ids else []
+            entries = [(int(score), conv_id) for conv_id, score in zip(ids, scores) if score is not None]
+            if since is not None:
+                entries = sorted(e for e in entries if e[0] > since)[:limit + 1]
+            else:
+                entries = sorted((e for e in entries if cursor is None or e[0] < cursor), reverse=True)[:limit + 1]
+        elif since is not None:
+            found = await self.client.zrangebyscore(self.k_conv_versions, f"({since}", "+inf",
+                                                    start=0, num=limit + 1, withscores=True)
+            entries = [(int(score), conv_id) for conv_id, score in found]
+        else:
+            top = f"({cursor}" if cursor is not None else "+inf"
+            found = await self.client.zrevrangebyscore(self.k_conv_versions, top, "-inf",
+                                                       start=0, num=limit + 1, withscores=True)
+            entries = [(int(score), conv_id) for conv_id, score in found]
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = entries[-1][0]
+        items = [conv for conv in await self._load_live([conv_id for _, conv_id in entries]) if conv is not None]
+        version = int(await self.client.get(self.k_conv_version) or 0)
+        return items, next_cursor, version, current_epoch
+
+    async def search_conversations(self, query: str, offset: int = 0,
+                                   limit: int = DEFAULT_SEARCH_LIMIT) -> Tuple[List[BaseModel], int]:
+        """Busca textual pelo índice do store local.
+
+        Cada worker indexa o que ele mesmo grava mais o que já estava
+        persistido quando subiu; conversas atualizadas por outro worker
+        depois disso podem ficar de fora até este worker gravá-las. Sem
+        store, indexa na hora as conversas vivas do Redis.
+        """
+        if self.store is not None:
+            found, total = await self.store.search(query, offset, limit)
+            if not found:
+                return found, total
+            # O estado vivo do Redis tem prioridade sobre a cópia do store
+            live = await self._load_live([conv.id for conv in found])
+            return [fresh or conv for conv, fresh in zip(found, live)], total
+        index = SearchIndex()
+        live = {}
+        for conv in await self.list_conversations():
+            live[conv.id] = conv
+            index.update(conv)
+        conv_ids, total = index.search(query, offset, limit)
+        return [live[conv_id] for conv_id in conv_ids], total
+
+    # --- Relay entre workers ---
+    def relay(self, worker_id: str, op: dict):
+        self._publish(self.worker_channel(worker_id), op)
+
+    def broadcast(self, frame: str, key: Optional[Any] = None):
+        self._publish(self.k_broadcast, {"op": "broadcast", "frame": frame, "key": key})
+
+    def announce_waiting(self):
+        """Avisa os outros workers que há cliente na fila (agentes livres vão buscá-lo)."""
+        self._publish(self.k_broadcast, {"op": "queue_changed"})
+
+
+def create_backend(conversations: WriteBehindStore, conversation_model: Type[BaseModel]):
+    """Instancia o backend configurado em CHAT_BACKEND."""
+    if CHAT_BACKEND == "redis":
+        logger.info("Usando backend Redis em %s", REDIS_URL)
+        return RedisBackend(conversation_model, store=conversations)
+    return InMemoryBackend(conversations)
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("chat.eta")
+
+# --- Estimativa de espera na fila ---
+DEFAULT_HANDLING_SECONDS = 300.0  # Duração de um atendimento enquanto ainda não há histórico
+HANDLING_EWMA_ALPHA = 0.2  # Peso do atendimento mais recente na média móvel
+HANDLING_MIN_SAMPLES = 3  # Atendimentos para confiar na média de um agente/departamento
+HANDLING_MAX_SECONDS = 4 * 3600.0  # Sessões mais longas que isso (esquecidas abertas) não entram na média
+QUEUE_UPDATE_INTERVAL = 2.0  # Segundos mínimos entre duas rodadas de atualização da fila
+
+StatsKey = Tuple[str, Optional[str]]  # ("agent", email), ("department", nome) ou ("all", None)
+
+
+class _Rolling:
+    __slots__ = ("mean", "count")
+
+    def __init__(self, mean: float = 0.0, count: int = 0):
+        self.mean = mean
+        self.count = count
+
+    def observe(self, value: float, alpha: float):
+        self.count += 1
+        # Média simples até ter amostras suficientes, depois EWMA (acompanha mudanças de ritmo)
+        weight = max(alpha, 1.0 / self.count)
+        self.mean += weight * (value - self.mean)
+
+
+class HandlingStats:
+    """Duração dos atendimentos (média móvel) por agente, por departamento e geral.
+
+    `mean` usa a média do agente se ele já tem HANDLING_MIN_SAMPLES
+    atendimentos; senão a do departamento, depois a geral (misturada com
+    DEFAULT_HANDLING_SECONDS enquanto houver poucas amostras).
+    """
+
+    def __init__(self, alpha: float = HANDLING_EWMA_ALPHA, default: float = DEFAULT_HANDLING_SECONDS):
+        self.alpha = alpha
+        self.default = default
+        self._stats: Dict[StatsKey, _Rolling] = {}
+
+    def observe(self, seconds: float, agent: Optional[str] = None, department: Optional[str] = None):
+        if seconds < 0 or seconds > HANDLING_MAX_SECONDS:
+            return
+        keys: List[StatsKey] = [("all", None)]
+        if agent:
+            keys.append(("agent", agent))
+        if department:
+            keys.append(("department", department))
+        for key in keys:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _Rolling()
+            stats.observe(seconds, self.alpha)
+
+    def mean(self, agent: Optional[str] = None, department: Optional[str] = None) -> float:
+        for key in (("agent", agent), ("department", department)):
+            stats = self._stats.get(key) if key[1] else None
+            if stats is not None and stats.count >= HANDLING_MIN_SAMPLES:
+                return stats.mean
+        overall = self._stats.get(("all", None))
+        if overall is None:
+            return self.default
+        if overall.count < HANDLING_MIN_SAMPLES:
+            # Poucas amostras: mistura com o padrão para um atendimento atípico não dominar a estimativa
+            return (overall.mean * overall.count + self.default * (HANDLING_MIN_SAMPLES - overall.count)) / HANDLING_MIN_SAMPLES
+        return overall.mean
+
+    def dump(self) -> List[list]:
+        """Médias atuais, para o snapshot de warm restart."""
+        return [[kind, name, stats.mean, stats.count] for (kind, name), stats in self._stats.items()]
+
+    def restore(self, state: Optional[List[list]]):
+        for kind, name, mean, count in state or ():
+            self._stats[(kind, name)] = _Rolling(mean, count)
+
+
+def estimate_wait_seconds(position: int, throughput: float) -> float:
+    """Espera estimada de quem está em `position`, dado o ritmo de atendimento (atendimentos/s)."""
+    return position / throughput
+
+
+def wait_minutes(seconds: float) -> int:
+    """Minutos para mostrar ao cliente (arredondado para cima, mínimo 1)."""
+    return max(1, math.ceil(seconds / 60))
+
+
+class QueueNotifier:
+    """Mantém a posição e a espera estimada dos clientes na fila atualizadas.
+
+    Guarda o último (posição, minutos) enviado a cada cliente. Quando a fila
+    anda (`changed()`), a rodada pergunta à própria fila a primeira posição
+    afetada (`queue_changes`) e lê só as posições dali para trás
+    (`positions_from`): quem está na frente nem é visitado. Mudanças que a
+    fila local não vê (ritmo de atendimento, agentes entrando/saindo, fila
+    andando em outro worker) chamam `changed(1)`, o que revisa todos.
+    Só recebe atualização quem teve a posição ou os minutos alterados, e as
+    rodadas acontecem no máximo uma vez a cada `interval` segundos: várias
+    mudanças seguidas viram uma rodada só.
+    """
+
+    def __init__(self,
+                 positions_from: Callable[[int], Awaitable[Dict[str, int]]],
+                 queue_changes: Callable[[], Optional[int]],
+                 throughput: Callable[[], float],
+                 send: Callable[[str, int, float], Awaitable[Any]],
+                 interval: float = QUEUE_UPDATE_INTERVAL):
+        self.positions_from = positions_from
+        self.queue_changes = queue_changes
+        self.throughput = throughput
+        self.send = send
+        self.interval = interval
+        self.sent: Dict[str, Tuple[int, int]] = {}  # guest_id -> (posição, minutos) informados
+        self._from = math.inf  # Menor posição que mudou sem a fila saber (ex.: ritmo de atendimento)
+        self._pending = False  # Houve `changed` desde o começo da última rodada
+        self._last = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, guest_id: str, position: int, minutes: int):
+        """Registra o que acabou de ser informado ao cliente (ex.: no `transfer_status`)."""
+        self.sent[guest_id] = (position, minutes)
+
+    def changed(self, from_position: Optional[int] = None):
+        """Agenda uma rodada. Sem posição, a fila informa o que mudou; `changed(1)` revisa todos."""
+        if not self.sent:
+            return
+        self._pending = True
+        if from_position is not None:
+            self._from = min(self._from, from_position)
+        if self._handle is None and self._task is None:
+            delay = max(0.0, self._last + self.interval - time.monotonic())
+            self._handle = asyncio.get_running_loop().call_later(delay, self._start)
+
+    def _start(self):
+        self._handle = None
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Erro ao atualizar a fila: %s", e, extra={"event": "queue_update_error"})
+        finally:
+            self._task = None
+            self._last = time.monotonic()
+            if self._pending:
+                self.changed()  # Mudanças durante a rodada: agenda a próxima
+
+    async def flush(self) -> int:
+        """Uma rodada: recalcula os afetados e envia só a quem mudou. Devolve quantos receberam."""
+        self._pending = False
+        start, self._from = min(self._from, self.queue_changes() or math.inf), math.inf
+        if start == math.inf or not self.sent:
+            return 0
+        positions = await self.positions_from(start)
+        if start == 1:
+            # A fila inteira foi lida: quem não está nela saiu (atendido ou desconectado)
+            for guest_id in self.sent.keys() - positions.keys():
+                del self.sent[guest_id]
+        throughput = self.throughput()
+        candidates = [guest_id for guest_id in positions if guest_id in self.sent]  # Só os clientes deste worker
+        updated = 0
+        for guest_id in candidates:
+            position = positions[guest_id]
+            seconds = estimate_wait_seconds(position, throughput)
+            current = (position, wait_minutes(seconds))
+            if self.sent.get(guest_id) != current:
+                self.sent[guest_id] = current
+                await self.send(guest_id, position, seconds)
+                updated += 1
+        logger.debug("Fila: %d de %d cliente(s) atualizados", updated, len(candidates),
+                     extra={"event": "queue_updated", "updated": updated, "checked": len(candidates)})
+        return updated
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,72 @@
+import itertools
+import uuid
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+from chat_frames import stamp_frame
+
+# --- Configuração do log de eventos dos agentes ---
+EVENT_LOG_SIZE = 1024  # Eventos guardados para replay na reconexão
+
+Event = Tuple[int, Optional[Hashable], str]  # (seq, key de coalescência, frame)
+
+
+class EventLog:
+    """Buffer circular dos eventos enviados a todos os agentes.
+
+    Cada evento recebe um `seq` crescente (gravado no próprio frame) e fica
+    guardado até sair do buffer. Um agente que reconecta informa o último
+    `seq` visto e recebe só o que perdeu; se a lacuna já saiu do buffer (ou
+    o `epoch` é de outro processo, ex.: depois de um deploy), `since` devolve
+    None e quem chamou manda um snapshot.
+    Os `seq` de um mesmo epoch nunca repetem, mas podem pular: eventos com a
+    mesma key são coalescidos na fila de saída e no replay. O que chega ao
+    agente sai sempre em ordem crescente (ver `AgentOutbox.put`).
+    """
+
+    def __init__(self, size: int = EVENT_LOG_SIZE):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._events: Deque[Event] = deque(maxlen=size)
+
+    def append(self, frame: str, key: Optional[Hashable] = None) -> str:
+        """Registra o evento e devolve o frame com o `seq`."""
+        self.seq += 1
+        stamped = stamp_frame(frame, self.seq)
+        self._events.append((self.seq, key, stamped))
+        return stamped
+
+    def since(self, seq: Optional[int], epoch: Optional[str] = None) -> Optional[List[Tuple[Optional[Hashable], str]]]:
+        """Eventos depois de `seq` como (key, frame), ou None se não dá para fazer replay."""
+        if not isinstance(seq, int) or (epoch is not None and epoch != self.epoch) or seq > self.seq:
+            return None
+        oldest = self._events[0][0] if self._events else self.seq + 1
+        if seq < oldest - 1:
+            return None  # Lacuna maior que o buffer
+        missed = itertools.islice(self._events, seq - oldest + 1, None) if seq >= oldest else iter(self._events)
+        # Só a última versão de cada key interessa (mesma regra da AgentOutbox)
+        latest: Dict[Hashable, int] = {}
+        events = list(missed)
+        for i, (_, key, _) in enumerate(events):
+            if key is not None:
+                latest[key] = i
+        return [(key, frame) for i, (_, key, frame) in enumerate(events) if key is None or latest[key] == i]
+
+    def dump(self) -> dict:
+        """Epoch, seq e buffer, para o snapshot de warm restart."""
+        return {"epoch": self.epoch, "seq": self.seq, "events": list(self._events)}
+
+    def restore(self, state: Optional[dict]):
+        """Continua o epoch e a numeração de um snapshot: agentes que voltam
+        depois do deploy recebem replay em vez de snapshot completo."""
+        if not state:
+            return
+        self.epoch = state["epoch"]
+        self.seq = state["seq"]
+        self._events.clear()
+        for seq, key, frame in state["events"]:
+            # JSON não tem tupla: as keys (ex.: ("conversation_update", id)) voltam como lista
+            self._events.append((seq, tuple(key) if isinstance(key, list) else key, frame))
+
+    def __len__(self) -> int:
+        return len(self._events)
@@ -0,0 +1,101 @@
+import json
+from typing import Any
+
+from pydantic import BaseModel
+
+# --- Encoder JSON rápido (opcional) ---
+# orjson é usado quando instalado; caso contrário cai para o json da stdlib
+# com as mesmas opções que o Starlette usa em `send_json`.
+try:
+    import orjson
+
+    def dumps(value: Any) -> str:
+        return orjson.dumps(value, default=_default).decode("utf-8")
+
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+    def dumps(value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+# --- Mensagem de origem junto do frame (para quem fala MessagePack, ver chat_wire) ---
+# Desligado até o primeiro cliente negociar MessagePack: aí os frames passam
+# a levar também a mensagem em tipos simples (`Frame.message`), e o
+# MessagePack é gerado dela em vez de decodificar o JSON de novo.
+_retain_messages = False
+
+
+class Frame(str):
+    """Frame JSON (é uma str) com a mensagem que o originou em `message`."""
+
+    message: Any
+
+
+def retain_messages():
+    global _retain_messages
+    _retain_messages = True
+
+
+def _with_message(frame: str, message: Any) -> Frame:
+    framed = Frame(frame)
+    framed.message = message
+    return framed
+
+
+def _plain(value: Any) -> Any:
+    """Cópia em tipos simples do que pode mudar depois (modelos Pydantic)."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], BaseModel):
+        return [_plain(item) for item in value]
+    return value
+
+
+def encode_frame(message: dict) -> str:
+    """Serializa uma mensagem já montada (dict) em um frame de texto JSON."""
+    if _retain_messages:
+        return _with_message(dumps(message), message)
+    return dumps(message)
+
+
+def encode_event(event_type: str, **fields: Any) -> str:
+    """Monta o frame de um evento uma única vez, pronto para ser enviado a N sockets.
+
+    Campos que são modelos Pydantic (ex.: `Conversation`) são serializados
+    direto pelo `model_dump_json`, sem passar por um dict intermediário
+    (exceto quando os frames levam a mensagem, ver `retain_messages`).
+    """
+    if _retain_messages:
+        message = {"type": event_type}
+        for name, value in fields.items():
+            message[name] = _plain(value)
+        return _with_message(dumps(message), message)
+    parts = ['{"type":', dumps(event_type)]
+    for name, value in fields.items():
+        parts.append(",")
+        parts.append(dumps(name))
+        parts.append(":")
+        if isinstance(value, BaseModel):
+            parts.append(value.model_dump_json())
+        else:
+            parts.append(dumps(value))
+    parts.append("}")
+    return "".join(parts)
+
+
+def stamp_frame(frame: str, seq: int) -> str:
+    """Acrescenta `"seq"` a um frame de evento já codificado, sem decodificá-lo."""
+    stamped = '{"seq":%d,%s' % (seq, frame[1:])
+    message = getattr(frame, "message", None)
+    if message is not None:
+        return _with_message(stamped, {"seq": seq, **message})
+    return stamped
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from chat_frames import encode_frame
+
+logger = logging.getLogger("chat.heartbeat")
+
+# --- Heartbeat dos WebSockets (ping/pong na aplicação) ---
+# Opcional por cliente: só entra quem manda "heartbeat": true no agent_auth/user_join.
+# Os demais dependem do ping do próprio protocolo WebSocket (uvicorn --ws-ping-interval/--ws-ping-timeout).
+# Tipo de ponta -> (segundos em silêncio até mandar um ping, segundos em silêncio até derrubar).
+# Qualquer frame recebido conta como sinal de vida; o ping só sai para quem está quieto.
+HEARTBEAT_POLICIES: Dict[str, Tuple[float, float]] = {
+    "agent": (float(os.getenv("CHAT_AGENT_PING_INTERVAL", "20")), float(os.getenv("CHAT_AGENT_IDLE_TIMEOUT", "60"))),
+    "guest": (float(os.getenv("CHAT_GUEST_PING_INTERVAL", "30")), float(os.getenv("CHAT_GUEST_IDLE_TIMEOUT", "90"))),
+}
+HEARTBEAT_TICK = 1.0  # Resolução da roda de temporização (segundos)
+HEARTBEAT_WHEEL_SLOTS = 128  # Posições da roda; prazos além de uma volta esperam as voltas restantes
+HEARTBEAT_CLOSE_CODE = 1001  # "Going Away": o cliente pode reconectar e retomar (ver GUEST_RESUME_GRACE_SECONDS)
+
+PING_FRAME = encode_frame({"type": "ping"})
+
+
+class TimerWheel:
+    """Roda de temporização (hashed timing wheel) com uma única task.
+
+    Cada chave tem no máximo um prazo, guardado na posição
+    `tick do prazo % slots`; agendar, reagendar e cancelar são O(1) e a
+    cada tick só a posição atual é visitada. Com milhares de conexões isso
+    substitui milhares de `sleep`/`call_later` por um único timer. A task
+    só existe enquanto houver prazos agendados.
+    `on_due(chave)` é chamado no prazo (fora de corrotina) e pode devolver um
+    novo atraso em segundos para reagendar a chave, ou None para largá-la.
+    """
+
+    def __init__(self, on_due: Callable[[Hashable], Optional[float]],
+                 tick: float = HEARTBEAT_TICK, slots: int = HEARTBEAT_WHEEL_SLOTS):
+        self.on_due = on_due
+        self.tick = tick
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]  # chave -> tick do prazo
+        self._where: Dict[Hashable, int] = {}  # chave -> posição na roda
+        self._origin = time.monotonic()
+        self._current = 0  # Último tick processado
+        self._task: Optional[asyncio.Task] = None
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def schedule(self, key: Hashable, delay: float):
+        self.cancel(key)
+        if not self._where:
+            self._current = self._now_tick()  # Roda parada: recomeça do tick atual
+        due = max(self._current + 1, self._now_tick() + math.ceil(delay / self.tick))
+        position = due % len(self._slots)
+        self._slots[position][key] = due
+        self._where[key] = position
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def cancel(self, key: Hashable):
+        position = self._where.pop(key, None)
+        if position is not None:
+            del self._slots[position][key]
+
+    def advance(self, now_tick: int) -> int:
+        """Processa os ticks até `now_tick`. Devolve quantos prazos venceram."""
+        fired = 0
+        while self._current < now_tick and self._where:
+            self._current += 1
+            slot = self._slots[self._current % len(self._slots)]
+            due_keys = [key for key, due in slot.items() if due <= self._current]
+            for key in due_keys:
+                del slot[key]
+                del self._where[key]
+            for key in due_keys:
+                fired += 1
+                try:
+                    delay = self.on_due(key)
+                except Exception as e:
+                    logger.exception("Erro no timer de %r: %s", key, e, extra={"event": "timer_error"})
+                    continue
+                if delay is not None:
+                    self.schedule(key, delay)
+        return fired
+
+    async def _run(self):
+        try:
+            while self._where:
+                await asyncio.sleep(self.tick)
+                self.advance(self._now_tick())
+        finally:
+            self._task = None
+
+    def close(self):
+        for slot in self._slots:
+            slot.clear()
+        self._where.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+
+class _Peer:
+    __slots__ = ("websocket", "kind", "interval", "timeout", "last_seen", "pinged_at")
+
+    def __init__(self, websocket: Any, kind: str, interval: float, timeout: float):
+        self.websocket = websocket
+        self.kind = kind
+        self.interval = interval
+        self.timeout = timeout
+        self.last_seen = time.monotonic()
+        self.pinged_at = 0.0
+
+    def touch(self):
+        """Chamado a cada frame recebido: só anota a hora (a roda não é mexida)."""
+        self.last_seen = time.monotonic()
+
+
+class HeartbeatMonitor:
+    """Derruba conexões meio-abertas que nunca chegariam a dar erro no `receive_json`.
+
+    Cada socket autenticado entra com `watch` e ganha um prazo na
+    `TimerWheel`. O frame recebido só atualiza `last_seen`; quando o prazo
+    vence, o monitor olha o silêncio desde então: até `interval` só reagenda;
+    passando do `interval` manda um `{"type": "ping"}` (o cliente responde
+    `{"type": "pong"}`); passando do `timeout` chama `on_expired(websocket, kind)`.
+    Conversas ativas, que já trocam frames, não recebem ping nenhum.
+    """
+
+    def __init__(self,
+                 send_ping: Callable[[Any, str], Any],
+                 on_expired: Callable[[Any, str], Any],
+                 policies: Optional[Dict[str, Tuple[float, float]]] = None,
+                 tick: float = HEARTBEAT_TICK):
+        self.send_ping = send_ping
+        self.on_expired = on_expired
+        self.policies = HEARTBEAT_POLICIES if policies is None else policies
+        self.peers: Dict[Any, _Peer] = {}
+        self.wheel = TimerWheel(self._check, tick)
+        self.expired = 0
+
+    def watch(self, websocket: Any, kind: str) -> _Peer:
+        interval, timeout = self.policies[kind]
+        peer = self.peers[websocket] = _Peer(websocket, kind, interval, timeout)
+        self.wheel.schedule(websocket, interval)
+        return peer
+
+    def forget(self, websocket: Any):
+        if self.peers.pop(websocket, None) is not None:
+            self.wheel.cancel(websocket)
+
+    def _check(self, websocket: Any) -> Optional[float]:
+        peer = self.peers.get(websocket)
+        if peer is None:
+            return None
+        now = time.monotonic()
+        idle = now - peer.last_seen
+        if idle >= peer.timeout:
+            del self.peers[websocket]
+            self.expired += 1
+            logger.info("Sem resposta há %.0fs: derrubando %s.", idle, peer.kind,
+                        extra={"event": "heartbeat_expired", "kind": peer.kind, "idle": round(idle, 1)})
+            self.on_expired(websocket, peer.kind)
+            return None
+        if idle >= peer.interval and peer.pinged_at < peer.last_seen:
+            peer.pinged_at = now
+            self.send_ping(websocket, PING_FRAME)
+        # Próxima visita: o ping, se ainda não saiu neste silêncio; senão o timeout
+        pinged = peer.pinged_at >= peer.last_seen
+        return peer.last_seen + (peer.timeout if pinged else peer.interval) - now
+
+    def close(self):
+        self.peers.clear()
+        self.wheel.close()
+
+    def __len__(self) -> int:
+        return len(self.peers)
@@ -0,0 +1,150 @@
+import heapq
+import uuid
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Campos filtráveis da listagem de conversas (GET /conversations)
+INDEXED_FIELDS = ("status", "agent", "tag", "urgency")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def conversation_keys(conv) -> List[Tuple[str, str]]:
+    """Pares (campo, valor) pelos quais a conversa aparece nos índices secundários."""
+    keys = []
+    if conv.status:
+        keys.append(("status", conv.status))
+    if getattr(conv, "agent_name", None):
+        keys.append(("agent", conv.agent_name))
+    for tag in conv.tags or ():
+        keys.append(("tag", tag))
+    client_info = getattr(conv, "clientInfo", None)
+    if client_info is not None and client_info.urgency:
+        keys.append(("urgency", client_info.urgency))
+    return keys
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+class ConversationIndex:
+    """Versões e índices secundários das conversas do cache quente.
+
+    - Cada `update` dá à conversa a próxima versão de um contador monotônico,
+      então `since=<versão>` devolve exatamente o que mudou depois dela;
+    - `_log` guarda (versão, id) em ordem crescente; entradas de versões
+      antigas ficam lá até a compactação e são puladas na leitura;
+    - cada campo de INDEXED_FIELDS tem um dict valor -> ids, e os filtros
+      são a interseção desses conjuntos (sem varrer as conversas).
+    A versão de uma conversa é única, então serve como cursor estável para a
+    paginação: a página seguinte começa logo depois dela.
+    O contador só vive em memória: o `epoch` muda a cada processo, então uma
+    versão de outro epoch (ex.: depois de um deploy) não vale como `since`.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._versions: Dict[str, int] = {}
+        self._log: List[Tuple[int, str]] = []
+        self._keys: Dict[str, List[Tuple[str, str]]] = {}
+        self._indexes: Dict[str, Dict[str, Set[str]]] = {name: {} for name in INDEXED_FIELDS}
+
+    def update(self, conv) -> int:
+        self.version += 1
+        self._versions[conv.id] = self.version
+        self._log.append((self.version, conv.id))
+        keys = conversation_keys(conv)
+        old = self._keys.get(conv.id)
+        if old != keys:
+            if old:
+                self._unlink(conv.id, old)
+            for name, value in keys:
+                self._indexes[name].setdefault(value, set()).add(conv.id)
+            self._keys[conv.id] = keys
+        if len(self._log) > 2 * len(self._versions) + 64:
+            self._compact()
+        return self.version
+
+    def discard(self, conv_id: str):
+        if self._versions.pop(conv_id, None) is None:
+            return
+        self._unlink(conv_id, self._keys.pop(conv_id, ()))
+
+    def query(self, filters: Optional[Dict[str, str]] = None, since: Optional[int] = None,
+              cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[str], Optional[int]]:
+        """Ids de uma página e o cursor da próxima (None se acabou).
+
+        Com `since`: conversas com versão > since, da mais antiga para a mais
+        nova (o cursor devolvido é o próximo `since`). Sem `since`: da mais
+        recente para a mais antiga, começando antes de `cursor`.
+        """
+        filters = {name: value for name, value in (filters or {}).items() if value is not None}
+        if filters:
+            entries = self._filtered(filters, since, cursor, limit + 1)
+        else:
+            entries = self._scan(since, cursor, limit + 1)
+        if len(entries) > limit:
+            entries = entries[:limit]
+            return [conv_id for _, conv_id in entries], entries[-1][0]
+        return [conv_id for _, conv_id in entries], None
+
+    def _scan(self, since: Optional[int], cursor: Optional[int], count: int) -> List[Tuple[int, str]]:
+        log, versions, found = self._log, self._versions, []
+        if since is not None:
+            i = bisect_left(log, (since + 1,))
+            while i < len(log) and len(found) < count:
+                version, conv_id = log[i]
+                if versions.get(conv_id) == version:
+                    found.append(log[i])
+                i += 1
+        else:
+            i = bisect_left(log, (cursor,)) if cursor is not None else len(log)
+            while i > 0 and len(found) < count:
+                i -= 1
+                version, conv_id = log[i]
+                if versions.get(conv_id) == version:
+                    found.append(log[i])
+        return found
+
+    def _filtered(self, filters: Dict[str, str], since: Optional[int], cursor: Optional[int],
+                  count: int) -> List[Tuple[int, str]]:
+        sets = []
+        for name, value in filters.items():
+            ids = self._indexes.get(name, {}).get(value)
+            if not ids:
+                return []
+            sets.append(ids)
+        sets.sort(key=len)
+        candidates: Iterable[str] = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+        entries = []
+        for conv_id in candidates:
+            version = self._versions[conv_id]
+            if since is not None and version <= since:
+                continue
+            if since is None and cursor is not None and version >= cursor:
+                continue
+            entries.append((version, conv_id))
+        if since is not None:
+            return heapq.nsmallest(count, entries)
+        return heapq.nlargest(count, entries)
+
+    def _unlink(self, conv_id: str, keys: Iterable[Tuple[str, str]]):
+        for name, value in keys:
+            ids = self._indexes[name].get(value)
+            if ids is not None:
+                ids.discard(conv_id)
+                if not ids:
+                    del self._indexes[name][value]
+
+    def _compact(self):
+        self._log = sorted((version, conv_id) for conv_id, version in self._versions.items())
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __contains__(self, conv_id: str) -> bool:
+        return conv_id in self._versions
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# --- Limite de eventos recebidos por socket (token bucket) ---
+# Tipo de evento -> (eventos por segundo, rajada). Tipos não listados usam o padrão.
+INBOUND_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "agent_typing": (10.0, 20.0),
+    "agent_message": (10.0, 30.0),
+    "user_message": (5.0, 20.0),
+}
+DEFAULT_INBOUND_RATE_LIMIT = (5.0, 10.0)
+INBOUND_MAX_DROPS = 200  # Eventos descartados antes de derrubar a conexão
+RATE_LIMIT_CLOSE_CODE = 1008  # "Policy Violation"
+
+# --- Coalescência do "digitando..." do agente ---
+TYPING_REFRESH_INTERVAL = 3.0  # Reenvia typing=true no máximo uma vez por intervalo
+TYPING_STOP_DELAY = 0.8  # typing=false só sai se o agente não voltar a digitar nesse tempo
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def allow(self, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class InboundLimiter:
+    """Token buckets de um socket, um por tipo de evento recebido.
+
+    Cada tipo tem seu balde, então uma rajada de `agent_typing` não consome a
+    cota de `agent_message`. Eventos acima do limite são descartados; depois
+    de `max_drops` descartes `exhausted` fica True e o socket deve ser fechado.
+    """
+
+    __slots__ = ("limits", "max_drops", "dropped", "_buckets")
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, max_drops: int = INBOUND_MAX_DROPS):
+        self.limits = INBOUND_RATE_LIMITS if limits is None else limits
+        self.max_drops = max_drops
+        self.dropped = 0
+        self._buckets: Dict[Any, TokenBucket] = {}
+
+    def allow(self, event_type: Any) -> bool:
+        key = event_type if event_type in self.limits else None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.limits.get(key, DEFAULT_INBOUND_RATE_LIMIT))
+        if bucket.allow():
+            return True
+        self.dropped += 1
+        return False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.dropped >= self.max_drops
+
+
+@dataclass(slots=True)
+class _TypingState:
+    typing: bool = False  # Último estado repassado ao cliente
+    sent_at: float = 0.0
+    stop_handle: Optional[asyncio.TimerHandle] = None
+
+
+class TypingCoalescer:
+    """Reduz o "digitando..." do agente (um evento por tecla) a transições.
+
+    - typing=true só é repassado quando muda de estado ou, enquanto o agente
+      continua digitando, no máximo uma vez a cada `refresh_interval`;
+    - typing=false é adiado por `stop_delay`: se o agente voltar a digitar
+      antes disso, nada é enviado (pausas curtas não piscam o indicador);
+      senão `on_stop(alvo)` é chamado para enviar o typing=false.
+    `update` diz se o evento atual deve ser repassado agora.
+    """
+
+    def __init__(self, on_stop: Callable[[Hashable], None], refresh_interval: float = TYPING_REFRESH_INTERVAL,
+                 stop_delay: float = TYPING_STOP_DELAY):
+        self.on_stop = on_stop
+        self.refresh_interval = refresh_interval
+        self.stop_delay = stop_delay
+        self._states: Dict[Hashable, _TypingState] = {}
+
+    def update(self, target: Hashable, typing: bool) -> bool:
+        state = self._states.get(target)
+        if not typing:
+            if state is not None and state.typing and state.stop_handle is None:
+                state.stop_handle = asyncio.get_running_loop().call_later(self.stop_delay, self._stop, target)
+            return False
+        if state is None:
+            state = self._states[target] = _TypingState()
+        if state.stop_handle is not None:
+            state.stop_handle.cancel()
+            state.stop_handle = None
+        now = time.monotonic()
+        if state.typing and now - state.sent_at < self.refresh_interval:
+            return False
+        state.typing = True
+        state.sent_at = now
+        return True
+
+    def forget(self, target: Hashable):
+        """Descarta o estado (ex.: a sessão acabou) sem enviar nada."""
+        state = self._states.pop(target, None)
+        if state is not None and state.stop_handle is not None:
+            state.stop_handle.cancel()
+
+    def _stop(self, target: Hashable):
+        state = self._states.pop(target, None)
+        if state is not None:
+            self.on_stop(target)
+
+    def __len__(self) -> int:
+        return len(self._states)
@@ -0,0 +1,140 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# --- Configuração dos logs ---
+# CHAT_LOG_LEVEL: nível geral (padrão INFO).
+# CHAT_LOG_LEVELS: níveis por logger, ex.: "chat.ws=WARNING,chat.backend=DEBUG".
+# CHAT_LOG_SAMPLING: fração mantida por evento, ex.: "broadcast=0.01,client_message=0.1".
+LOG_LEVEL = os.getenv("CHAT_LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("CHAT_LOG_LEVELS", "")
+LOG_SAMPLING = os.getenv("CHAT_LOG_SAMPLING", "broadcast=0.01")
+
+# Atributos padrão de um LogRecord; o resto (vindo de `extra=`) vira campo do JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    pairs = {}
+    for item in spec.split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep and name.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro: ts, level, logger, event, msg e os campos extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                doc[key] = value
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Mantém só uma fração dos registros de cada `event` (1 a cada N, sem sorteio).
+
+    Avisos e erros nunca são amostrados. Registros sem `event` passam sempre.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) for event, rate in rates.items() if rate > 0}
+        self.muted = {event for event, rate in rates.items() if rate <= 0}
+        self._seen: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        if event in self.muted:
+            return False
+        every = self.every.get(event)
+        if every is None:
+            return True
+        seen = self._seen.get(event, 0)
+        self._seen[event] = seen + 1
+        if seen % every:
+            return False
+        record.sampled = every  # Cada linha representa `every` eventos
+        return True
+
+
+class _LoopQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que só enfileira: mensagem e JSON são montados na thread de escrita.
+
+    Os argumentos dos logs do chat são valores imutáveis (ids, contagens),
+    então adiar o `getMessage` para a outra thread é seguro.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, sampling: str = LOG_SAMPLING,
+                  stream=None) -> logging.handlers.QueueListener:
+    """Liga o pipeline: logger "chat" -> fila -> thread que formata em JSON e escreve.
+
+    No event loop, um log custa o filtro de nível/amostragem e um `put` numa
+    fila sem lock; a escrita no stdout (que sob o supervisor pode bloquear)
+    fica toda na thread do QueueListener. Chamadas repetidas não duplicam nada.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger("chat")
+    root.setLevel(level.upper())
+    root.propagate = False
+    for name, value in _parse_pairs(levels).items():
+        logging.getLogger(name).setLevel(value.upper())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _LoopQueueHandler(log_queue)
+    rates = {}
+    for event, value in _parse_pairs(sampling).items():
+        try:
+            rates[event] = float(value)
+        except ValueError:
+            pass
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    root.addHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Esvazia a fila e para a thread de escrita."""
+    global _listener
+    if _listener is not None:
+        root = logging.getLogger("chat")
+        for handler in list(root.handlers):
+            if isinstance(handler, _LoopQueueHandler):
+                root.removeHandler(handler)
+        _listener.stop()
+        _listener = None
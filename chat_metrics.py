@@ -0,0 +1,176 @@
+import inspect
+import math
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Faixas padrão dos histogramas de latência (segundos)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+GaugeCallback = Callable[[], Union[float, Awaitable[float]]]
+
+
+class _Metric:
+    """Base das métricas: nome, ajuda, nomes de labels e filhos por valor de label.
+
+    Tudo roda na thread do event loop, então não há locks: registrar um
+    evento é só um incremento de atributo. Os filhos de cada combinação de
+    labels são criados uma vez e podem ser guardados por quem registra
+    (`metric.labels("x")`) para nem pagar o lookup no dict.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    async def collect(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{self._label_text(values)} {_number(child.value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    """Gauge lido na hora da coleta por um callback (síncrono ou corrotina)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: GaugeCallback, registry: "Registry" = None):
+        super().__init__(name, documentation, (), registry)
+        self.callback = callback
+
+    async def collect(self) -> List[str]:
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        return [f"{self.name} {_number(value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Última posição: +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    async def collect(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            labels = self._label_text(values)
+            lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    async def render(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(await metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+
+# --- Métricas compartilhadas pelos módulos do chat ---
+# (os gauges que dependem do ConnectionManager são criados em main_api)
+SEND_FAILURES = Counter("chat_send_failures_total", "Envios que falharam ou foram descartados", ["reason"])
+OUTBOX_SLOW_CONSUMER = SEND_FAILURES.labels("slow_consumer")
+OUTBOX_SEND_ERROR = SEND_FAILURES.labels("agent_send_error")
+GUEST_SEND_ERROR = SEND_FAILURES.labels("guest_send_error")
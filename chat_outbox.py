@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional
+
+from fastapi import WebSocket
+
+from chat_frames import encode_frame
+from chat_metrics import OUTBOX_SEND_ERROR, OUTBOX_SLOW_CONSUMER
+
+logger = logging.getLogger("chat.outbox")
+
+# --- Configuração da fila de saída dos agentes ---
+OUTBOX_MAX_PENDING = 256      # Mensagens pendentes antes de considerar o agente "lento"
+OUTBOX_SEND_TIMEOUT = 10.0    # Segundos que um único envio pode levar antes de derrubar o socket
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "Try Again Later"
+DETACHED_MAX_PENDING = 100    # Frames guardados para um cliente que caiu (os mais antigos saem primeiro)
+
+
+class AgentOutbox:
+    """Fila de saída limitada de um agente, drenada por uma task escritora própria.
+
+    `put` nunca bloqueia: o frame (texto JSON já codificado, ver `chat_frames`)
+    é enfileirado e a task escritora faz o `send_text`. Frames com `key`
+    (ex.: `conversation_update` de uma mesma conversa) descartam a versão
+    ainda pendente e entram no fim da fila: assim os `seq` (ver `EventLog`)
+    saem sempre em ordem crescente e o replay a partir do último visto não
+    perde nada.
+    Se a fila enche mesmo assim, o agente é considerado lento e o socket é
+    fechado; o loop de recepção em `websocket_endpoint` cuida do `disconnect`.
+    """
+
+    def __init__(self, websocket: WebSocket, max_pending: int = OUTBOX_MAX_PENDING):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.closed = False
+        self.dropped = 0
+        # Cada entrada é [key, frame]; `_keyed` aponta para a entrada pendente de cada key.
+        # Entrada substituída fica na fila com frame None (descartada pela task escritora)
+        self._pending: Deque[List[Any]] = deque()
+        self._keyed: Dict[Hashable, List[Any]] = {}
+        self._live = 0  # Entradas com frame (o tamanho real da fila)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def put(self, frame: str, key: Optional[Hashable] = None) -> bool:
+        if self.closed:
+            return False
+
+        if key is not None:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                # Atualização obsoleta ainda não enviada: sai da fila e a nova entra no fim
+                entry[1] = None
+                self._live -= 1
+                self.dropped += 1
+                if len(self._pending) >= 2 * self.max_pending:
+                    self._pending = deque(entry for entry in self._pending if entry[1] is not None)
+
+        if self._live >= self.max_pending:
+            logger.warning("Agente lento: %d mensagens pendentes. Desconectando.", self._live, extra={"event": "slow_consumer"})
+            OUTBOX_SLOW_CONSUMER.inc()
+            self._abort(SLOW_CONSUMER_CLOSE_CODE, "Consumidor lento")
+            return False
+
+        entry = [key, frame]
+        self._pending.append(entry)
+        self._live += 1
+        if key is not None:
+            self._keyed[key] = entry
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                key, frame = self._pending.popleft()
+                if frame is None:
+                    continue  # Substituída por uma versão mais nova, mais adiante na fila
+                self._live -= 1
+                if key is not None:
+                    self._keyed.pop(key, None)
+                await asyncio.wait_for(self.websocket.send_text(frame), OUTBOX_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Erro ao enviar para agente: %s", e, extra={"event": "agent_send_error"})
+            OUTBOX_SEND_ERROR.inc()
+            self._abort(SLOW_CONSUMER_CLOSE_CODE, "Falha no envio")
+
+    def _abort(self, code: int, reason: str):
+        if self.closed:
+            return
+        self.close()
+        asyncio.create_task(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), OUTBOX_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def close(self):
+        """Para a task escritora e descarta o que ainda estiver pendente."""
+        self.closed = True
+        self._pending.clear()
+        self._keyed.clear()
+        self._live = 0
+        if not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def __len__(self) -> int:
+        return self._live
+
+
+class DetachedGuest:
+    """Lugar de um cliente cuja conexão caiu e que ainda pode voltar.
+
+    Entra no lugar do WebSocket em todos os mapas do `ConnectionManager`
+    (sessão, vaga do agente, fila), com a mesma interface (`send_json`,
+    `send_text`, `close`), então quem envia não precisa saber que o cliente
+    está fora: os frames ficam guardados (até DETACHED_MAX_PENDING) e são
+    entregues em ordem quando ele volta (`flush_to`).
+    """
+
+    __slots__ = ("guest_id", "frames", "dropped")
+
+    def __init__(self, guest_id: str, max_pending: int = DETACHED_MAX_PENDING):
+        self.guest_id = guest_id
+        self.frames: Deque[str] = deque(maxlen=max_pending)
+        self.dropped = 0
+
+    async def send_text(self, frame: str):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+
+    async def send_json(self, message: dict):
+        await self.send_text(encode_frame(message))
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        pass
+
+    async def flush_to(self, websocket: WebSocket):
+        """Entrega ao socket novo o que chegou enquanto o cliente estava fora."""
+        while self.frames:
+            await websocket.send_text(self.frames.popleft())
+
+    def __repr__(self) -> str:
+        return f"DetachedGuest({self.guest_id}, {len(self.frames)} pendentes)"
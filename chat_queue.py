@@ -0,0 +1,235 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+
+@dataclass(slots=True)
+class WaitingGuest:
+    websocket: Optional[WebSocket]  # None: restaurado de um snapshot, cliente ainda não voltou
+    join_data: dict
+    guest_id: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    priority: int = 0
+    ticket: int = 0
+    worker_id: Optional[str] = None  # Worker que tem o socket do cliente (backend Redis)
+
+
+class _Fenwick:
+    """Árvore de Fenwick (BIT) de contagens: soma de prefixo e update em O(log n)."""
+
+    __slots__ = ("size", "tree")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree: List[int] = [0] * (size + 1)
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Soma das posições [0, index]."""
+        total = 0
+        i = index + 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class _Lane:
+    """Uma faixa FIFO da fila, com posições exatas via árvore de Fenwick."""
+
+    def __init__(self, initial_capacity: int):
+        self.entries: "OrderedDict[str, WaitingGuest]" = OrderedDict()
+        self._tree = _Fenwick(initial_capacity)
+        self._next_ticket = 0
+
+    def push(self, entry: WaitingGuest):
+        if self._next_ticket >= self._tree.size:
+            self._reindex()
+        entry.ticket = self._next_ticket
+        self._next_ticket += 1
+        self.entries[entry.guest_id] = entry
+        self._tree.add(entry.ticket, 1)
+
+    def pop(self) -> WaitingGuest:
+        _, entry = self.entries.popitem(last=False)
+        self._forget(entry)
+        return entry
+
+    def remove(self, guest_id: str) -> Optional[WaitingGuest]:
+        entry = self.entries.pop(guest_id, None)
+        if entry is not None:
+            self._forget(entry)
+        return entry
+
+    def position(self, entry: WaitingGuest) -> int:
+        return self._tree.prefix(entry.ticket)
+
+    def _forget(self, entry: WaitingGuest):
+        self._tree.add(entry.ticket, -1)
+        if not self.entries:
+            # Faixa vazia: recomeça a numeração sem realocar a árvore
+            self._tree = _Fenwick(self._tree.size)
+            self._next_ticket = 0
+
+    def _reindex(self):
+        """Renumera os tickets em ordem (0..n-1), dobrando a árvore se necessário."""
+        size = self._tree.size
+        if len(self.entries) * 2 > size:
+            size *= 2
+        self._tree = _Fenwick(size)
+        for ticket, entry in enumerate(self.entries.values()):
+            entry.ticket = ticket
+            self._tree.add(ticket, 1)
+        self._next_ticket = len(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class WaitingQueue:
+    """Fila de clientes em espera, indexada por guest_id e por websocket.
+
+    Cada prioridade (ex.: urgência do projeto) tem sua própria faixa FIFO e
+    `pop` sempre atende a faixa mais prioritária primeiro.
+    - `push`, `pop` e `remove` são O(1) (OrderedDict + índices por id/websocket);
+    - `position` usa uma árvore de Fenwick sobre os "tickets" de chegada, então
+      continua exata mesmo com remoções no meio da fila, em O(log n).
+    Os tickets são renumerados quando a faixa esvazia ou quando a árvore
+    precisaria crescer com mais da metade dos slots já liberados.
+    A fila anota a primeira posição afetada por `pop`, `remove` ou por um
+    `push` que passa na frente de alguém; `take_changed` devolve essa posição
+    (quem está dela para trás mudou de lugar) e zera a anotação.
+    """
+
+    def __init__(self, initial_capacity: int = 64):
+        self._initial_capacity = initial_capacity
+        self._lanes: Dict[int, _Lane] = {}
+        self._priorities: List[int] = []  # Prioridades existentes, da maior para a menor
+        self._by_id: Dict[str, WaitingGuest] = {}
+        self._by_ws: Dict[WebSocket, str] = {}
+        self._changed_from: Optional[int] = None
+
+    def push(self, websocket: WebSocket, join_data: dict, guest_id: str, priority: int = 0) -> WaitingGuest:
+        lane = self._lanes.get(priority)
+        if lane is None:
+            lane = self._lanes[priority] = _Lane(self._initial_capacity)
+            self._priorities = sorted(self._lanes, reverse=True)
+        entry = WaitingGuest(websocket, join_data, guest_id, priority=priority)
+        lane.push(entry)
+        self._by_id[guest_id] = entry
+        if websocket is not None:
+            self._by_ws[websocket] = guest_id
+        if priority != self._priorities[-1]:
+            position = self.position(guest_id)
+            if position < len(self._by_id):
+                self._mark_changed(position + 1)  # Passou na frente de quem já esperava
+        return entry
+
+    def pop(self) -> Optional[WaitingGuest]:
+        """Remove e devolve o cliente mais prioritário há mais tempo na fila."""
+        for priority in self._priorities:
+            lane = self._lanes[priority]
+            if lane:
+                entry = lane.pop()
+                self._forget(entry)
+                self._mark_changed(1)
+                return entry
+        return None
+
+    def remove(self, websocket: WebSocket) -> Optional[WaitingGuest]:
+        guest_id = self._by_ws.get(websocket)
+        if guest_id is None:
+            return None
+        return self.remove_guest(guest_id)
+
+    def remove_guest(self, guest_id: str) -> Optional[WaitingGuest]:
+        entry = self._by_id.get(guest_id)
+        if entry is None:
+            return None
+        self._mark_changed(self.position(guest_id))
+        self._lanes[entry.priority].remove(guest_id)
+        self._forget(entry)
+        return entry
+
+    def attach(self, guest_id: str, websocket: Optional[WebSocket]) -> Optional[WaitingGuest]:
+        """Troca o socket de um cliente que continua na fila (None solta o atual)."""
+        entry = self._by_id.get(guest_id)
+        if entry is None:
+            return None
+        self._by_ws.pop(entry.websocket, None)
+        entry.websocket = websocket
+        if websocket is not None:
+            self._by_ws[websocket] = guest_id
+        return entry
+
+    def get(self, guest_id: str) -> Optional[WaitingGuest]:
+        return self._by_id.get(guest_id)
+
+    def get_by_websocket(self, websocket: WebSocket) -> Optional[WaitingGuest]:
+        guest_id = self._by_ws.get(websocket)
+        return self._by_id.get(guest_id) if guest_id is not None else None
+
+    def position(self, guest_id: str) -> Optional[int]:
+        """Posição atual (1 = próximo a ser atendido) ou None se não está na fila."""
+        entry = self._by_id.get(guest_id)
+        if entry is None:
+            return None
+        ahead = 0
+        for priority in self._priorities:
+            if priority == entry.priority:
+                break
+            ahead += len(self._lanes[priority])
+        return ahead + self._lanes[entry.priority].position(entry)
+
+    def positions_from(self, start: int) -> Dict[str, int]:
+        """guest_id -> posição de quem está da posição `start` para trás, na ordem da fila.
+
+        Percorre a fila do fim para o começo e para em `start`: o custo é o
+        tamanho do trecho, não o da fila.
+        """
+        found: List[Tuple[str, int]] = []
+        position = len(self._by_id)
+        for priority in reversed(self._priorities):
+            for entry in reversed(self._lanes[priority].entries.values()):
+                if position < start:
+                    return dict(reversed(found))
+                found.append((entry.guest_id, position))
+                position -= 1
+        return dict(reversed(found))
+
+    def take_changed(self) -> Optional[int]:
+        """Primeira posição afetada desde a última chamada (None: ninguém mudou de lugar)."""
+        changed, self._changed_from = self._changed_from, None
+        return changed
+
+    def _mark_changed(self, position: int):
+        if self._changed_from is None or position < self._changed_from:
+            self._changed_from = position
+
+    def _forget(self, entry: WaitingGuest):
+        self._by_id.pop(entry.guest_id, None)
+        self._by_ws.pop(entry.websocket, None)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __bool__(self) -> bool:
+        return bool(self._by_id)
+
+    def __contains__(self, websocket: WebSocket) -> bool:
+        return websocket in self._by_ws
+
+    def __iter__(self) -> Iterator[WaitingGuest]:
+        """Percorre a fila na ordem de atendimento."""
+        entries = []
+        for priority in self._priorities:
+            entries.extend(self._lanes[priority].entries.values())
+        return iter(entries)
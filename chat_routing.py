@@ -0,0 +1,133 @@
+import heapq
+import itertools
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+# --- Configuração do roteamento de agentes ---
+DEFAULT_AGENT_CAPACITY = 1  # Chats simultâneos quando o agente não informa a capacidade (painéis antigos não mandam guest_id)
+MAX_AGENT_CAPACITY = 5
+STRICT_DEPARTMENT_ROUTING = False  # True: cliente de um departamento só vai para agentes dele
+
+
+@dataclass(slots=True, eq=False)
+class AgentSlot:
+    websocket: WebSocket
+    user: object
+    capacity: int
+    department: Optional[str] = None
+    guests: Set[WebSocket] = field(default_factory=set)
+    version: int = 0
+
+    @property
+    def load(self) -> int:
+        return len(self.guests)
+
+    @property
+    def has_capacity(self) -> bool:
+        return len(self.guests) < self.capacity
+
+
+def clamp_capacity(value) -> int:
+    try:
+        capacity = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_AGENT_CAPACITY
+    return max(1, min(MAX_AGENT_CAPACITY, capacity))
+
+
+class AgentRouter:
+    """Distribui clientes para o agente menos carregado.
+
+    Mantém um heap global e um por departamento, com entradas
+    `(ocupação, chats ativos, seq, versão, websocket)`. Cada mudança de carga
+    incrementa a versão do agente e empurra uma entrada nova; entradas antigas
+    são descartadas preguiçosamente quando chegam ao topo.
+    """
+
+    def __init__(self):
+        self.agents: Dict[WebSocket, AgentSlot] = {}
+        self._heaps: Dict[Optional[str], List[Tuple]] = {None: []}
+        self._seq = itertools.count()
+
+    def add(self, websocket: WebSocket, user, capacity: int = DEFAULT_AGENT_CAPACITY,
+            department: Optional[str] = None) -> AgentSlot:
+        slot = AgentSlot(websocket, user, clamp_capacity(capacity), department)
+        self.agents[websocket] = slot
+        self._push(slot)
+        return slot
+
+    def remove(self, websocket: WebSocket) -> Optional[AgentSlot]:
+        # As entradas no heap ficam órfãs e são descartadas no próximo `pick`
+        return self.agents.pop(websocket, None)
+
+    def assign(self, agent_ws: WebSocket, guest_ws: WebSocket):
+        slot = self.agents[agent_ws]
+        slot.guests.add(guest_ws)
+        self._push(slot)
+
+    def release(self, agent_ws: WebSocket, guest_ws: WebSocket) -> Optional[AgentSlot]:
+        slot = self.agents.get(agent_ws)
+        if slot is not None and guest_ws in slot.guests:
+            slot.guests.discard(guest_ws)
+            self._push(slot)
+        return slot
+
+    def replace_guest(self, agent_ws: WebSocket, old_ws, new_ws):
+        """Troca o socket do cliente (ex.: reconexão) sem mudar a carga do agente."""
+        slot = self.agents.get(agent_ws)
+        if slot is not None and old_ws in slot.guests:
+            slot.guests.discard(old_ws)
+            slot.guests.add(new_ws)
+
+    def pick(self, department: Optional[str] = None) -> Optional[AgentSlot]:
+        """Agente com menor ocupação que ainda tem vaga (preferindo o departamento)."""
+        if department is not None:
+            slot = self._peek(department)
+            if slot is not None or STRICT_DEPARTMENT_ROUTING:
+                return slot
+        return self._peek(None)
+
+    def get(self, websocket: WebSocket) -> Optional[AgentSlot]:
+        return self.agents.get(websocket)
+
+    def _push(self, slot: AgentSlot):
+        slot.version += 1
+        if not slot.has_capacity:
+            return
+        entry = (slot.load / slot.capacity, slot.load, next(self._seq), slot.version, slot.websocket)
+        heapq.heappush(self._heaps[None], entry)
+        if slot.department is not None:
+            heapq.heappush(self._heaps.setdefault(slot.department, []), entry)
+        if len(self._heaps[None]) > 4 * len(self.agents) + 16:
+            self._compact()
+
+    def _peek(self, department: Optional[str]) -> Optional[AgentSlot]:
+        heap = self._heaps.get(department)
+        while heap:
+            _, _, _, version, websocket = heap[0]
+            slot = self.agents.get(websocket)
+            if slot is not None and slot.version == version and slot.has_capacity:
+                return slot
+            heapq.heappop(heap)
+        return None
+
+    def _compact(self):
+        """Reconstrói os heaps só com as entradas válidas."""
+        self._heaps = {None: []}
+        for slot in self.agents.values():
+            slot.version += 1
+            if slot.has_capacity:
+                entry = (slot.load / slot.capacity, slot.load, next(self._seq), slot.version, slot.websocket)
+                self._heaps[None].append(entry)
+                if slot.department is not None:
+                    self._heaps.setdefault(slot.department, []).append(entry)
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def __contains__(self, websocket: WebSocket) -> bool:
+        return websocket in self.agents
+
+    def __len__(self) -> int:
+        return len(self.agents)
@@ -0,0 +1,260 @@
+import heapq
+import json
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# --- Configuração da busca de conversas (GET /conversations/search) ---
+# Peso de cada campo na contagem de termos: achar o nome/e-mail/telefone vale mais que uma menção na conversa
+FIELD_WEIGHTS = {"name": 3.0, "email": 3.0, "phone": 3.0, "project": 2.0, "message": 1.0}
+PREFIX_EXPANSIONS = 64  # Termos do vocabulário considerados para o último termo da busca (busca enquanto digita)
+BM25_K1 = 1.2
+BM25_B = 0.5
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Palavras muito frequentes em português: não entram no índice nem na busca
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de da do das dos em na no nas nos e ou que se por para pra com sem
+ao aos à às é foi ser ter tem meu minha seu sua isso esse essa este esta eu voce vc ele ela nos
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos: "Orçamento São João" -> "orcamento sao joao"."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [token for token in _TOKEN_RE.findall(normalize_text(text))
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def _count(counts: Dict[str, float], tokens: Iterable[str], weight: float):
+    for token in tokens:
+        counts[token] = counts.get(token, 0.0) + weight
+
+
+def _client_fields(conv) -> Tuple[str, ...]:
+    info = getattr(conv, "clientInfo", None)
+    return (
+        conv.clientName or "",
+        getattr(info, "email", None) or "",
+        getattr(info, "phone", None) or "",
+        getattr(info, "project", None) or "",
+    )
+
+
+def _message_text(message) -> Optional[str]:
+    # Mensagens do formulário/agente usam `content`; o histórico com a IA usa `text`
+    return message.get("content") or message.get("text") if isinstance(message, dict) else None
+
+
+def analyze_client(fields: Tuple[str, ...]) -> Dict[str, float]:
+    name, email, phone, project = fields
+    counts: Dict[str, float] = {}
+    _count(counts, tokenize(name), FIELD_WEIGHTS["name"])
+    _count(counts, tokenize(email), FIELD_WEIGHTS["email"])
+    phone_tokens = tokenize(phone)
+    digits = "".join(ch for ch in phone if ch.isdigit())
+    if len(digits) > 4:
+        phone_tokens.append(digits)  # Telefone inteiro, para buscar sem a pontuação
+    _count(counts, phone_tokens, FIELD_WEIGHTS["phone"])
+    _count(counts, tokenize(project), FIELD_WEIGHTS["project"])
+    return counts
+
+
+def analyze_messages(messages: Iterable) -> Dict[str, float]:
+    counts: Dict[str, float] = {}
+    weight = FIELD_WEIGHTS["message"]
+    for message in messages:
+        _count(counts, tokenize(_message_text(message)), weight)
+    return counts
+
+
+def analyze_json(raw: str) -> Tuple[str, Tuple[str, ...], int, Dict[str, float]]:
+    """Análise de uma conversa serializada, sem montar o modelo (para rodar numa thread).
+
+    Devolve os argumentos de `SearchIndex.add_analyzed`.
+    """
+    doc = json.loads(raw)
+    info = doc.get("clientInfo") or {}
+    client = (doc.get("clientName") or "", info.get("email") or "", info.get("phone") or "", info.get("project") or "")
+    messages = doc.get("messages") or []
+    terms = analyze_client(client)
+    for term, weight in analyze_messages(messages).items():
+        terms[term] = terms.get(term, 0.0) + weight
+    return doc["id"], client, len(messages), terms
+
+
+def clamp_search_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_SEARCH_LIMIT
+    return min(limit, MAX_SEARCH_LIMIT)
+
+
+class _Doc:
+    __slots__ = ("client", "messages", "terms", "length", "stamp")
+
+    def __init__(self):
+        self.client: Tuple[str, ...] = ()
+        self.messages = 0  # Quantas mensagens já foram indexadas
+        self.terms: Dict[str, float] = {}
+        self.length = 0.0
+        self.stamp = 0
+
+
+class SearchIndex:
+    """Índice invertido (termo -> conversas) mantido a cada gravação.
+
+    - `update` é incremental: se só chegaram mensagens novas (os campos do
+      cliente não mudaram e a lista só cresceu), indexa apenas as novas;
+      qualquer outra mudança reindexa a conversa inteira;
+    - termos normalizados (sem acento, minúsculos, sem stopwords), com peso
+      por campo (FIELD_WEIGHTS);
+    - `search` exige todos os termos (o último também vale como prefixo,
+      para a busca enquanto digita), começa pela lista de postings mais
+      curta e ordena por BM25 (empates: a atualizada por último primeiro).
+    Conversas que saem do cache quente continuam no índice: a busca também
+    encontra as arquivadas.
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, _Doc] = {}
+        self._lengths: Dict[str, float] = {}  # conv_id -> tamanho ponderado (lido a cada busca)
+        self._postings: Dict[str, Dict[str, float]] = {}  # termo -> {conv_id: peso}
+        self._vocabulary: List[str] = []  # Termos em ordem, para os prefixos (pode ter termos já sem postings)
+        self._total_length = 0.0
+        self._stamp = 0
+
+    def update(self, conv):
+        doc = self.docs.get(conv.id)
+        if doc is None:
+            doc = self.docs[conv.id] = _Doc()
+        client = _client_fields(conv)
+        messages = conv.messages or []
+        if doc.client == client and len(messages) >= doc.messages:
+            added = analyze_messages(messages[doc.messages:])
+        else:
+            self._unlink(conv.id, doc)
+            added = analyze_client(client)
+            for term, weight in analyze_messages(messages).items():
+                added[term] = added.get(term, 0.0) + weight
+            doc.client = client
+        doc.messages = len(messages)
+        self._stamp += 1
+        doc.stamp = self._stamp
+        self._link(conv.id, doc, added)
+
+    def add_analyzed(self, conv_id: str, client: Tuple[str, ...], messages: int, terms: Dict[str, float]):
+        """Entra com uma conversa já analisada (ex.: numa thread). Não sobrescreve uma já indexada."""
+        if conv_id in self.docs:
+            return
+        doc = self.docs[conv_id] = _Doc()
+        doc.client = client
+        doc.messages = messages
+        self._link(conv_id, doc, terms)
+
+    def discard(self, conv_id: str):
+        doc = self.docs.pop(conv_id, None)
+        if doc is not None:
+            self._unlink(conv_id, doc)
+            del self._lengths[conv_id]
+
+    def _link(self, conv_id: str, doc: _Doc, counts: Dict[str, float]):
+        for term, weight in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocabulary, term)
+            postings[conv_id] = postings.get(conv_id, 0.0) + weight
+            doc.terms[term] = doc.terms.get(term, 0.0) + weight
+            doc.length += weight
+            self._total_length += weight
+        self._lengths[conv_id] = doc.length
+
+    def _unlink(self, conv_id: str, doc: _Doc):
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(conv_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= doc.length
+        doc.terms = {}
+        doc.length = 0.0
+        if len(self._vocabulary) > 2 * len(self._postings) + 1024:
+            self._vocabulary = sorted(self._postings)  # Compacta os termos que ficaram sem postings
+
+    def _expand(self, prefix: str) -> List[str]:
+        terms = []
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and len(terms) < PREFIX_EXPANSIONS:
+            term = self._vocabulary[i]
+            if not term.startswith(prefix):
+                break
+            if term in self._postings:
+                terms.append(term)
+            i += 1
+        return terms
+
+    def search(self, query: str, offset: int = 0, limit: int = DEFAULT_SEARCH_LIMIT) -> Tuple[List[str], int]:
+        """Ids da página pedida, do mais relevante ao menos, e o total de resultados."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.docs:
+            return [], 0
+        # Cada grupo é um termo da busca; o último inclui os termos que começam com ele
+        groups: List[List[str]] = [[token] if token in self._postings else [] for token in tokens[:-1]]
+        groups.append(self._expand(tokens[-1]))
+        if not all(groups):
+            return [], 0
+
+        postings_of = self._postings
+        sizes = [sum(len(postings_of[term]) for term in group) for group in groups]
+        order = sorted(range(len(groups)), key=sizes.__getitem__)
+        candidates: Optional[Set[str]] = None
+        for i in order:
+            found: Set[str] = set()
+            for term in groups[i]:
+                found.update(postings_of[term])
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return [], 0
+
+        # BM25 termo a termo: percorre a menor das duas (postings ou candidatos)
+        total_docs = len(self.docs)
+        lengths = self._lengths
+        base = BM25_K1 * (1 - BM25_B)
+        scale = BM25_K1 * BM25_B / (self._total_length / total_docs or 1.0)
+        scores = dict.fromkeys(candidates, 0.0)
+        for group in groups:
+            for term in group:
+                postings = postings_of[term]
+                df = len(postings)
+                weight = math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+                if df <= len(scores):
+                    for conv_id, tf in postings.items():
+                        if conv_id in scores:
+                            scores[conv_id] += weight * tf / (tf + base + scale * lengths[conv_id])
+                else:
+                    for conv_id in scores:
+                        tf = postings.get(conv_id)
+                        if tf:
+                            scores[conv_id] += weight * tf / (tf + base + scale * lengths[conv_id])
+        # Mesma chave no corte e na ordem final: empates no score não cruzam a borda da página
+        docs = self.docs
+        top = heapq.nlargest(offset + limit, scores, key=lambda conv_id: (scores[conv_id], docs[conv_id].stamp))
+        return top[offset:], len(scores)
+
+    def __len__(self) -> int:
+        return len(self.docs)
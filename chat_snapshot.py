@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger("chat.snapshot")
+
+# --- Configuração do snapshot de estado (warm restart entre deploys) ---
+SNAPSHOT_PATH = os.getenv("CHAT_SNAPSHOT_PATH", "chat_state.snapshot")  # Vazio desliga
+SNAPSHOT_INTERVAL = float(os.getenv("CHAT_SNAPSHOT_INTERVAL", "60"))  # Segundos entre snapshots (0 = só no desligamento)
+SNAPSHOT_MAX_AGE = float(os.getenv("CHAT_SNAPSHOT_MAX_AGE", "86400"))  # Snapshot mais antigo que isso é ignorado
+
+MAGIC = b"WPCHATS1"
+_PREAMBLE = struct.Struct("<8sI")  # magic + tamanho do cabeçalho comprimido
+
+# (conv_id, JSON da conversa ou JSON já comprimido com zlib, quente?)
+Record = Tuple[str, Union[str, bytes], bool]
+
+
+def write_snapshot(path: str, state: str, records: Iterable[Record], clean: bool) -> int:
+    """Grava o snapshot de forma atômica (síncrono: roda na thread do Snapshotter).
+
+    Layout: MAGIC, tamanho do cabeçalho, cabeçalho (JSON com zlib: estado do
+    manager + tabela id -> offset/tamanho/quente) e depois os registros, cada
+    um sendo o JSON de uma conversa comprimido com zlib. Registros que já vêm
+    comprimidos (store em memória) são copiados sem recomprimir. `state` já
+    vem em JSON (codificado no loop, onde o estado não muda no meio).
+    Devolve o tamanho do arquivo.
+    """
+    table, blobs, offset = [], [], 0
+    for conv_id, data, hot in records:
+        blob = zlib.compress(data.encode("utf-8")) if isinstance(data, str) else data
+        table.append((conv_id, offset, len(blob), int(hot)))
+        blobs.append(blob)
+        offset += len(blob)
+    meta = json.dumps({"saved_at": time.time(), "clean": clean, "records": table}, separators=(",", ":"))
+    header = zlib.compress((meta[:-1] + ',"state":' + state + "}").encode("utf-8"))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return _PREAMBLE.size + len(header) + offset
+
+
+class Snapshot:
+    """Snapshot aberto com mmap.
+
+    Só o cabeçalho é lido e decodificado na abertura; cada registro é um
+    slice do mapa, descomprimido (`load`) ou copiado ainda comprimido
+    (`packed`) apenas quando quem restaura pede.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise  # Arquivo vazio
+        try:
+            magic, size = _PREAMBLE.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError("formato de snapshot desconhecido")
+            header = json.loads(zlib.decompress(self._map[_PREAMBLE.size:_PREAMBLE.size + size]))
+        except Exception:
+            self.close()
+            raise
+        self._data_start = _PREAMBLE.size + size
+        self.saved_at: float = header["saved_at"]
+        self.clean: bool = header["clean"]  # Gravado no desligamento (e não periódico)
+        self.state: Dict[str, Any] = header["state"]
+        self.records: List[Tuple[str, int, int, int]] = header["records"]
+
+    @classmethod
+    def open(cls, path: str = SNAPSHOT_PATH, max_age: float = SNAPSHOT_MAX_AGE) -> Optional["Snapshot"]:
+        """Abre o snapshot, ou None se não existe, está corrompido ou é antigo demais."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            snapshot = cls(path)
+        except (OSError, ValueError, KeyError, zlib.error, struct.error) as e:
+            logger.warning("Snapshot %s ignorado: %s", path, e, extra={"event": "snapshot_invalid"})
+            return None
+        age = time.time() - snapshot.saved_at
+        if age > max_age:
+            logger.info("Snapshot %s ignorado: gravado há %.0fs", path, age, extra={"event": "snapshot_expired"})
+            snapshot.close()
+            return None
+        return snapshot
+
+    def packed(self, offset: int, length: int) -> bytes:
+        start = self._data_start + offset
+        return self._map[start:start + length]
+
+    def load(self, offset: int, length: int) -> str:
+        return zlib.decompress(self.packed(offset, length)).decode("utf-8")
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class Snapshotter:
+    """Grava o estado do chat periodicamente e uma última vez no desligamento.
+
+    `collect` roda no event loop e devolve (estado, registros); ele só junta
+    referências e serializa o cache quente. Compressão e escrita ficam numa
+    thread dedicada (uma só, então dois snapshots nunca se atropelam).
+    """
+
+    def __init__(self, collect: Callable[[], Tuple[Dict[str, Any], List[Record]]],
+                 path: str = SNAPSHOT_PATH, interval: float = SNAPSHOT_INTERVAL):
+        self.collect = collect
+        self.path = path
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-snapshot")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._periodic())
+
+    async def stop(self):
+        """Para o snapshot periódico e grava o final (marcado como `clean`)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.save(clean=True)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    async def save(self, clean: bool = False) -> int:
+        started = time.perf_counter()
+        state, records = self.collect()
+        state = json.dumps(state, separators=(",", ":"), default=str)
+        size = await asyncio.get_running_loop().run_in_executor(
+            self._executor, write_snapshot, self.path, state, records, clean)
+        logger.info("Snapshot gravado: %d conversa(s), %d bytes em %.1fms", len(records), size,
+                    (time.perf_counter() - started) * 1000,
+                    extra={"event": "snapshot_saved", "conversations": len(records), "bytes": size, "clean": clean})
+        return size
+
+    async def _periodic(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Erro ao gravar snapshot: %s", e, extra={"event": "snapshot_error"})
@@ -0,0 +1,556 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type, Union
+
+from pydantic import BaseModel
+
+from chat_index import DEFAULT_PAGE_SIZE, ConversationIndex
+from chat_search import DEFAULT_SEARCH_LIMIT, SearchIndex, analyze_json
+
+logger = logging.getLogger("chat.store")
+
+# --- Configuração da persistência de conversas ---
+# "memory" (padrão, some no restart), "file" (JSONL append-only), "sqlite" ou "mongo".
+CHAT_STORE = os.getenv("CHAT_STORE", "memory")
+SQLITE_PATH = os.getenv("CHAT_SQLITE_PATH", "conversations.sqlite3")
+ARCHIVE_PATH = os.getenv("CHAT_ARCHIVE_PATH", "conversations.jsonl")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "wpwebsolucoes")
+MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "conversations")
+MEMORY_STORE_MAX_DOCS = int(os.getenv("CHAT_MEMORY_STORE_MAX_DOCS", "5000"))  # Arquivadas no store em memória
+FILE_COMPACT_MIN_BYTES = 8 * 2 ** 20  # Abaixo disso o arquivo JSONL nunca é compactado
+FILE_COMPACT_RATIO = 2.0  # Compacta quando o arquivo passa desse múltiplo das versões vivas
+FLUSH_INTERVAL = 0.5  # Segundos entre gravações em lote
+FLUSH_BATCH_SIZE = 200  # Conversas por lote
+
+# --- Retenção: conversas fechadas saem do cache quente depois de gravadas ---
+RETENTION_MAX_CLOSED = int(os.getenv("CHAT_RETENTION_MAX_CLOSED", "500"))  # Fechadas mantidas em memória
+RETENTION_MAX_AGE = float(os.getenv("CHAT_RETENTION_MAX_AGE", "900"))  # Segundos após o fechamento
+
+
+# ---
+# --- Stores (síncronos, sempre chamados na thread de escrita)
+# ---
+
+class MemoryConversationStore:
+    """Store em memória: documentos JSON comprimidos com zlib.
+
+    Útil em testes e como padrão local. Mesmo sem disco, uma conversa
+    arquivada aqui ocupa uma fração do objeto Pydantic equivalente.
+    Guarda no máximo `max_docs` conversas: passando disso, as gravadas há
+    mais tempo são descartadas de vez (`write_batch` devolve quais).
+    Não sobrevive a um restart: o snapshot (ver chat_snapshot) copia os
+    documentos comprimidos como estão e `restore_packed` os devolve.
+    """
+
+    durable = False
+
+    def __init__(self, max_docs: int = MEMORY_STORE_MAX_DOCS):
+        self.max_docs = max_docs
+        self.docs: "OrderedDict[str, bytes]" = OrderedDict()  # Da gravação mais antiga para a mais nova
+        self._lock = threading.Lock()
+
+    def write_batch(self, docs: Dict[str, str]) -> List[str]:
+        packed = {conv_id: zlib.compress(data.encode("utf-8")) for conv_id, data in docs.items()}
+        with self._lock:
+            return self._put(packed)
+
+    def _put(self, packed: Dict[str, bytes]) -> List[str]:
+        for conv_id, data in packed.items():
+            self.docs[conv_id] = data
+            self.docs.move_to_end(conv_id)
+        dropped = []
+        while len(self.docs) > self.max_docs:
+            dropped.append(self.docs.popitem(last=False)[0])
+        return dropped
+
+    def load(self, conv_id: str) -> Optional[str]:
+        with self._lock:
+            packed = self.docs.get(conv_id)
+        return zlib.decompress(packed).decode("utf-8") if packed is not None else None
+
+    def load_all(self) -> List[str]:
+        with self._lock:
+            packed = list(self.docs.values())
+        return [zlib.decompress(data).decode("utf-8") for data in packed]
+
+    def packed(self) -> Dict[str, bytes]:
+        """Cópia rasa dos documentos ainda comprimidos."""
+        with self._lock:
+            return dict(self.docs)
+
+    def restore_packed(self, docs: Dict[str, bytes]) -> List[str]:
+        with self._lock:
+            return self._put(docs)
+
+    def close(self):
+        pass
+
+
+class FileConversationStore:
+    """Arquivo JSONL append-only: cada gravação acrescenta uma linha.
+
+    Só o índice id -> (offset, tamanho) fica em memória; `load` faz um seek
+    direto na última versão da conversa. O índice é reconstruído lendo o
+    arquivo uma vez na inicialização.
+    Versões antigas viram lixo no arquivo: quando ele passa de
+    `compact_min_bytes` e de `compact_ratio` vezes o tamanho das versões
+    vivas, é reescrito só com elas (arquivo temporário + `os.replace`, então
+    uma queda no meio deixa o original intacto).
+    """
+
+    durable = True
+
+    def __init__(self, path: str = ARCHIVE_PATH, compact_min_bytes: int = FILE_COMPACT_MIN_BYTES,
+                 compact_ratio: float = FILE_COMPACT_RATIO):
+        self.path = path
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_ratio = compact_ratio
+        self.index: Dict[str, tuple] = {}
+        self.size = 0  # Bytes no arquivo
+        self.live = 0  # Bytes das versões apontadas pelo índice
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b")
+        self._file.seek(0)
+        for line in self._file:
+            try:
+                conv_id = json.loads(line)["id"]
+                self._point(conv_id, self.size, len(line))
+            except (ValueError, KeyError):
+                pass  # Linha truncada (ex.: queda no meio de uma gravação)
+            self.size += len(line)
+        with self._lock:
+            self._maybe_compact()
+
+    def _point(self, conv_id: str, offset: int, length: int):
+        previous = self.index.get(conv_id)
+        if previous is not None:
+            self.live -= previous[1]
+        self.index[conv_id] = (offset, length)
+        self.live += length
+
+    def write_batch(self, docs: Dict[str, str]):
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            for conv_id, data in docs.items():
+                line = data.encode("utf-8") + b"\n"
+                self._file.write(line)
+                self._point(conv_id, offset, len(line))
+                offset += len(line)
+            self._file.flush()
+            self.size = offset
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.size > self.compact_min_bytes and self.size > self.compact_ratio * self.live:
+            self.compact()
+
+    def compact(self):
+        """Reescreve o arquivo só com a última versão de cada conversa (chamar com o lock)."""
+        before = self.size
+        temp_path = self.path + ".compact"
+        index: Dict[str, tuple] = {}
+        offset = 0
+        with open(temp_path, "wb") as out:
+            for conv_id, (position, length) in self.index.items():
+                self._file.seek(position)
+                out.write(self._file.read(length))
+                index[conv_id] = (offset, length)
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, self.path)
+        self._file.close()
+        self._file = open(self.path, "a+b")
+        self.index, self.size, self.live = index, offset, offset
+        logger.info("Arquivo de conversas compactado: %d -> %d bytes", before, offset,
+                    extra={"event": "store_compacted", "before": before, "after": offset})
+
+    def load(self, conv_id: str) -> Optional[str]:
+        with self._lock:
+            position = self.index.get(conv_id)
+            if position is None:
+                return None
+            self._file.seek(position[0])
+            return self._file.read(position[1]).decode("utf-8")
+
+    def load_all(self) -> List[str]:
+        return [doc for doc in (self.load(conv_id) for conv_id in list(self.index)) if doc is not None]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SQLiteConversationStore:
+    """Store em um arquivo SQLite: uma linha (id, json) por conversa."""
+
+    durable = True
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def write_batch(self, docs: Dict[str, str]):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO conversations (id, data, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(conv_id, data, now) for conv_id, data in docs.items()],
+            )
+
+    def load(self, conv_id: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_all(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT data FROM conversations")]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class MongoConversationStore:
+    """Store no MongoDB: um documento por conversa, `_id` = id da conversa."""
+
+    durable = True
+
+    def __init__(self, uri: str = MONGO_URI, database: str = MONGO_DB, collection: str = MONGO_COLLECTION):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(uri)
+        self.collection = self.client[database][collection]
+
+    def write_batch(self, docs: Dict[str, str]):
+        from pymongo import ReplaceOne
+
+        ops = []
+        for conv_id, data in docs.items():
+            doc = json.loads(data)
+            doc["_id"] = conv_id
+            ops.append(ReplaceOne({"_id": conv_id}, doc, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def load(self, conv_id: str) -> Optional[str]:
+        doc = self.collection.find_one({"_id": conv_id})
+        return self._to_json(doc) if doc else None
+
+    def load_all(self) -> List[str]:
+        return [self._to_json(doc) for doc in self.collection.find()]
+
+    @staticmethod
+    def _to_json(doc: dict) -> str:
+        doc.pop("_id", None)
+        return json.dumps(doc, default=str)
+
+    def close(self):
+        self.client.close()
+
+
+def create_conversation_store():
+    """Instancia o store configurado em CHAT_STORE."""
+    if CHAT_STORE == "mongo":
+        logger.info("Persistindo conversas no MongoDB (%s.%s)", MONGO_DB, MONGO_COLLECTION)
+        return MongoConversationStore()
+    if CHAT_STORE == "sqlite":
+        logger.info("Persistindo conversas no SQLite (%s)", SQLITE_PATH)
+        return SQLiteConversationStore()
+    if CHAT_STORE == "file":
+        logger.info("Persistindo conversas em %s", ARCHIVE_PATH)
+        return FileConversationStore()
+    logger.warning("Conversas só em memória (CHAT_STORE=memory): somem no restart e só as %d gravadas por "
+                   "último ficam arquivadas", MEMORY_STORE_MAX_DOCS, extra={"event": "store_not_durable"})
+    return MemoryConversationStore()
+
+
+# ---
+# --- Cache read-through com escrita em lote (write-behind)
+# ---
+
+class WriteBehindStore:
+    """Fachada assíncrona usada pelo backend do chat.
+
+    - `save` só marca a conversa como suja no cache (O(1), nunca toca o banco);
+    - uma task agrupa as conversas sujas a cada FLUSH_INTERVAL e grava o lote
+      numa thread dedicada, então o WebSocket nunca espera um round-trip;
+    - `get` lê do cache e, na falta, busca no store (na mesma thread) e guarda.
+    Várias alterações numa mesma conversa entre dois flushes viram uma gravação.
+
+    Retenção: conversas com status 'closed' ficam no cache no máximo
+    `max_closed_age` segundos e no máximo `max_closed` delas; depois de
+    gravadas, saem do cache e passam a existir só no store (o arquivo),
+    de onde `get` as carrega sob demanda.
+
+    `index` acompanha o cache quente (versões + índices secundários) e é o
+    que responde à listagem paginada de GET /conversations.
+    `text_index` é o índice de busca (GET /conversations/search): cobre o
+    cache e também as arquivadas, inclusive as que já estavam no store
+    quando o processo subiu (indexadas em segundo plano no `start`).
+    Conversas que o store descarta (o store em memória tem limite) saem
+    também do `text_index`.
+    """
+
+    def __init__(self, store, model: Type[BaseModel], cache: Optional[Dict[str, BaseModel]] = None,
+                 flush_interval: float = FLUSH_INTERVAL, batch_size: int = FLUSH_BATCH_SIZE,
+                 max_closed: int = RETENTION_MAX_CLOSED, max_closed_age: float = RETENTION_MAX_AGE):
+        self.store = store
+        self.model = model
+        self.cache: Dict[str, BaseModel] = cache if cache is not None else {}
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_closed = max_closed
+        self.max_closed_age = max_closed_age
+        self._dirty: Set[str] = set()
+        self._inflight: Set[str] = set()
+        self._unstored: Set[str] = set()  # No cache, mas já descartadas pelo store (ver _forget_dropped)
+        self._closed: "OrderedDict[str, float]" = OrderedDict()  # conv_id -> quando fechou (ordem de fechamento)
+        self.index = ConversationIndex()
+        self.text_index = SearchIndex()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-store")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._archive_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flusher())
+            self._archive_task = asyncio.create_task(self._index_archive())
+
+    async def stop(self):
+        for task in (self._task, self._archive_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._task, self._archive_task) if t is not None), return_exceptions=True)
+        self._task = self._archive_task = None
+        await self.flush()
+        await self._run(self.store.close)
+
+    def save(self, conv: BaseModel):
+        self.cache[conv.id] = conv
+        self._dirty.add(conv.id)
+        self._unstored.discard(conv.id)
+        self._track(conv)
+        self.index.update(conv)
+        self.text_index.update(conv)
+        if self._wakeup is not None and len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+
+    def _track(self, conv: BaseModel):
+        if getattr(conv, "status", None) == "closed":
+            if conv.id not in self._closed:
+                self._closed[conv.id] = time.monotonic()
+        else:
+            self._closed.pop(conv.id, None)
+
+    async def get(self, conv_id: str) -> Optional[BaseModel]:
+        conv = self.cache.get(conv_id)
+        if conv is not None:
+            return conv
+        raw = await self._run(self.store.load, conv_id)
+        if raw is None:
+            return None
+        # Outra corrotina pode ter carregado/criado a conversa enquanto esperávamos
+        conv = self.cache.get(conv_id)
+        if conv is None:
+            conv = self.cache[conv_id] = self.model.model_validate_json(raw)
+            self._track(conv)  # Arquivada lida sob demanda volta a ser elegível para sair do cache
+            # Ler não é alterar: sem versão nova no `index` (não aparece como delta no `since`)
+            self.text_index.update(conv)
+        return conv
+
+    def query(self, filters: Optional[Dict[str, str]] = None, since: Optional[int] = None,
+              cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[BaseModel], Optional[int]]:
+        """Uma página do cache quente via `index` (ver ConversationIndex.query)."""
+        conv_ids, next_cursor = self.index.query(filters, since, cursor, limit)
+        return [self.cache[conv_id] for conv_id in conv_ids], next_cursor
+
+    async def search(self, query: str, offset: int = 0,
+                     limit: int = DEFAULT_SEARCH_LIMIT) -> Tuple[List[BaseModel], int]:
+        """Conversas (quentes ou arquivadas) que batem com a busca, por relevância, e o total."""
+        conv_ids, total = self.text_index.search(query, offset, limit)
+        found = []
+        for conv_id in conv_ids:
+            conv = self.cache.get(conv_id) or await self.get(conv_id)
+            if conv is not None:
+                found.append(conv)
+        return found, total
+
+    async def _index_archive(self):
+        """Indexa para a busca as conversas que já estavam no store ao subir.
+
+        Leitura e análise rodam em threads; no loop fica só a inserção no
+        índice, em blocos, cedendo a vez entre eles. Conversas já indexadas
+        (quentes, gravadas enquanto isso) não são sobrescritas.
+        """
+        try:
+            raws = await self._run(self.store.load_all)
+            analyzed = await asyncio.to_thread(lambda: [analyze_json(raw) for raw in raws])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Busca sem as conversas arquivadas: %s", e, extra={"event": "search_archive_error"})
+            return
+        for i, item in enumerate(analyzed):
+            self.text_index.add_analyzed(*item)
+            if i % 1000 == 999:
+                await asyncio.sleep(0)
+        if analyzed:
+            logger.info("Busca: %d conversa(s) arquivada(s) indexadas", len(analyzed), extra={"event": "search_archive_indexed"})
+
+    async def list(self, include_archived: bool = False) -> List[BaseModel]:
+        """Conversas do cache quente; com `include_archived`, também as do store."""
+        if not include_archived:
+            return list(self.cache.values())
+        raws = await self._run(self.store.load_all)
+        merged: Dict[str, BaseModel] = {}
+        for raw in raws:
+            conv = self.model.model_validate_json(raw)
+            merged[conv.id] = conv
+        merged.update(self.cache)
+        return list(merged.values())
+
+    async def archive(self, convs: List[BaseModel]):
+        """Grava conversas direto no store, sem passar pelo cache (ex.: as que saem do Redis).
+
+        A versão gravada aqui é a mais nova: uma cópia pendente no cache é
+        descartada em vez de sobrescrevê-la no próximo flush.
+        """
+        docs = {conv.id: conv.model_dump_json() for conv in convs}
+        if not docs:
+            return
+        self._dirty.difference_update(docs)
+        dropped = await self._run(self.store.write_batch, docs)
+        for conv in convs:
+            self.text_index.update(conv)
+        self.evict(docs)
+        self._forget_dropped(dropped)
+
+    def _forget_dropped(self, dropped: Optional[List[str]]):
+        """Tira da busca o que o store descartou; se ainda está no cache, quando sair dele."""
+        for conv_id in dropped or ():
+            if conv_id in self.cache:
+                self._unstored.add(conv_id)
+            else:
+                self.text_index.discard(conv_id)
+
+    def evict(self, conv_ids: Iterable[str]) -> int:
+        """Tira conversas do cache (as ainda não gravadas ficam até o próximo flush)."""
+        evicted = 0
+        for conv_id in conv_ids:
+            if conv_id in self._dirty or conv_id in self._inflight:
+                continue
+            if self.cache.pop(conv_id, None) is not None:
+                evicted += 1
+            self._closed.pop(conv_id, None)
+            self.index.discard(conv_id)
+            if conv_id in self._unstored:
+                self._unstored.discard(conv_id)
+                self.text_index.discard(conv_id)
+        return evicted
+
+    def sweep(self) -> int:
+        """Arquiva (tira do cache) as fechadas mais antigas além do limite de idade/quantidade."""
+        expired = []
+        overflow = len(self._closed) - self.max_closed
+        deadline = time.monotonic() - self.max_closed_age
+        for conv_id, closed_at in self._closed.items():
+            if overflow <= 0 and closed_at > deadline:
+                break
+            expired.append(conv_id)
+            overflow -= 1
+        return self.evict(expired) if expired else 0
+
+    def snapshot_records(self) -> List[Tuple[str, Union[str, bytes], bool]]:
+        """Conversas para o snapshot de warm restart (ver chat_snapshot).
+
+        O cache quente vai como JSON (serializado aqui, no loop, pelo mesmo
+        motivo do `flush`). Se o store não sobrevive ao restart, as arquivadas
+        vão junto, ainda comprimidas como estão no store.
+        """
+        records = [(conv_id, conv.model_dump_json(), True) for conv_id, conv in self.cache.items()]
+        if not self.store.durable:
+            records.extend((conv_id, packed, False)
+                           for conv_id, packed in self.store.packed().items() if conv_id not in self.cache)
+        return records
+
+    def restore(self, snapshot, hot: bool = True) -> int:
+        """Recarrega as conversas de um snapshot aberto. Devolve quantas voltaram ao cache.
+
+        Só as quentes são decodificadas (voltam ao cache e ao índice); as
+        arquivadas são copiadas comprimidas para o store e só viram objeto
+        se alguém pedir (`get`). Com `hot=False` o cache não é tocado (store
+        durável com snapshot periódico: o store pode estar mais novo).
+        """
+        restored = 0
+        archived: Dict[str, bytes] = {}
+        for conv_id, offset, length, is_hot in snapshot.records:
+            if is_hot and hot:
+                conv = self.cache[conv_id] = self.model.model_validate_json(snapshot.load(offset, length))
+                self._track(conv)
+                self.index.update(conv)
+                self.text_index.update(conv)
+                if not self.store.durable:
+                    self._dirty.add(conv_id)  # Volta para o store em memória no próximo flush
+                restored += 1
+            elif not is_hot and not self.store.durable:
+                archived[conv_id] = snapshot.packed(offset, length)
+        if archived:
+            self._forget_dropped(self.store.restore_packed(archived))
+        return restored
+
+    async def flush(self):
+        while self._dirty:
+            batch_ids = []
+            while self._dirty and len(batch_ids) < self.batch_size:
+                batch_ids.append(self._dirty.pop())
+            # Serializa no loop (model_dump_json é rápido) para não ler objetos em mutação em outra thread
+            docs = {conv_id: self.cache[conv_id].model_dump_json() for conv_id in batch_ids if conv_id in self.cache}
+            self._inflight.update(batch_ids)
+            try:
+                dropped = await self._run(self.store.write_batch, docs)
+            except Exception as e:
+                logger.error("Erro ao gravar %d conversa(s): %s", len(docs), e, extra={"event": "store_write_error"})
+                self._dirty.update(batch_ids)
+                raise
+            finally:
+                self._inflight.difference_update(batch_ids)
+            self._forget_dropped(dropped)
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(self.flush_interval * 4)  # Banco fora do ar: tenta de novo depois
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
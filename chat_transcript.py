@@ -0,0 +1,225 @@
+import os
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pydantic_core import core_schema
+
+# --- Transcrição das conversas (Conversation.messages) em colunas ---
+# Cada mensagem ocupa uma posição em arrays de tamanho fixo (id em 16 bytes,
+# horário em microssegundos, remetente/status como código de um valor
+# internado) mais a referência ao texto; o dict da API só é montado quando
+# alguém lê a mensagem ou serializa a conversa.
+# A tabela de valores internados é de cada transcrição: remetentes/status
+# vindos do cliente não esgotam os códigos das outras conversas.
+MAX_INTERNED = 255  # Valores distintos de remetente/status/isBot por conversa (código de 1 byte)
+
+SHAPE_MESSAGE = 0  # {"id", "content", "sender", "timestamp", "status"}: formulário, cliente e agente
+SHAPE_HISTORY = 1  # {"text", "isBot", "timestamp"}: histórico com a IA
+SHAPE_RAW = 2  # Qualquer outro formato: guardado como veio
+
+STYLE_NAIVE = 0  # datetime.now().isoformat() do servidor
+STYLE_UTC_Z = 1  # Date.toISOString() do navegador ("...T13:45:00.123Z")
+STYLE_NONE = 2  # Sem horário (None)
+
+_MESSAGE_KEYS = frozenset(("id", "content", "sender", "timestamp", "status"))
+_HISTORY_KEYS = frozenset(("text", "isBot", "timestamp"))
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_UTC_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_ID = bytes(16)
+
+def _render_time(style: int, micros: int) -> Optional[str]:
+    if style == STYLE_NAIVE:
+        return (_NAIVE_EPOCH + micros * _MICROSECOND).isoformat()
+    if style == STYLE_UTC_Z:
+        moment = _UTC_EPOCH + micros * _MICROSECOND
+        return moment.strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % (moment.microsecond // 1000)
+    return None
+
+
+def _encode_time(value: Any) -> Optional[Tuple[int, int]]:
+    """(estilo, microssegundos desde 1970) de um horário que volta idêntico ao original; senão None."""
+    if value is None:
+        return STYLE_NONE, 0
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        style, micros = STYLE_NAIVE, (moment - _NAIVE_EPOCH) // _MICROSECOND
+    elif value.endswith("Z"):
+        style, micros = STYLE_UTC_Z, (moment - _UTC_EPOCH) // _MICROSECOND
+    else:
+        return None
+    if _render_time(style, micros) != value:
+        return None
+    return style, micros
+
+
+def _encode_id(value: Any) -> Optional[bytes]:
+    if not isinstance(value, str) or len(value) != 36:
+        return None
+    try:
+        parsed = uuid.UUID(value)
+    except ValueError:
+        return None
+    return parsed.bytes if str(parsed) == value else None
+
+
+def _new_id() -> bytes:
+    """uuid4 em bytes direto do os.urandom (o uuid.uuid4() custa várias vezes mais)."""
+    raw = bytearray(os.urandom(16))
+    raw[6] = raw[6] & 0x0F | 0x40  # Versão 4
+    raw[8] = raw[8] & 0x3F | 0x80  # Variante RFC 4122
+    return bytes(raw)
+
+
+def _format_id(raw: bytes) -> str:
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class Transcript:
+    """Mensagens de uma conversa, append-only, guardadas em colunas.
+
+    Substitui a lista de dicts em `Conversation.messages` sem mudar o que a
+    API entrega: ler uma posição (ou fatia) devolve o dict de sempre, montado
+    na hora, e a serialização do modelo gera a mesma lista de dicts. Por
+    mensagem ficam ~36 bytes fixos mais o texto, contra algumas centenas de
+    um dict com o uuid e o horário ISO como strings.
+    Mensagens que não seguem um dos formatos conhecidos (ou cujo id/horário
+    não voltaria idêntico) são guardadas como vieram.
+    Os dicts devolvidos são cópias: para registrar algo, use `append`/`add`.
+    """
+
+    __slots__ = ("_shapes", "_styles", "_senders", "_statuses", "_times", "_ids", "_texts", "_raw", "_values", "_codes",
+                 "persisted")
+
+    def __init__(self, messages: Iterable[dict] = ()):
+        self._shapes = array("B")
+        self._styles = array("B")
+        self._senders = array("B")  # Código do `sender` (ou do `isBot`, no histórico)
+        self._statuses = array("B")
+        self._times = array("q")  # Microssegundos desde 1970
+        self._ids = bytearray()  # 16 bytes por mensagem
+        self._texts: List[Optional[str]] = []
+        self._raw: Dict[int, dict] = {}  # posição -> mensagem guardada como veio
+        self._values: List[Any] = []  # Valores internados desta conversa (a chave inclui o tipo: True != 1 aqui)
+        self._codes: Dict[Tuple[type, Any], int] = {}
+        self.persisted: Optional[int] = None  # Mensagens que já estavam gravadas quando foi carregada (ver RedisBackend)
+        for message in messages:
+            self.append(message)
+
+    def _intern(self, value: Any) -> Optional[int]:
+        if not isinstance(value, (str, bool)):
+            return None
+        key = (type(value), value)
+        code = self._codes.get(key)
+        if code is None:
+            if len(self._values) >= MAX_INTERNED:
+                return None  # Tabela cheia: a mensagem é guardada como veio
+            code = self._codes[key] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def _push(self, shape: int, style: int, sender: int, status: int, micros: int, message_id: bytes, text: Optional[str]):
+        self._shapes.append(shape)
+        self._styles.append(style)
+        self._senders.append(sender)
+        self._statuses.append(status)
+        self._times.append(micros)
+        self._ids += message_id
+        self._texts.append(text)
+
+    def append(self, message: dict):
+        """Acrescenta uma mensagem no formato da API (O(1))."""
+        keys = message.keys() if isinstance(message, dict) else None
+        if keys == _MESSAGE_KEYS:
+            message_id = _encode_id(message["id"])
+            sender = self._intern(message["sender"])
+            status = self._intern(message["status"])
+            encoded = _encode_time(message["timestamp"])
+            content = message["content"]
+            if None not in (message_id, sender, status, encoded) and isinstance(content, str):
+                self._push(SHAPE_MESSAGE, encoded[0], sender, status, encoded[1], message_id, content)
+                return
+        elif keys == _HISTORY_KEYS:
+            is_bot = message["isBot"]
+            sender = self._intern(is_bot) if isinstance(is_bot, bool) else None
+            encoded = _encode_time(message["timestamp"])
+            text = message["text"]
+            if sender is not None and encoded is not None and isinstance(text, str):
+                self._push(SHAPE_HISTORY, encoded[0], sender, 0, encoded[1], _NO_ID, text)
+                return
+        self._raw[len(self._texts)] = dict(message)
+        self._push(SHAPE_RAW, STYLE_NONE, 0, 0, 0, _NO_ID, None)
+
+    def add(self, content: str, sender: str, status: str = "sent") -> str:
+        """Registra uma mensagem nova, com id e horário (do servidor) gerados aqui. Devolve o id."""
+        message_id = _new_id()
+        sender_code = self._intern(sender)
+        status_code = self._intern(status)
+        now = datetime.now()
+        if sender_code is None or status_code is None:
+            self.append({"id": _format_id(message_id), "content": content, "sender": sender,
+                         "timestamp": now.isoformat(), "status": status})
+        else:
+            self._push(SHAPE_MESSAGE, STYLE_NAIVE, sender_code, status_code,
+                       (now - _NAIVE_EPOCH) // _MICROSECOND, message_id, content)
+        return _format_id(message_id)
+
+    def extend(self, messages: Iterable[dict]):
+        for message in messages:
+            self.append(message)
+
+    def _message(self, i: int) -> dict:
+        shape = self._shapes[i]
+        if shape == SHAPE_RAW:
+            return dict(self._raw[i])
+        timestamp = _render_time(self._styles[i], self._times[i])
+        if shape == SHAPE_HISTORY:
+            return {"text": self._texts[i], "isBot": self._values[self._senders[i]], "timestamp": timestamp}
+        return {"id": _format_id(self._ids[16 * i:16 * i + 16]), "content": self._texts[i],
+                "sender": self._values[self._senders[i]], "timestamp": timestamp,
+                "status": self._values[self._statuses[i]]}
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[dict, List[dict]]:
+        if isinstance(index, slice):
+            return [self._message(i) for i in range(*index.indices(len(self._texts)))]
+        if index < 0:
+            index += len(self._texts)
+        if not 0 <= index < len(self._texts):
+            raise IndexError("mensagem fora da transcrição")
+        return self._message(index)
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self._message(i) for i in range(len(self._texts)))
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Transcript, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def to_list(self) -> List[dict]:
+        return [self._message(i) for i in range(len(self._texts))]
+
+    def __repr__(self) -> str:
+        return f"Transcript({len(self._texts)} mensagem(ns))"
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler) -> core_schema.CoreSchema:
+        # Entra como lista de dicts (ou Transcript pronto); sai como lista de dicts
+        as_list = handler.generate_schema(List[Dict[str, Any]])
+        from_list = core_schema.no_info_after_validator_function(cls, as_list)
+        return core_schema.json_or_python_schema(
+            json_schema=from_list,
+            python_schema=core_schema.union_schema([core_schema.is_instance_schema(cls), from_list]),
+            serialization=core_schema.plain_serializer_function_ser_schema(cls.to_list, return_schema=as_list),
+        )
@@ -0,0 +1,171 @@
+import json
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from chat_frames import encode_frame, retain_messages
+
+# --- Formato dos frames do /ws/chat, negociado no agent_auth/user_join ---
+# O primeiro frame do cliente é sempre JSON em texto e pode pedir:
+#   "protocol": "json" (padrão) | "msgpack"
+#   "compression": "none" (padrão) | "deflate"
+# Se pediu algo além do padrão, o servidor responde (ainda em JSON texto)
+# {"type": "protocol", "protocol": ..., "compression": ...} com o que foi
+# aceito e, a partir daí, nos dois sentidos:
+#   - frame de texto: JSON, como sempre;
+#   - frame binário: 1 byte de flags + payload. Flags: bit 0 = payload
+#     comprimido com deflate cru (zlib wbits=-15, "deflate-raw" do
+#     DecompressionStream dos navegadores); bit 1 = payload em MessagePack
+#     (senão é JSON em UTF-8).
+# Com "deflate", frames menores que WIRE_COMPRESSION_MIN_BYTES saem sem
+# compressão (binários só se o protocolo for msgpack).
+# A compressão é por mensagem, na aplicação: o permessage-deflate do próprio
+# WebSocket é negociado no handshake pelo servidor ASGI, não por mensagem do
+# chat, e não dá para ligar só para quem pediu no agent_auth/user_join.
+WIRE_COMPRESSION_MIN_BYTES = 512
+WIRE_COMPRESSION_LEVEL = 1  # No event loop: nível 1 custa metade da CPU do 6 e comprime só ~2% menos
+WIRE_MAX_INBOUND_BYTES = 1024 * 1024  # Limite do frame recebido depois de descomprimido
+WIRE_CACHE_SIZE = 64  # Frames recodificados guardados (um broadcast recodifica uma vez por formato)
+WIRE_CACHE_MAX_FRAME = 256 * 1024  # Frames maiores (ex.: snapshot de um agente) não entram no cache
+
+FLAG_DEFLATE = 0x01
+FLAG_MSGPACK = 0x02
+
+# --- MessagePack ---
+# Dependência do projeto; se faltar no ambiente, pedidos de "msgpack" caem para JSON.
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende do ambiente
+    msgpack = None
+
+PROTOCOLS = ("json", "msgpack") if msgpack is not None else ("json",)
+COMPRESSIONS = ("none", "deflate")
+
+Payload = Union[str, bytes]
+
+_cache: "OrderedDict[Tuple[str, bool, str], Payload]" = OrderedDict()
+
+
+def negotiate(data: Dict[str, Any]) -> Tuple[str, str]:
+    """(protocolo, compressão) aceitos para o que o cliente pediu; o não suportado vira o padrão."""
+    protocol = data.get("protocol")
+    compression = data.get("compression")
+    return (protocol if protocol in PROTOCOLS else "json",
+            compression if compression in COMPRESSIONS else "none")
+
+
+def encode_payload(frame: str, protocol: str, deflate: bool) -> Payload:
+    """Converte um frame JSON (texto, ver chat_frames) para o formato negociado.
+
+    O MessagePack sai da mensagem de origem (`Frame.message`) quando o frame
+    a traz; só frames sem ela (ex.: montados antes do primeiro cliente
+    MessagePack, ou vindos de outro worker) têm o JSON decodificado.
+    """
+    if protocol == "msgpack":
+        flags = FLAG_MSGPACK
+        message = getattr(frame, "message", None)
+        body = msgpack.packb(json.loads(frame) if message is None else message, use_bin_type=True)
+    elif deflate and len(frame) >= WIRE_COMPRESSION_MIN_BYTES:
+        flags = 0
+        body = frame.encode("utf-8")
+    else:
+        return frame
+    if deflate and len(body) >= WIRE_COMPRESSION_MIN_BYTES:
+        compressor = zlib.compressobj(WIRE_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+        body = compressor.compress(body) + compressor.flush()
+        flags |= FLAG_DEFLATE
+    return bytes((flags,)) + body
+
+
+def decode_payload(data: bytes) -> Any:
+    """Decodifica um frame binário recebido (flags + payload)."""
+    if not data:
+        raise ValueError("frame binário vazio")
+    flags, body = data[0], data[1:]
+    if flags & FLAG_DEFLATE:
+        decompressor = zlib.decompressobj(-15)
+        body = decompressor.decompress(body, WIRE_MAX_INBOUND_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError("frame descomprimido maior que o limite")
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise ValueError("MessagePack não disponível")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+def _encode_cached(frame: str, protocol: str, deflate: bool) -> Payload:
+    if len(frame) > WIRE_CACHE_MAX_FRAME:
+        return encode_payload(frame, protocol, deflate)
+    key = (protocol, deflate, frame)
+    payload = _cache.get(key)
+    if payload is None:
+        payload = _cache[key] = encode_payload(frame, protocol, deflate)
+        if len(_cache) > WIRE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return payload
+
+
+class WireSocket:
+    """WebSocket de um cliente que negociou MessagePack e/ou compressão.
+
+    Imita a interface de `WebSocket` que o `ConnectionManager` usa: quem
+    envia continua passando o frame JSON já codificado (`send_text`) ou um
+    dict (`send_json`), e a conversão para o formato negociado acontece aqui.
+    O mesmo frame mandado para vários sockets com o mesmo formato (broadcast
+    para os agentes) é convertido uma vez só (cache pequeno por frame).
+    Clientes que ficam no JSON padrão não passam por esta classe.
+    """
+
+    def __init__(self, websocket: WebSocket, protocol: str, compression: str):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.compression = compression
+        self._deflate = compression == "deflate"
+
+    async def send_text(self, frame: str):
+        payload = _encode_cached(frame, self.protocol, self._deflate)
+        if isinstance(payload, str):
+            await self.websocket.send_text(payload)
+        else:
+            await self.websocket.send_bytes(payload)
+
+    async def send_json(self, message: dict):
+        await self.send_text(encode_frame(message))
+
+    async def receive_json(self) -> Any:
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        text = message.get("text")
+        if text is not None:
+            return json.loads(text)
+        return decode_payload(message["bytes"])
+
+    def __getattr__(self, name: str) -> Any:
+        # close, client, client_state, ... vão direto para o WebSocket
+        return getattr(self.websocket, name)
+
+    def __repr__(self) -> str:
+        return f"WireSocket({self.protocol}/{self.compression})"
+
+
+async def negotiate_socket(websocket: WebSocket, data: Dict[str, Any]) -> Union[WebSocket, WireSocket]:
+    """Aplica o formato pedido no primeiro frame e confirma ao cliente.
+
+    Sem pedido (ou pedindo o padrão) devolve o próprio `websocket`, sem custo
+    nenhum para os clientes JSON de hoje.
+    """
+    if "protocol" not in data and "compression" not in data:
+        return websocket
+    protocol, compression = negotiate(data)
+    if protocol == "msgpack":
+        retain_messages()
+    await websocket.send_text(encode_frame({"type": "protocol", "protocol": protocol, "compression": compression}))
+    if protocol == "json" and compression == "none":
+        return websocket
+    return WireSocket(websocket, protocol, compression)
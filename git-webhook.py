@@ -1,27 +1,270 @@
 #!/usr/bin/env python3
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import Depends, FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
 import hmac
 import hashlib
-import subprocess
 import os
 import logging
-from typing import Dict, Any
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional
 
 # ===================== CONFIGURAÇÃO =====================
 SECRET = "777-Rroot"  
+# Token (Authorization: Bearer ...) exigido em /deploys, que expõe a saída do script.
+# Sem ele, /deploys fica desligado (não reaproveita o SECRET do webhook)
+DEPLOYS_TOKEN = os.getenv("DEPLOYS_TOKEN", "")
 BRANCH = "refs/heads/main"
-DEPLOY_SCRIPT = "/home/ubuntu/WpWebSolucoes/deploy.sh"
-WORK_DIR = "/home/ubuntu/WpWebSolucoes"
+# Caminhos sobrescrevíveis por variável de ambiente para testar localmente
+# com um script de deploy falso, ex.:
+#   DEPLOY_SCRIPT=./stub_deploy.sh WORK_DIR=. WEBHOOK_LOG_FILE=webhook.log uvicorn ...
+DEPLOY_SCRIPT = os.getenv("DEPLOY_SCRIPT", "/home/ubuntu/WpWebSolucoes/deploy.sh")
+WORK_DIR = os.getenv("WORK_DIR", "/home/ubuntu/WpWebSolucoes")
+LOG_FILE = os.getenv("WEBHOOK_LOG_FILE", "/home/ubuntu/webhook.log")
+DEPLOY_TIMEOUT = float(os.getenv("DEPLOY_TIMEOUT", "900"))  # Segundos até matar o script
+DEPLOY_HISTORY = 50  # Deploys finalizados mantidos para consulta em /deploys
+DEPLOY_OUTPUT_MAX_LINES = 5000  # Linhas de saída guardadas por deploy
 
 # Logging
 logging.basicConfig(
-    filename="/home/ubuntu/webhook.log",
+    filename=LOG_FILE,
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-app = FastAPI(title="GitHub Webhook → Autodeploy")
+class DeployJob:
+    """Um deploy na fila: estado, saída capturada e aviso de mudanças para quem acompanha."""
+
+    def __init__(self, job_id: int, sha: str, pusher: str):
+        self.id = job_id
+        self.sha = sha
+        self.pushers: List[str] = [pusher]
+        self.pushes = 1  # Quantos pushes foram agrupados neste deploy
+        self.status = "queued"  # queued -> running -> succeeded | failed
+        self.returncode: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.output: List[str] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def _notify(self):
+        # Acorda quem está esperando e arma um evento novo para a próxima mudança
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, line: str):
+        if len(self.output) < DEPLOY_OUTPUT_MAX_LINES:
+            self.output.append(line)
+        elif len(self.output) == DEPLOY_OUTPUT_MAX_LINES:
+            self.output.append("... (saída truncada)")
+        else:
+            return
+        self._notify()
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._notify()
+
+    def finish(self, returncode: Optional[int]):
+        self.returncode = returncode
+        self.status = "succeeded" if returncode == 0 else "failed"
+        self.finished_at = time.time()
+        self._notify()
+
+    def summary(self) -> str:
+        if self.done:
+            return f"# deploy {self.id} {self.status} (exit {self.returncode})"
+        return f"# deploy {self.id} {self.status} sha={self.sha} pusher={self.pushers[-1]}"
+
+    def to_dict(self, with_output: bool = False) -> Dict[str, Any]:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "sha": self.sha,
+            "pushers": self.pushers,
+            "pushes": self.pushes,
+            "returncode": self.returncode,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if with_output:
+            data["output"] = self.output
+        return data
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Linhas de status e de saída desde o início, até o deploy terminar."""
+        sent = 0
+        status = None
+        while True:
+            changed = self._changed
+            if self.status != status and not self.done:
+                status = self.status
+                yield self.summary()
+            while sent < len(self.output):
+                yield self.output[sent]
+                sent += 1
+            if self.done:
+                yield self.summary()
+                return
+            await changed.wait()
+
+
+class DeployQueue:
+    """Fila de deploys executada por uma única task em segundo plano.
+
+    Há no máximo um deploy rodando e um esperando. Pushes que chegam enquanto
+    já existe um deploy na espera são agrupados nele: só o `after` mais recente
+    é implantado, uma vez. O script roda como subprocesso assíncrono, então o
+    webhook continua respondendo durante o deploy.
+    """
+
+    def __init__(self, script: str = DEPLOY_SCRIPT, work_dir: str = WORK_DIR, branch: str = BRANCH,
+                 timeout: float = DEPLOY_TIMEOUT, history: int = DEPLOY_HISTORY):
+        self.script = script
+        self.work_dir = work_dir
+        self.branch = branch
+        self.timeout = timeout
+        self.history = history
+        self.jobs: "OrderedDict[int, DeployJob]" = OrderedDict()
+        self.pending: Optional[DeployJob] = None
+        self.running: Optional[DeployJob] = None
+        self._next_id = 1
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def submit(self, sha: str, pusher: str) -> DeployJob:
+        """Enfileira o deploy de `sha`, reaproveitando o que já está na espera."""
+        running = self.running
+        if running is not None and running.sha == sha and self.pending is None:
+            return running  # Reentrega do mesmo push: o deploy já está rodando
+        job = self.pending
+        if job is not None:
+            job.sha = sha
+            job.pushes += 1
+            if job.pushers[-1] != pusher:
+                job.pushers.append(pusher)
+            job._notify()
+            logging.info(f"Push de {pusher} ({sha}) agrupado no deploy {job.id}")
+            return job
+        job = DeployJob(self._next_id, sha, pusher)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self.pending = job
+        self._trim()
+        self._wakeup.set()
+        logging.info(f"Deploy {job.id} enfileirado por {pusher} ({sha})")
+        return job
+
+    def get(self, job_id: int) -> Optional[DeployJob]:
+        return self.jobs.get(job_id)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _run_forever(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending is not None:
+                job, self.pending = self.pending, None
+                self.running = job
+                try:
+                    await self.run_deploy(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"Erro ao executar deploy {job.id}: {e}")
+                    if not job.done:
+                        job.append(f"Erro ao executar deploy: {e}")
+                        job.finish(None)
+                finally:
+                    self.running = None
+
+    async def run_deploy(self, job: DeployJob):
+        pusher = job.pushers[-1]
+        logging.info(f"Deploy {job.id} iniciado por {pusher} ({job.sha})")
+        job.start()
+        env = dict(os.environ, DEPLOY_SHA=job.sha, DEPLOY_ID=str(job.id))
+        proc = await asyncio.create_subprocess_exec(
+            self.script, pusher, self.branch,
+            cwd=self.work_dir,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        try:
+            # O prazo vale até o script sair, não só até ele fechar a saída
+            returncode = await asyncio.wait_for(self._run_to_exit(proc, job), self.timeout)
+        except asyncio.TimeoutError:
+            await self._kill(proc)
+            job.append(f"Deploy excedeu {self.timeout:.0f}s e foi interrompido")
+            returncode = None
+        except asyncio.CancelledError:
+            await self._kill(proc)
+            job.append("Deploy interrompido (webhook encerrado)")
+            job.finish(None)
+            raise
+        job.finish(returncode)
+        if returncode == 0:
+            logging.info(f"Deploy {job.id} OK ({job.sha})")
+        else:
+            tail = "\n".join(job.output[-20:])
+            logging.error(f"Deploy {job.id} FALHOU (exit {returncode}): {tail}")
+
+    @staticmethod
+    async def _run_to_exit(proc: asyncio.subprocess.Process, job: DeployJob) -> int:
+        async for raw in proc.stdout:
+            job.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+        return await proc.wait()
+
+    @staticmethod
+    async def _kill(proc: asyncio.subprocess.Process):
+        """Mata o script e espera ele sair (sem deixar processo zumbi)."""
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass  # Já tinha saído
+        await proc.wait()
+
+
+deploys = DeployQueue()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not DEPLOYS_TOKEN:
+        logging.warning("DEPLOYS_TOKEN não definido: /deploys desligado")
+    deploys.start()
+    yield
+    await deploys.stop()
+
+
+app = FastAPI(title="GitHub Webhook → Autodeploy", lifespan=lifespan)
 
 class GitHubPayload(BaseModel):
     ref: str
@@ -40,23 +283,12 @@ def verify_signature(request: Request, body: bytes) -> bool:
     mac = hmac.new(SECRET.encode(), msg=body, digestmod=hashlib.sha256)
     return hmac.compare_digest(mac.hexdigest(), signature)
 
-def run_deploy(pusher_name: str):
-    try:
-        logging.info(f"Deploy iniciado por {pusher_name}")
-        result = subprocess.run(
-            [DEPLOY_SCRIPT, pusher_name, BRANCH],
-            cwd=WORK_DIR,
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            logging.info(f"Deploy OK: {result.stdout}")
-        else:
-            logging.error(f"Deploy FALHOU: {result.stderr}")
-        return result
-    except Exception as e:
-        logging.error(f"Erro ao executar deploy: {e}")
-        raise
+def require_deploys_token(request: Request):
+    if not DEPLOYS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), DEPLOYS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
 
 @app.post("/webhook")
 async def github_webhook(request: Request):
@@ -81,27 +313,60 @@ async def github_webhook(request: Request):
 
     ref = payload.get("ref")
     pusher = payload.get("pusher", {}).get("name", "unknown")
+    sha = payload.get("after") or ""
 
-    # 5. Só deploy no branch main
-    if ref != BRANCH:
+    # 5. Só deploy no branch main (e não quando o branch é apagado)
+    if ref != BRANCH or payload.get("deleted"):
         logging.info(f"Ignorando branch: {ref}")
         return {"status": "ignored", "branch": ref}
 
-    # 6. EXECUTAR DEPLOY
+    # 6. ENFILEIRAR DEPLOY (responde na hora; o deploy roda em segundo plano)
     logging.info(f"Deploy TRIGGERED por {pusher} em {ref}")
     print(f"Deploy TRIGGERED por {pusher} em {ref}")
-    try:
-        run_deploy(pusher)
-    except Exception as e:
-        logging.error(f"Erro ao executar deploy: {e}")
-        print(f"ERRO AO EXECUTAR DEPLOY: {e}")
-    return {
-        "status": "deploy_triggered",
-        "pusher": pusher,
-        "branch": ref,
-        "message": "Deploy em andamento..."
-    }
+    job = deploys.submit(sha, pusher)
+    return JSONResponse(
+        status_code=202,
+        headers={"Location": f"/deploys/{job.id}"},
+        content={
+            "status": "deploy_queued",
+            "deploy_id": job.id,
+            "deploy_status": job.status,
+            "sha": job.sha,
+            "pushes": job.pushes,
+            "pusher": pusher,
+            "branch": ref,
+            "url": f"/deploys/{job.id}",
+            "message": "Deploy em andamento...",
+        },
+    )
+
+@app.get("/deploys", dependencies=[Depends(require_deploys_token)])
+def list_deploys():
+    return {"deploys": [job.to_dict() for job in reversed(deploys.jobs.values())]}
+
+@app.get("/deploys/{deploy_id}", dependencies=[Depends(require_deploys_token)])
+async def get_deploy(deploy_id: int, follow: bool = True):
+    """Saída do deploy em texto, ao vivo até terminar
+    (`curl -N -H "Authorization: Bearer $DEPLOYS_TOKEN"`).
+
+    Com `follow=false` devolve só o estado atual em JSON, com a saída até agora.
+    """
+    job = deploys.get(deploy_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deploy not found")
+    if not follow:
+        return job.to_dict(with_output=True)
+
+    async def stream():
+        async for line in job.follow():
+            yield line + "\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/")
 def root():
-    return {"status": "webhook ativo", "endpoint": "/webhook"}
\ No newline at end of file
+    return {"status": "webhook ativo", "endpoint": "/webhook", "deploys": "/deploys"}
@@ -1,15 +1,34 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
+from fastapi.responses import FileResponse, Response
+
+from static_assets import ASSETS_URL_PREFIX, IMMUTABLE_CACHE_CONTROL, STATIC_DIR, STATIC_URL_PREFIX, AssetManifest
+
+TEMPLATES_DIR = "templates"
+TEMPLATE_CHECK_INTERVAL = 1.0  # Segundos entre verificações de mudança nos templates
+ERROR_PAGES = frozenset({"404"})  # Templates que só servem de corpo de erro: nunca viram rota
 
 
 app = FastAPI()
 
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Arquivos estáticos com hash + gzip/brotli, gerados na inicialização (ver static_assets.py).
+# O /static continua servindo os originais para referências sem hash.
+assets = AssetManifest()
+assets.build()
+templates.env.globals["asset_url"] = assets.url
+
+app.mount(STATIC_URL_PREFIX, StaticFiles(directory=STATIC_DIR), name="static")
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,14 +38,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class PageCache:
+    """Páginas do site renderizadas uma vez e servidas da memória.
+
+    Os templates não dependem da requisição, então cada um é renderizado no
+    primeiro acesso e guardado com um ETag forte (hash do conteúdo). A lista
+    de páginas existentes é montada a partir da pasta de templates, então um
+    nome desconhecido vai direto para o 404 sem tentar carregar template.
+    As páginas de erro (ERROR_PAGES) ficam fora dessa lista: só saem pelo
+    `error_page`, como corpo da resposta de erro.
+    A cada TEMPLATE_CHECK_INTERVAL as datas de modificação da pasta são
+    conferidas; se algo mudou, a lista e as páginas são refeitas.
+    """
+
+    def __init__(self, directory: str = TEMPLATES_DIR, check_interval: float = TEMPLATE_CHECK_INTERVAL):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.pages: Dict[str, Tuple[bytes, str]] = {}  # nome -> (html, etag)
+        self.allowed = frozenset()
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        self._check()
+        if name not in self.allowed:
+            return None
+        return self._load(name)
+
+    def error_page(self, name: str) -> Tuple[bytes, str]:
+        self._check()
+        return self._load(name)
+
+    def _check(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if self._scan()[1] != self._signature:
+                self._refresh()
+
+    def _load(self, name: str) -> Tuple[bytes, str]:
+        page = self.pages.get(name)
+        if page is None:
+            with self._lock:
+                page = self.pages.get(name)
+                if page is None:
+                    html = templates.get_template(name + ".html").render().encode("utf-8")
+                    page = self.pages[name] = (html, '"%s"' % hashlib.sha256(html).hexdigest()[:32])
+        return page
+
+    def _scan(self) -> Tuple[frozenset, tuple]:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".html"):
+                    stat = entry.stat()
+                    entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        entries.sort()
+        return frozenset(name[:-5] for name, _, _ in entries) - ERROR_PAGES, tuple(entries)
+
+    def _refresh(self):
+        with self._lock:
+            self.allowed, self._signature = self._scan()
+            self.pages = {}
+
+
+page_cache = PageCache()
+
+
+def page_response(request: Request, page: Optional[Tuple[bytes, str]]) -> Response:
+    """Página já buscada no cache (uma busca só); sem página, o 404, que nunca vira 304."""
+    if page is None:
+        html, _ = page_cache.error_page("404")
+        return Response(content=html, status_code=404, media_type="text/html; charset=utf-8",
+                        headers={"Cache-Control": "no-cache"})
+    html, etag = page
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(content=html, media_type="text/html; charset=utf-8", headers=headers)
+
+
+@app.get(ASSETS_URL_PREFIX + "/{asset_path:path}")
+async def get_asset(request: Request, asset_path: str):
+    found = assets.resolve(asset_path, request.headers.get("accept-encoding", ""))
+    if found is None:
+        return Response(status_code=404)
+    path, media_type, encoding = found
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 @app.get("/")
-def get_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+async def get_index(request: Request):
+    return page_response(request, page_cache.get("index"))
 
 
 @app.get("/{page_name}")
-def get_page(request: Request, page_name: str = None):
-    try:
-        return templates.TemplateResponse(page_name + ".html", {"request": request})
-    except Exception:
-        return templates.TemplateResponse("404.html", {"request": request})
\ No newline at end of file
+async def get_page(request: Request, page_name: str = None):
+    return page_response(request, page_cache.get(page_name))
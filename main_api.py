@@ -1,28 +1,118 @@
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Query, status, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Set, Tuple, Union
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 import argon2
-from argon2.exceptions import VerifyMismatchError
 import uuid
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from chat_backend import InMemoryBackend, RemotePeer, create_backend
+from chat_eta import HandlingStats, QueueNotifier, estimate_wait_seconds, wait_minutes
+from chat_events import EventLog
+from chat_frames import encode_event, encode_frame
+from chat_heartbeat import HEARTBEAT_CLOSE_CODE, HeartbeatMonitor
+from chat_index import clamp_page_size
+from chat_limits import InboundLimiter, RATE_LIMIT_CLOSE_CODE, TypingCoalescer
+from chat_logging import setup_logging
+from chat_metrics import GUEST_SEND_ERROR, REGISTRY, WAIT_BUCKETS, Counter, Gauge, Histogram
+from chat_outbox import AgentOutbox, DetachedGuest
+from chat_queue import WaitingGuest
+from chat_routing import AgentRouter, DEFAULT_AGENT_CAPACITY
+from chat_search import clamp_search_limit
+from chat_snapshot import SNAPSHOT_PATH, Snapshot, Snapshotter
+from chat_store import WriteBehindStore, create_conversation_store
+from chat_transcript import Transcript
+from chat_wire import negotiate_socket
+from password_pool import PasswordPool, PasswordPoolBusy
+from token_cache import TokenCache
+
+setup_logging() # Logs em JSON escritos por uma thread (ver chat_logging)
+logger = logging.getLogger("chat")
 
 # --- Configuração de Autenticação (JWT) ---
 SECRET_KEY = "SUA_CHAVE_SECRETA_MUITO_SEGURA_AQUI"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
+# --- Configuração da Fila de Atendimento ---
+AVERAGE_CHAT_MINUTES = 5 # Duração de um atendimento na estimativa de espera enquanto não há histórico (ver chat_eta)
+URGENCY_PRIORITY = {"alta": 2, "media": 1} # Urgência do formulário -> prioridade na fila (padrão 0)
+PROJECT_DEPARTMENTS: Dict[str, str] = {} # Tipo de projeto -> departamento preferido (ex.: {"sistema": "Suporte"})
+RESUME_PRIORITY = max(URGENCY_PRIORITY.values()) + 1 # Cliente que estava em atendimento antes de um restart volta na frente
+
+# --- Warm restart (deploys) ---
+SERVICE_RESTART_CODE = 1012 # Código de fechamento "Service Restart" (o uvicorn usa o mesmo ao desligar)
+DRAIN_TIMEOUT = 5.0 # Segundos esperando as filas de saída dos agentes esvaziarem no desligamento
+RESUME_GRACE_SECONDS = 120.0 # Tempo para o cliente voltar (com o token de retomada) antes de a conversa ser encerrada
+
+# --- Retomada de sessão do cliente (quedas de rede) ---
+GUEST_RESUME_GRACE_SECONDS = 60.0 # Cliente que caiu mantém conversa, lugar na fila e agente por esse tempo (0 desliga)
+GUEST_FINAL_CLOSE_CODES = (1000, 1001, RATE_LIMIT_CLOSE_CODE) # Fechamentos em que o cliente saiu de verdade
+RESUME_TOKEN_EXPIRE_MINUTES = 60 * 12
+
+# --- Métricas (GET /metrics) ---
+INBOUND_EVENT_TYPES = ("agent_message", "agent_typing", "user_message")
+QUEUE_WAIT = Histogram("chat_queue_wait_seconds", "Tempo do user_join até o cliente ser ligado a um agente", buckets=WAIT_BUCKETS)
+BROADCAST_FANOUT = Histogram("chat_broadcast_fanout_seconds", "Tempo para enfileirar um broadcast para todos os agentes")
+EVENTS_RECEIVED = Counter("chat_events_received_total", "Eventos recebidos pelos WebSockets", ["type"])
+EVENTS_LIMITED = Counter("chat_events_rate_limited_total", "Eventos descartados pelo limite por socket", ["type"])
+TOKEN_SECONDS = Histogram("http_token_seconds", "Latência do POST /token")
+LOGINS = Counter("http_token_requests_total", "Logins por resultado", ["result"])
+HEARTBEAT_EXPIRED = Counter("chat_heartbeat_expired_total", "Conexões derrubadas por não responderem ao heartbeat", ["kind"])
+# Filhos por tipo criados uma vez: no caminho quente é só um lookup num dict pequeno + incremento
+EVENTS_RECEIVED_BY_TYPE = {t: EVENTS_RECEIVED.labels(t) for t in INBOUND_EVENT_TYPES + ("other",)}
+EVENTS_LIMITED_BY_TYPE = {t: EVENTS_LIMITED.labels(t) for t in INBOUND_EVENT_TYPES + ("other",)}
+
 # --- Configura o Argon2 ---
 ph = argon2.PasswordHasher()
+password_pool = PasswordPool(ph) # Hash/verify em threads, fora do event loop
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+token_cache = TokenCache() # Token verificado -> User, até o `exp` do token
+
+def restore_snapshot():
+    """Recarrega conversas, fila e log de eventos gravados antes do último restart."""
+    snapshot = Snapshot.open(SNAPSHOT_PATH)
+    if snapshot is None:
+        return
+    started = time.perf_counter()
+    try:
+        # Store durável + snapshot periódico (queda, não deploy): o store pode estar mais novo que o snapshot
+        restored = conversation_store.restore(snapshot, hot=snapshot.clean or not conversation_store.store.durable)
+        manager.restore_state(snapshot.state)
+    finally:
+        snapshot.close()
+    logger.info("Estado restaurado do snapshot: %d conversa(s) no cache, %d arquivada(s), %d na fila em %.1fms",
+                restored, len(snapshot.records) - restored, len(snapshot.state.get("queue", ())),
+                (time.perf_counter() - started) * 1000, extra={"event": "snapshot_restored"})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if snapshotter is not None:
+        restore_snapshot()
+    # Liga o relay entre workers (no-op com o backend em memória)
+    await manager.backend.start(manager.handle_relay)
+    if snapshotter is not None:
+        snapshotter.start()
+    yield
+    await manager.drain()
+    if snapshotter is not None:
+        await snapshotter.stop()
+    await manager.backend.stop()
+    password_pool.shutdown()
 
 app = FastAPI(
     title="Chat Admin API",
     description="Backend para o sistema de Chat Admin",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Configuração do CORS ---
@@ -74,10 +164,21 @@ class Conversation(BaseModel):
     time: str
     status: str # 'waiting', 'active', 'closed'
     clientInfo: ClientInfo
-    messages: List[Dict[str, Any]]
+    messages: Transcript # Lista de mensagens na API; em memória, colunas compactas (ver chat_transcript)
     tags: List[str]
     agent_name: Optional[str] = None # <-- NOVO: Registra quem atendeu
 
+class ConversationPage(BaseModel):
+    items: List[Conversation]
+    version: int # Versão atual: use como `since` na próxima sincronização
+    epoch: str # Mande junto com o `since`; se mudou (ex.: reinício), o servidor responde tudo desde o início
+    next_cursor: Optional[int] = None # Próxima página (`cursor`, ou `since` no modo delta); None = acabou
+
+class ConversationSearchPage(BaseModel):
+    items: List[Conversation] # Da mais relevante para a menos
+    total: int # Total de conversas que batem com a busca
+    next_offset: Optional[int] = None # `offset` da próxima página; None = acabou
+
 class Message(BaseModel):
     id: str
     content: str
@@ -123,8 +224,10 @@ fake_users_db = {
         "hashed_password": "$argon2id$v=19$m=65536,t=3,p=4$j/uiv0hBfUXfBw0vC2j9iQ$qM6JkP52v6IfvGgA3YkLpGgP+w31YVf2W/vxaqYwE5A",
     }
 }
-# DB de conversas agora rastreia chats ativos e fechados
+# DB de conversas agora rastreia chats ativos e fechados.
+# O dict é o cache quente; o WriteBehindStore grava em lote no store configurado (CHAT_STORE).
 fake_conversations_db: Dict[str, Conversation] = {}
+conversation_store = WriteBehindStore(create_conversation_store(), Conversation, cache=fake_conversations_db)
 fake_templates_db: Dict[str, QuickTemplate] = {
     "saudacao": QuickTemplate(id="saudacao", title="Saudação", content="Olá! Em que posso ajudar você hoje? 😊", icon="hand-wave"),
     "orcamento": QuickTemplate(id="orcamento", title="Orçamento", content="Para prepararmos um orçamento...", icon="dollar-sign")
@@ -135,15 +238,29 @@ fake_agents_db: List[Agent] = [
 ]
 
 # --- Funções Auxiliares de Autenticação ---
-def verify_password(plain_password, hashed_password):
-    try:
-        ph.verify(hashed_password, plain_password)
-        return True
-    except VerifyMismatchError: return False
-    except Exception: return False
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await password_pool.verify(hashed_password, plain_password)
 
-def get_password_hash(password):
-    return ph.hash(password)
+async def get_password_hash(password) -> str:
+    return await password_pool.hash(password)
+
+async def rehash_password(email: str, old_hash: str, password: str):
+    """Regrava o hash com os parâmetros atuais (roda depois da resposta do login)."""
+    try:
+        new_hash = await get_password_hash(password)
+    except PasswordPoolBusy:
+        return # Fica para o próximo login
+    user_dict = fake_users_db.get(email)
+    if user_dict is not None and user_dict["hashed_password"] == old_hash:
+        user_dict["hashed_password"] = new_hash
+        logger.info("Hash da senha de %s atualizado.", email, extra={"event": "password_rehashed"})
+
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Muitas requisições de login no momento. Tente novamente.",
+        headers={"Retry-After": "1"},
+    )
 
 def get_user(db: dict, email: str) -> Optional[UserInDB]:
     if email in db:
@@ -156,17 +273,42 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_resume_token(guest_id: str) -> str:
+    """Token assinado que o navegador devolve no `user_join` para retomar a mesma conversa."""
+    return create_access_token({"gid": guest_id, "typ": "resume"}, timedelta(minutes=RESUME_TOKEN_EXPIRE_MINUTES))
+
+def verify_resume_token(token: Any) -> Optional[str]:
+    """guest_id de um token de retomada válido, ou None."""
+    if not token or not isinstance(token, str): return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("gid") if payload.get("typ") == "resume" else None
+
 async def get_current_user_from_token(token: str) -> Optional[User]:
+    if not token: return None
+    user = token_cache.get(token)
+    if user is not None: return user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None: return None
         user_dict = fake_users_db.get(email)
         if user_dict is None: return None
-        return User(**user_dict)
+        user = User(**user_dict)
+        token_cache.put(token, user, email, payload.get("exp"))
+        return user
     except JWTError:
         return None
 
+def get_agent_department(user: User) -> Optional[str]:
+    """Departamento cadastrado em `fake_agents_db` para o usuário (pelo nome)."""
+    for agent in fake_agents_db:
+        if agent.name == user.name:
+            return agent.department
+    return None
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     user = await get_current_user_from_token(token)
     if not user:
@@ -181,12 +323,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
 # (As rotas /token, /register, /users/me, /templates, /agents... continuam iguais)
 
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
+    started = time.perf_counter()
     user = get_user(fake_users_db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    try:
+        valid = user is not None and await verify_password(form_data.password, user.hashed_password)
+    except PasswordPoolBusy:
+        LOGINS.labels("busy").inc()
+        raise password_pool_busy()
+    finally:
+        TOKEN_SECONDS.observe(time.perf_counter() - started)
+    if not valid:
+        LOGINS.labels("invalid").inc()
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="E-mail ou senha incorretos")
-    if ph.check_needs_rehash(user.hashed_password):
-        user.hashed_password = get_password_hash(form_data.password)
+    LOGINS.labels("ok").inc()
+    if password_pool.needs_rehash(user.hashed_password):
+        background_tasks.add_task(rehash_password, user.email, user.hashed_password, form_data.password)
     access_token = create_access_token(data={"sub": user.email}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -196,23 +348,76 @@ async def register_user(user_data: UserCreate):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Este e-mail já está cadastrado.")
     if len(user_data.password) < 6:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="A senha deve ter pelo menos 6 caracteres.")
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await get_password_hash(user_data.password)
+    except PasswordPoolBusy:
+        raise password_pool_busy()
+    if user_data.email in fake_users_db: # Cadastrado por outra requisição enquanto o hash rodava
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Este e-mail já está cadastrado.")
     new_user_db_entry = user_data.dict()
     new_user_db_entry["hashed_password"] = hashed_password
     del new_user_db_entry["password"]
     fake_users_db[user_data.email] = new_user_db_entry
+    token_cache.invalidate_user(user_data.email) # Qualquer mudança no usuário invalida os tokens em cache
     return User(**new_user_db_entry)
 
 @app.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
-@app.get("/conversations", response_model=List[Conversation])
-async def get_conversations(current_user: User = Depends(get_current_user)):
-    # NOVO: Retorna TODAS as conversas (ativas, em espera e fechadas)
-    # O dashboard do agente deve carregar todas e filtrar/ordenar
-    print(f"Retornando {len(fake_conversations_db)} conversas totais para o dashboard.")
-    return list(fake_conversations_db.values())
+@app.get("/conversations", response_model=Union[ConversationPage, List[Conversation]])
+async def get_conversations(
+    conv_status: Optional[str] = Query(None, alias="status"),
+    agent: Optional[str] = None,
+    tag: Optional[str] = None,
+    urgency: Optional[str] = None,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    # Com `limit`, `cursor` ou `since` responde uma página (ConversationPage):
+    # - carga inicial: ?limit=50, depois ?cursor=<next_cursor> até acabar;
+    # - reconexão: ?since=<version>&epoch=<epoch> traz só as conversas alteradas
+    #   depois dela (epoch diferente: as versões recomeçaram, vem tudo).
+    # Os filtros (status, agent, tag, urgency) usam índices secundários.
+    # Sem esses parâmetros mantém a resposta antiga (lista completa) para o
+    # dashboard atual. Fechadas antigas ficam só no arquivo (ver retenção em
+    # chat_store): use GET /conversations/{id} ou include_archived=true (caro).
+    filters = {"status": conv_status, "agent": agent, "tag": tag, "urgency": urgency}
+    if limit is None and cursor is None and since is None:
+        if not any(filters.values()):
+            conversations = await manager.backend.list_conversations(include_archived)
+            logger.debug("Retornando %d conversas totais para o dashboard.", len(conversations), extra={"event": "conversations_listed", "count": len(conversations)})
+            return conversations
+    items, next_cursor, version, epoch = await manager.backend.query_conversations(
+        filters, since=since, cursor=cursor, limit=clamp_page_size(limit), epoch=epoch
+    )
+    return ConversationPage(items=items, version=version, epoch=epoch, next_cursor=next_cursor)
+
+@app.get("/conversations/search", response_model=ConversationSearchPage)
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+):
+    # Busca por nome, e-mail, telefone, projeto e texto das mensagens, sem
+    # diferenciar acentos/maiúsculas; o último termo vale como prefixo
+    # ("joao orc" acha "João ... orçamento"). Inclui as conversas arquivadas.
+    limit = clamp_search_limit(limit)
+    items, total = await manager.backend.search_conversations(q, offset, limit)
+    next_offset = offset + limit if offset + limit < total else None
+    return ConversationSearchPage(items=items, total=total, next_offset=next_offset)
+
+@app.get("/conversations/{conv_id}", response_model=Conversation)
+async def get_conversation(conv_id: str, current_user: User = Depends(get_current_user)):
+    conv = await manager.backend.get_conversation(conv_id)
+    if conv is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversa não encontrada.")
+    return conv
 
 @app.get("/templates", response_model=List[QuickTemplate])
 async def get_quick_templates(current_user: User = Depends(get_current_user)):
@@ -229,57 +434,199 @@ async def get_agents(current_user: User = Depends(get_current_user)):
 # ---
 
 class ConnectionManager:
-    def __init__(self):
-        self.available_agents: Dict[WebSocket, User] = {}
-        self.waiting_guests: List[Tuple[WebSocket, dict, str]] = [] # (websocket, user_join_data, guest_id)
-        self.sessions: Dict[WebSocket, WebSocket] = {} # guest_ws -> agent_ws
-        self.reverse_sessions: Dict[WebSocket, WebSocket] = {} # agent_ws -> guest_ws
+    def __init__(self, backend=None):
+        # Estado compartilhado (fila, sessões, conversas e relay entre workers)
+        self.backend = backend or InMemoryBackend(conversation_store)
+        self.router = AgentRouter() # Agentes conectados, capacidade e chats ativos de cada um
+        self.sessions: Dict[Any, Any] = {} # guest_ws -> agent_ws (qualquer um pode ser RemotePeer)
         self.agent_user_map: Dict[WebSocket, User] = {}
+        self.agent_ids: Dict[WebSocket, str] = {} # agent_ws -> agent_id (único por conexão)
+        self.agent_ws_map: Dict[str, WebSocket] = {} # agent_id -> agent_ws
         self.guest_id_map: Dict[WebSocket, str] = {} # Mapeia guest_ws -> guest_id
-
-    async def broadcast_to_all_agents(self, message: dict):
-        """Envia uma mensagem para TODOS os agentes conectados (disponíveis ou em chat)."""
-        print(f"Transmitindo para {len(self.agent_user_map)} agentes: {message.get('type')}")
-        for websocket in self.agent_user_map.keys():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                print(f"Erro ao transmitir para agente: {e}")
-
-    async def connect_agent(self, websocket: WebSocket, user: User):
-        print(f"Agente conectado: {user.email}")
+        self.guest_ws_map: Dict[str, WebSocket] = {} # Mapeia guest_id -> guest_ws
+        self.agent_outboxes: Dict[WebSocket, AgentOutbox] = {} # agent_ws -> fila de saída
+        self.remote_peers: Dict[Tuple[str, str], RemotePeer] = {} # (kind, id) -> ponta em outro worker
+        self.events = EventLog() # Eventos recentes dos agentes, para replay na reconexão
+        self.typing = TypingCoalescer(self.send_typing_stopped) # "digitando..." por sessão (chave: guest_ws)
+        self.session_keys: Dict[str, Optional[str]] = {} # guest_id -> sessionId do navegador, enquanto a conversa está aberta
+        self._expiry: Dict[str, asyncio.TimerHandle] = {} # guest_id -> fim da carência para voltar
+        self.draining = False # Desligando: novas conexões são recusadas e desconexões não encerram conversas
+        self.handling_stats = HandlingStats(default=AVERAGE_CHAT_MINUTES * 60) # Duração dos atendimentos por agente/departamento
+        self.handling: Dict[str, Tuple[float, str, Optional[str]]] = {} # guest_id -> (início, agente, departamento) dos atendimentos em curso
+        self.queue_updates = QueueNotifier(self.backend.queue_positions_from, self.backend.take_queue_changes,
+                                           self.service_rate, self.send_queue_update)
+        self.heartbeat = HeartbeatMonitor(self.send_ping, self.drop_unresponsive) # Ping/pong e conexões meio-abertas (uma roda de timers só)
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def worker_id(self) -> str:
+        return self.backend.worker_id
+
+    def broadcast_to_all_agents(self, frame: str, key: Optional[Any] = None, relay: bool = True):
+        """Enfileira um frame para TODOS os agentes conectados (disponíveis ou em chat).
+
+        O frame já vem codificado (ver `encode_event`), então o custo de
+        serialização é pago uma vez por evento e não uma vez por agente.
+        Não bloqueia: cada agente tem sua própria fila de saída e task escritora,
+        então um socket lento não atrasa os demais. Com o backend Redis o frame
+        também é repassado aos agentes dos outros workers.
+        Cada worker numera (`seq`) e guarda no `EventLog` os eventos que entrega,
+        inclusive os que vieram de outro worker.
+        """
+        logger.info("Transmitindo para %d agentes", len(self.agent_outboxes), extra={"event": "broadcast", "agents": len(self.agent_outboxes)})
+        started = time.perf_counter()
+        stamped = self.events.append(frame, key)
+        for outbox in list(self.agent_outboxes.values()):
+            outbox.put(stamped, key=key)
+        BROADCAST_FANOUT.observe(time.perf_counter() - started)
+        if relay:
+            self.backend.broadcast(frame, key)
+
+    def send_to_agent(self, agent_ws, message: Union[dict, str], key: Optional[Any] = None) -> bool:
+        """Enfileira uma mensagem (dict ou frame já codificado) para um agente.
+
+        Passa pela mesma fila dos broadcasts, preservando a ordem de entrega.
+        """
+        frame = message if isinstance(message, str) else encode_frame(message)
+        if isinstance(agent_ws, RemotePeer):
+            agent_ws.send_frame(frame)
+            return True
+        outbox = self.agent_outboxes.get(agent_ws)
+        if outbox is None:
+            return False
+        return outbox.put(frame, key=key)
+
+    def remote_peer(self, worker_id: str, kind: str, peer_id: str) -> RemotePeer:
+        """Proxy (reaproveitado) de um cliente ou agente conectado em outro worker."""
+        peer = self.remote_peers.get((kind, peer_id))
+        if peer is None:
+            peer = self.remote_peers[(kind, peer_id)] = RemotePeer(self.backend, worker_id, kind, peer_id)
+        return peer
+
+    def guest_id_of(self, guest_ws) -> Optional[str]:
+        if isinstance(guest_ws, RemotePeer):
+            return guest_ws.peer_id
+        return self.guest_id_map.get(guest_ws)
+
+    async def connect_agent(self, websocket: WebSocket, user: User,
+                            capacity: int = DEFAULT_AGENT_CAPACITY, department: Optional[str] = None,
+                            last_seq: Optional[int] = None, epoch: Optional[str] = None):
+        logger.info("Agente conectado: %s", user.email, extra={"event": "agent_connected", "agent": user.email})
+        # Reconexão: replay dos eventos perdidos ou, se a lacuna saiu do buffer, snapshot
+        missed = self.events.since(last_seq, epoch)
+        snapshot = None
+        if missed is None and last_seq is not None:
+            snapshot_seq = self.events.seq
+            snapshot = await self.backend.list_conversations()
+
+        agent_id = uuid.uuid4().hex
         self.agent_user_map[websocket] = user
+        self.agent_ids[websocket] = agent_id
+        self.agent_ws_map[agent_id] = websocket
+        outbox = self.agent_outboxes[websocket] = AgentOutbox(websocket)
+        if snapshot is not None:
+            logger.info("Agente %s perdeu eventos além do buffer: enviando snapshot.", user.email, extra={"event": "agent_snapshot", "agent": user.email, "last_seq": last_seq})
+            outbox.put(encode_event("snapshot", epoch=self.events.epoch, seq=snapshot_seq, conversations=snapshot))
+            missed = self.events.since(snapshot_seq) or [] # Eventos durante a montagem do snapshot
+        else:
+            outbox.put(encode_frame({
+                "type": "sync", "epoch": self.events.epoch,
+                "seq": last_seq if missed is not None else self.events.seq,
+                "replayed": len(missed or ())
+            }))
+        for key, frame in missed or ():
+            outbox.put(frame, key=key)
+        slot = self.router.add(websocket, user, capacity, department or get_agent_department(user))
+        self.queue_updates.changed(1) # Ritmo de atendimento mudou: revisa as estimativas
+        logger.info("Agente %s aceita até %d chats simultâneos.", user.email, slot.capacity, extra={"event": "agent_capacity", "agent": user.email, "capacity": slot.capacity})
+        await self.backend.register_agent(agent_id, {
+            "email": user.email, "name": user.name,
+            "capacity": slot.capacity, "department": slot.department
+        })
+
+        if not await self.assign_waiting_guests(websocket):
+            self.send_to_agent(websocket, {"type": "status", "message": "online_waiting"})
+            logger.info("Agente %s está online e aguardando.", user.email, extra={"event": "agent_idle", "agent": user.email})
+
+    async def assign_waiting_guests(self, agent_ws: WebSocket) -> int:
+        """Preenche as vagas livres do agente com clientes da fila. Retorna quantos foram atendidos."""
+        assigned = 0
+        while True:
+            slot = self.router.get(agent_ws)
+            if slot is None or not slot.has_capacity:
+                break
+            waiting = await self.find_waiting_guest()
+            if waiting is None:
+                break
+            self.queue_updates.changed() # A fila anota quem andou (todos os que estavam atrás)
+            guest_id, join_data = waiting.guest_id, waiting.join_data
+
+            if self.router.get(agent_ws) is None:
+                # O agente saiu enquanto o cliente era retirado da fila: devolve o cliente
+                await self.backend.enqueue_guest(guest_id, join_data, waiting.priority, waiting.websocket)
+                self.backend.announce_waiting()
+                break
+
+            if waiting.worker_id in (None, self.worker_id):
+                guest_ws = self.guest_ws_map.get(guest_id)
+                if guest_ws is None:
+                    continue # Cliente já saiu
+            else:
+                guest_ws = self.remote_peer(waiting.worker_id, "guest", guest_id)
 
-        guest_data = self.find_waiting_guest()
-        if guest_data:
-            guest_ws, join_data, guest_id = guest_data
-            
             # Conecta os dois e registra quem atendeu
-            self.link_session(guest_ws, websocket, user, guest_id)
+            await self.link_session(guest_ws, agent_ws, slot.user, guest_id)
+            QUEUE_WAIT.observe(time.monotonic() - waiting.enqueued_at)
+            assigned += 1
 
-            await guest_ws.send_json({
-                "type": "transfer_status", "status": "connected",
-                "agentName": user.name, "agentRole": "Atendente"
-            })
-            await websocket.send_json({
+            self.send_to_agent(agent_ws, {
                 "type": "new_conversation", "guest_id": guest_id,
                 "userData": join_data.get("userData"),
                 "conversationHistory": join_data.get("conversationHistory")
             })
-        else:
-            self.available_agents[websocket] = user
-            await websocket.send_json({"type": "status", "message": "online_waiting"})
-            print(f"Agente {user.email} está online e aguardando.")
+            await self.notify_guest_connected(guest_ws, agent_ws, slot.user)
+        return assigned
+
+    async def notify_guest_connected(self, guest_ws, agent_ws: WebSocket, agent_user: User):
+        if isinstance(guest_ws, RemotePeer):
+            # O worker do cliente registra a sessão do lado dele e avisa o cliente
+            self.backend.relay(guest_ws.worker_id, {
+                "op": "session_linked", "guest_id": guest_ws.peer_id,
+                "agent_id": self.agent_ids[agent_ws], "agent_name": agent_user.name
+            })
+            return
+        try:
+            await guest_ws.send_json({
+                "type": "transfer_status", "status": "connected",
+                "agentName": agent_user.name, "agentRole": "Atendente"
+            })
+        except Exception as e:
+            logger.warning("Erro ao avisar cliente %s: %s", self.guest_id_map.get(guest_ws), e, extra={"event": "guest_send_error"})
+            GUEST_SEND_ERROR.inc()
 
     async def connect_guest(self, websocket: WebSocket, join_data: dict):
+        # Cliente voltando (queda de rede ou restart): só com o token de retomada assinado,
+        # nunca pelo sessionId, que é gerado no navegador e não prova nada
+        session_key = join_data.get("sessionId")
+        guest_id = verify_resume_token(join_data.get("resumeToken"))
+        if guest_id is not None and isinstance(self.guest_ws_map.get(guest_id), DetachedGuest):
+            await self.reattach_guest(websocket, self.guest_ws_map[guest_id])
+            return
+        if guest_id is not None and guest_id in self.session_keys and guest_id not in self.guest_ws_map:
+            if await self.resume_guest(websocket, guest_id, session_key or self.session_keys[guest_id]):
+                return
+
         guest_id = str(uuid.uuid4())
         self.guest_id_map[websocket] = guest_id
+        self.guest_ws_map[guest_id] = websocket
+        self.session_keys[guest_id] = session_key
+        await self.send_session(websocket, guest_id, resumed=False)
 
         # --- LÓGICA DE PARSING ATUALIZADA ---
         # 1. Pega o payload de dados do cliente enviado pelo ChatWebSocket
         user_data = join_data.get("userData", {})
         if not user_data:
-            print(f"Cliente {guest_id} conectado sem dados (userData). Usando padrões.")
+            logger.info("Cliente %s conectado sem dados (userData). Usando padrões.", guest_id, extra={"event": "guest_without_data", "guest_id": guest_id})
 
         # 2. Pega o histórico da conversa com a IA
         ai_history = join_data.get("conversationHistory", [])
@@ -299,7 +646,7 @@ class ConnectionManager:
 
         # 5. Pega o nome do cliente (do formulário ou usa um padrão)
         client_name = user_data.get('name', f"Cliente {guest_id[:4]}")
-        print(f"Cliente conectado: {client_name} (ID: {guest_id})")
+        logger.info("Cliente conectado: %s (ID: %s)", client_name, guest_id, extra={"event": "guest_connected", "guest_id": guest_id})
 
         # 6. Cria o objeto ClientInfo com todos os dados
         client_info_data = ClientInfo(
@@ -324,20 +671,25 @@ class ConnectionManager:
             messages=all_messages,
             tags=["Novo Cliente"]
         )
-        fake_conversations_db[guest_id] = new_conv
+        await self.backend.save_conversation(new_conv)
         # -------------------------------------
 
-        agent_data = self.find_available_agent()
+        # Urgência define a prioridade na fila; o tipo de projeto, o departamento preferido
+        priority = URGENCY_PRIORITY.get(client_info_data.urgency, 0)
+        department = user_data.get('department') or PROJECT_DEPARTMENTS.get(client_info_data.project)
+
+        agent_data = self.find_available_agent(department)
         if agent_data:
             agent_ws, agent_user = agent_data
 
             # Conecta os dois e registra quem atendeu
-            self.link_session(
+            await self.link_session(
                 guest_ws=websocket,
                 agent_ws=agent_ws,
                 agent_user=agent_user,
                 guest_id=guest_id
             )
+            QUEUE_WAIT.observe(0.0) # Atendido sem passar pela fila
 
             await websocket.send_json({
                 "type": "transfer_status",
@@ -347,108 +699,477 @@ class ConnectionManager:
             })
 
             # Envia a conversa completa para o agente
-            await agent_ws.send_json({
-                "type": "new_conversation",
-                "conversation": new_conv.dict()
-            })
+            self.send_to_agent(agent_ws, encode_event("new_conversation", guest_id=guest_id, conversation=new_conv))
         else:
-            self.waiting_guests.append((websocket, join_data, guest_id))
-            print(f"Cliente {guest_id} colocado na fila. Posição: {len(self.waiting_guests)}")
+            position = await self.backend.enqueue_guest(guest_id, join_data, priority, websocket)
+            self.queue_updates.changed() # Prioridade maior passa na frente de quem já esperava
+            logger.info("Cliente %s colocado na fila. Posição: %d", guest_id, position, extra={"event": "guest_queued", "guest_id": guest_id, "position": position})
 
             # Transmite a nova conversa em espera para TODOS os agentes
-            await self.broadcast_to_all_agents({
-                "type": "new_waiting_guest",
-                "conversation": new_conv.dict()
-            })
-
-            await websocket.send_json({
-                "type": "transfer_status",
-                "status": "waiting",
-                "position": len(self.waiting_guests),
-                "waitTime": 5
-            })
+            self.broadcast_to_all_agents(encode_event("new_waiting_guest", conversation=new_conv))
+            # Agentes livres em outros workers podem buscar o cliente na fila
+            self.backend.announce_waiting()
+
+            await websocket.send_json(self.waiting_status(guest_id, position))
+
+    async def disconnect(self, websocket: WebSocket, restarting: bool = False, final: bool = True):
+        """Trata a saída de um socket. `final=False` (queda de rede) não encerra
+        conversas: o cliente fica retomável por GUEST_RESUME_GRACE_SECONDS (ver
+        `detach_guest`) e os clientes de um agente voltam para a fila (ver `requeue_guest`)."""
+        logger.debug("Conexão perdida.", extra={"event": "disconnect"})
+        self.heartbeat.forget(websocket)
+        if restarting or self.draining:
+            await self.park(websocket)
+            return
+        if websocket not in self.guest_id_map and websocket not in self.agent_outboxes and websocket not in self.router:
+            return # Já tratado (ex.: derrubado pelo heartbeat antes de o receive_json perceber)
+        if not final and GUEST_RESUME_GRACE_SECONDS > 0 and websocket in self.guest_id_map:
+            await self.detach_guest(websocket)
+            return
+        closed_guest_ids: List[str] = []
+
+        outbox = self.agent_outboxes.pop(websocket, None)
+        if outbox:
+            outbox.close()
+
+        if websocket in self.router:
+            # --- Agente saiu: encerra todos os chats que ele estava atendendo ---
+            slot = self.router.remove(websocket)
+            self.agent_user_map.pop(websocket, None)
+            agent_id = self.agent_ids.pop(websocket, None)
+            self.agent_ws_map.pop(agent_id, None)
+            await self.backend.unregister_agent(agent_id)
+            self.queue_updates.changed(1)
+            logger.info("Agente %s desconectado com %d chat(s) ativo(s).", slot.user.email, slot.load, extra={"event": "agent_disconnected", "agent": slot.user.email, "active_chats": slot.load})
+            if not final:
+                # Queda do agente (ex.: sem resposta ao heartbeat): os clientes voltam para a fila
+                for guest_ws in list(slot.guests):
+                    await self.requeue_guest(guest_ws)
+                await self.assign_to_free_agents()
+                return
+            for guest_ws in list(slot.guests):
+                self.sessions.pop(guest_ws, None)
+                self.typing.forget(guest_ws)
+                if isinstance(guest_ws, RemotePeer):
+                    self.remote_peers.pop(("guest", guest_ws.peer_id), None)
+                    self.backend.relay(guest_ws.worker_id, {"op": "agent_left", "guest_id": guest_ws.peer_id})
+                    closed_guest_ids.append(guest_ws.peer_id)
+                    continue
+                guest_id = self.guest_id_map.pop(guest_ws, None)
+                if guest_id:
+                    self.guest_ws_map.pop(guest_id, None)
+                    closed_guest_ids.append(guest_id)
+                try:
+                    await guest_ws.send_json({"type": "agent_left", "message": "O atendente se desconectou."})
+                    await guest_ws.close()
+                except Exception: pass
 
-    async def disconnect(self, websocket: WebSocket):
-        print("Conexão perdida.")
-        conversation_to_update = None
-        guest_id = None
-        
-        if websocket in self.available_agents:
-            del self.available_agents[websocket]
-            if websocket in self.agent_user_map: del self.agent_user_map[websocket]
-            print("Agente disponível desconectado.")
-            
-        elif websocket in self.reverse_sessions:
-            guest_ws = self.reverse_sessions.pop(websocket)
-            del self.sessions[guest_ws]
-            if websocket in self.agent_user_map: del self.agent_user_map[websocket]
-            guest_id = self.guest_id_map.pop(guest_ws, None)
-            print(f"Agente em chat com {guest_id} desconectado.")
-            try:
-                await guest_ws.send_json({"type": "agent_left", "message": "O atendente se desconectou."})
-                await guest_ws.close()
-            except Exception: pass
-        
         elif websocket in self.sessions:
             agent_ws = self.sessions.pop(websocket)
-            del self.reverse_sessions[agent_ws]
+            self.typing.forget(websocket)
             guest_id = self.guest_id_map.pop(websocket, None)
-            print(f"Cliente {guest_id} em chat desconectado.")
-            try:
-                await agent_ws.send_json({"type": "guest_left", "message": "O cliente se desconectou."})
-                agent_user = self.get_agent_user(agent_ws)
-                if agent_user:
-                    self.available_agents[agent_ws] = agent_user
-                    print(f"Agente {agent_user.email} de volta ao pool.")
-            except Exception: pass
+            if guest_id:
+                self.guest_ws_map.pop(guest_id, None)
+                closed_guest_ids.append(guest_id)
+            logger.info("Cliente %s em chat desconectado.", guest_id, extra={"event": "guest_disconnected", "guest_id": guest_id, "state": "chat"})
+            if isinstance(agent_ws, RemotePeer):
+                # O worker do agente libera a vaga e avisa o agente
+                self.backend.relay(agent_ws.worker_id, {
+                    "op": "guest_left", "guest_id": guest_id, "agent_id": agent_ws.peer_id
+                })
+            else:
+                await self.release_agent_slot(agent_ws, websocket, guest_id)
 
         else:
-            self.waiting_guests = [entry for entry in self.waiting_guests if entry[0] != websocket]
             guest_id = self.guest_id_map.pop(websocket, None)
-            print(f"Cliente {guest_id} na fila desconectado.")
+            if guest_id:
+                self.guest_ws_map.pop(guest_id, None)
+                await self.backend.remove_waiting_guest(guest_id)
+                self.queue_updates.changed()
+                closed_guest_ids.append(guest_id)
+            logger.info("Cliente %s na fila desconectado.", guest_id, extra={"event": "guest_disconnected", "guest_id": guest_id, "state": "queue"})
+
+        for guest_id in closed_guest_ids:
+            await self.close_conversation(guest_id)
+
+    # ---
+    # --- WARM RESTART (snapshot, drain e retomada)
+    # ---
+
+    async def park(self, websocket: WebSocket):
+        """Desconexão causada por restart do servidor: solta o socket e mais nada.
+
+        A conversa não é encerrada e o cliente continua na fila; o estado vai
+        para o snapshot e o cliente que voltar com o token de retomada (dentro
+        de RESUME_GRACE_SECONDS) retoma de onde parou (ver `resume_guest`).
+        """
+        self.heartbeat.forget(websocket)
+        outbox = self.agent_outboxes.pop(websocket, None)
+        if outbox:
+            outbox.close()
+
+        if websocket in self.router:
+            slot = self.router.remove(websocket)
+            self.agent_user_map.pop(websocket, None)
+            agent_id = self.agent_ids.pop(websocket, None)
+            self.agent_ws_map.pop(agent_id, None)
+            await self.backend.unregister_agent(agent_id)
+            for guest_ws in list(slot.guests):
+                self.sessions.pop(guest_ws, None)
+                self.typing.forget(guest_ws)
+            logger.info("Agente %s solto para restart.", slot.user.email, extra={"event": "agent_parked", "agent": slot.user.email})
+            return
+
+        guest_id = self.guest_id_map.pop(websocket, None)
+        if guest_id is None:
+            return
+        self.guest_ws_map.pop(guest_id, None)
+        self.typing.forget(websocket)
+        agent_ws = self.sessions.pop(websocket, None)
+        if agent_ws is not None and not isinstance(agent_ws, RemotePeer):
+            self.router.release(agent_ws, websocket)
+        await self.backend.attach_waiting_guest(guest_id, None)
+        if not self.draining:
+            self.expire_later(guest_id)
+        logger.info("Cliente %s solto para restart.", guest_id, extra={"event": "guest_parked", "guest_id": guest_id})
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Desligamento gracioso (antes do snapshot final).
+
+        Recusa novas conexões, dá até `timeout` segundos para as filas de saída
+        dos agentes esvaziarem e fecha os sockets que ainda estiverem abertos
+        com 1012 ("Service Restart"). Sob o uvicorn eles normalmente já vêm
+        fechados com esse código; em ambos os casos os `disconnect` só soltam
+        os sockets (ver `park`).
+        """
+        self.draining = True
+        self.queue_updates.close()
+        self.heartbeat.close()
+        deadline = time.monotonic() + timeout
+        while any(len(outbox) for outbox in self.agent_outboxes.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for websocket in list(self.agent_outboxes) + list(self.guest_ws_map.values()):
+            try:
+                await websocket.close(code=SERVICE_RESTART_CODE, reason="Servidor reiniciando")
+            except Exception: pass
+            await self.park(websocket)
+
+    def snapshot_state(self) -> dict:
+        """Fila, clientes retomáveis e log de eventos (a parte do snapshot que não é conversa)."""
+        return {
+            "events": self.events.dump(),
+            "queue": self.backend.export_queue(),
+            "sessions": self.session_keys, # guest_id -> sessionId de toda conversa ainda aberta
+            "handling": self.handling_stats.dump(), # Duração média dos atendimentos (estimativas de espera)
+        }
+
+    def restore_state(self, state: dict):
+        """Aplica a parte do snapshot que não é conversa. Todo cliente restaurado
+        tem RESUME_GRACE_SECONDS para voltar; quem não volta tem a conversa encerrada."""
+        self.events.restore(state.get("events"))
+        self.backend.restore_queue(state.get("queue") or [])
+        self.handling_stats.restore(state.get("handling"))
+        for guest_id, session_key in (state.get("sessions") or {}).items():
+            self.session_keys[guest_id] = session_key
+            self.expire_later(guest_id)
+
+    async def resume_guest(self, websocket: WebSocket, guest_id: str, session_key: str) -> bool:
+        """Religa um cliente que voltou depois de um restart à conversa dele.
+
+        Se ainda está na fila, só ganha o socket novo e mantém o lugar. Se
+        estava em atendimento, volta para a fila na frente (RESUME_PRIORITY)
+        e é entregue ao primeiro agente com vaga.
+        """
+        conv = await self.backend.get_conversation(guest_id)
+        if conv is None or conv.status == 'closed' or guest_id in self.guest_ws_map:
+            return False
+        self.guest_id_map[websocket] = guest_id
+        self.guest_ws_map[guest_id] = websocket
+        self.session_keys[guest_id] = session_key
+        self.cancel_expiry(guest_id)
+
+        position = await self.backend.attach_waiting_guest(guest_id, websocket)
+        requeued = position is None
+        if requeued:
+            conv.status = 'waiting'
+            conv.lastMessage = "Cliente reconectado."
+            await self.backend.save_conversation(conv)
+            self.broadcast_to_all_agents(
+                encode_event("conversation_update", conversation=conv),
+                key=("conversation_update", guest_id)
+            )
+            join_data = {"userData": {"name": conv.clientName}, "conversationHistory": conv.messages.to_list(), "sessionId": session_key}
+            position = await self.backend.enqueue_guest(guest_id, join_data, RESUME_PRIORITY, websocket)
+            self.queue_updates.changed()
+        logger.info("Cliente %s retomou a conversa. Posição: %d", guest_id, position, extra={"event": "guest_resumed", "guest_id": guest_id, "position": position})
+
+        await self.send_session(websocket, guest_id, resumed=True)
+        await websocket.send_json(self.waiting_status(guest_id, position))
+        if requeued:
+            self.backend.announce_waiting()
+            for slot in list(self.router.agents.values()):
+                if slot.has_capacity:
+                    await self.assign_waiting_guests(slot.websocket)
+        return True
 
-        # --- NOVO: Atualiza o status da conversa para 'closed' e transmite ---
-        if guest_id and guest_id in fake_conversations_db:
-            conv = fake_conversations_db[guest_id]
+    def expire_later(self, guest_id: str):
+        self.schedule_expiry(guest_id, RESUME_GRACE_SECONDS, lambda: self.expire_resumable(guest_id))
+
+    def schedule_expiry(self, guest_id: str, delay: float, action):
+        """Agenda o fim da carência de um cliente (um timer por cliente; o novo substitui o anterior)."""
+        previous = self._expiry.get(guest_id)
+        if previous is not None:
+            previous.cancel()
+        self._expiry[guest_id] = asyncio.get_running_loop().call_later(delay, lambda: self.spawn(action()))
+
+    def cancel_expiry(self, guest_id: str):
+        timer = self._expiry.pop(guest_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    async def expire_resumable(self, guest_id: str):
+        """Fim da carência: cliente que não voltou sai da fila e tem a conversa encerrada."""
+        self._expiry.pop(guest_id, None)
+        if guest_id in self.guest_ws_map or guest_id not in self.session_keys:
+            return # Já voltou, ou a conversa já foi encerrada
+        await self.backend.remove_waiting_guest(guest_id)
+        self.queue_updates.changed()
+        await self.close_conversation(guest_id)
+
+    # ---
+    # --- RETOMADA DO CLIENTE (quedas de rede)
+    # ---
+
+    async def send_session(self, websocket: WebSocket, guest_id: str, resumed: bool):
+        """Entrega ao cliente o token para retomar esta conversa se a conexão cair."""
+        await websocket.send_json({
+            "type": "session", "guest_id": guest_id, "resumed": resumed,
+            "resumeToken": create_resume_token(guest_id), "resumeWindow": GUEST_RESUME_GRACE_SECONDS
+        })
+
+    def rebind_guest(self, old_ws, new_ws, guest_id: str):
+        """Passa sessão, vaga no agente e mapas de um socket do cliente para outro."""
+        self.guest_id_map.pop(old_ws, None)
+        self.guest_id_map[new_ws] = guest_id
+        self.guest_ws_map[guest_id] = new_ws
+        self.typing.forget(old_ws)
+        agent_ws = self.sessions.pop(old_ws, None)
+        if agent_ws is not None:
+            self.sessions[new_ws] = agent_ws
+            if not isinstance(agent_ws, RemotePeer):
+                self.router.replace_guest(agent_ws, old_ws, new_ws)
+
+    async def detach_guest(self, websocket: WebSocket):
+        """A conexão do cliente caiu: segura tudo por GUEST_RESUME_GRACE_SECONDS.
+
+        Um `DetachedGuest` fica no lugar do socket: a conversa continua aberta,
+        o lugar na fila e a vaga do agente continuam reservados e o que for
+        enviado ao cliente fica guardado. Nada é transmitido aos agentes. Se o
+        cliente volta com o token (ver `reattach_guest`) segue de onde parou;
+        senão, `expire_detached` faz a desconexão normal.
+        """
+        guest_id = self.guest_id_map[websocket]
+        detached = DetachedGuest(guest_id)
+        self.rebind_guest(websocket, detached, guest_id)
+        await self.backend.attach_waiting_guest(guest_id, None)
+        self.schedule_expiry(guest_id, GUEST_RESUME_GRACE_SECONDS, lambda: self.expire_detached(guest_id))
+        logger.info("Cliente %s caiu; aguardando retomada.", guest_id, extra={"event": "guest_detached", "guest_id": guest_id})
+
+    async def reattach_guest(self, websocket: WebSocket, detached: DetachedGuest):
+        """Cliente voltou dentro da carência: mesmo guest_id, mesma conversa e mesmo agente."""
+        guest_id = detached.guest_id
+        self.cancel_expiry(guest_id)
+        self.rebind_guest(detached, websocket, guest_id)
+        await self.backend.attach_waiting_guest(guest_id, websocket)
+        logger.info("Cliente %s reconectado (%d frame(s) pendente(s)).", guest_id, len(detached.frames),
+                    extra={"event": "guest_reattached", "guest_id": guest_id, "pending": len(detached.frames), "dropped": detached.dropped})
+        await self.send_session(websocket, guest_id, resumed=True)
+        await detached.flush_to(websocket)
+
+    async def expire_detached(self, guest_id: str):
+        """Fim da carência sem o cliente voltar: desconexão normal (encerra a conversa)."""
+        self._expiry.pop(guest_id, None)
+        detached = self.guest_ws_map.get(guest_id)
+        if isinstance(detached, DetachedGuest):
+            await self.disconnect(detached)
+
+    async def requeue_guest(self, guest_ws):
+        """Devolve à fila, na frente (RESUME_PRIORITY), um cliente cujo agente caiu.
+
+        A conversa continua aberta; o cliente recebe a posição na fila e é
+        entregue ao próximo agente com vaga. Cliente conectado em outro worker:
+        o worker dele faz o mesmo (op "requeue_guest").
+        """
+        agent_peer = self.sessions.pop(guest_ws, None)
+        self.typing.forget(guest_ws)
+        if isinstance(agent_peer, RemotePeer) and agent_peer not in self.sessions.values():
+            self.remote_peers.pop(("agent", agent_peer.peer_id), None)
+        if isinstance(guest_ws, RemotePeer):
+            self.remote_peers.pop(("guest", guest_ws.peer_id), None)
+            self.handling.pop(guest_ws.peer_id, None)
+            self.backend.relay(guest_ws.worker_id, {"op": "requeue_guest", "guest_id": guest_ws.peer_id})
+            return
+        guest_id = self.guest_id_map.get(guest_ws)
+        if guest_id is None:
+            return
+        self.handling.pop(guest_id, None) # Atendimento interrompido: não entra na média de duração
+        await self.backend.clear_session(guest_id)
+        conv = await self.backend.get_conversation(guest_id)
+        if conv is None or conv.status == 'closed':
+            return
+        conv.status = 'waiting'
+        conv.lastMessage = "Atendente desconectado; aguardando outro atendente."
+        await self.backend.save_conversation(conv)
+        self.broadcast_to_all_agents(
+            encode_event("conversation_update", conversation=conv),
+            key=("conversation_update", guest_id)
+        )
+        join_data = {"userData": {"name": conv.clientName}, "conversationHistory": conv.messages.to_list(),
+                     "sessionId": self.session_keys.get(guest_id)}
+        websocket = None if isinstance(guest_ws, DetachedGuest) else guest_ws
+        position = await self.backend.enqueue_guest(guest_id, join_data, RESUME_PRIORITY, websocket)
+        self.queue_updates.changed()
+        logger.info("Cliente %s voltou para a fila (agente caiu). Posição: %d", guest_id, position, extra={"event": "guest_requeued", "guest_id": guest_id, "position": position})
+        try:
+            # `transfer_status` e não `agent_left`: o widget trata `agent_left` como fim do atendimento humano
+            await guest_ws.send_json(self.waiting_status(guest_id, position))
+        except Exception:
+            GUEST_SEND_ERROR.inc()
+
+    async def assign_to_free_agents(self):
+        """Agentes com vaga (deste worker e, via relay, dos outros) buscam clientes na fila."""
+        self.backend.announce_waiting()
+        for slot in list(self.router.agents.values()):
+            if slot.has_capacity:
+                await self.assign_waiting_guests(slot.websocket)
+
+    # ---
+    # --- HEARTBEAT (conexões meio-abertas)
+    # ---
+
+    def send_ping(self, websocket, frame: str):
+        """Ping de quem está em silêncio (chamado pela roda de timers, fora de corrotina)."""
+        if websocket in self.agent_outboxes:
+            self.send_to_agent(websocket, frame)
+        else:
+            self.spawn(self._send_quietly(websocket, frame))
+
+    def drop_unresponsive(self, websocket, kind: str):
+        HEARTBEAT_EXPIRED.labels(kind).inc()
+        self.spawn(self._drop_unresponsive(websocket, kind))
+
+    async def _drop_unresponsive(self, websocket, kind: str):
+        """Trata o silêncio como queda de rede: o agente sai e os clientes dele
+        voltam para a fila; o cliente cai com carência para retomar (ver
+        `detach_guest`). O socket é fechado depois, sem esperar o handshake de
+        fechamento que não vem."""
+        await self.disconnect(websocket, final=False)
+        try:
+            await websocket.close(code=HEARTBEAT_CLOSE_CODE, reason="Sem resposta ao heartbeat")
+        except Exception: pass
+
+    async def release_agent_slot(self, agent_ws: WebSocket, guest_ws, guest_id: Optional[str]):
+        """Libera a vaga do agente, avisa que o cliente saiu e puxa o próximo da fila."""
+        self.router.release(agent_ws, guest_ws)
+        if guest_id:
+            self.finish_handling(guest_id)
+        self.send_to_agent(agent_ws, {"type": "guest_left", "guest_id": guest_id, "message": "O cliente se desconectou."})
+        await self.assign_waiting_guests(agent_ws)
+
+    async def close_conversation(self, guest_id: str):
+        """Atualiza o status da conversa para 'closed' e transmite."""
+        self.session_keys.pop(guest_id, None)
+        self.finish_handling(guest_id)
+        await self.backend.clear_session(guest_id)
+        conv = await self.backend.get_conversation(guest_id)
+        if conv:
             conv.status = 'closed'
             conv.lastMessage = "Conversa encerrada."
-            await self.broadcast_to_all_agents({
-                "type": "conversation_update",
-                "conversation": conv.dict()
-            })
-        # -----------------------------------------------------------------
-
-    def find_available_agent(self) -> Optional[Tuple[WebSocket, User]]:
-        if self.available_agents:
-            return self.available_agents.popitem()
-        return None
+            await self.backend.save_conversation(conv)
+            self.broadcast_to_all_agents(
+                encode_event("conversation_update", conversation=conv),
+                key=("conversation_update", guest_id)
+            )
 
-    def find_waiting_guest(self) -> Optional[Tuple[WebSocket, dict, str]]:
-        if self.waiting_guests:
-            return self.waiting_guests.pop(0)
+    def find_available_agent(self, department: Optional[str] = None) -> Optional[Tuple[WebSocket, User]]:
+        """Agente (deste worker) menos carregado com vaga livre, preferindo o departamento pedido."""
+        slot = self.router.pick(department)
+        if slot:
+            return slot.websocket, slot.user
         return None
 
-    def link_session(self, guest_ws: WebSocket, agent_ws: WebSocket, agent_user: User, guest_id: str):
+    async def find_waiting_guest(self) -> Optional[WaitingGuest]:
+        return await self.backend.dequeue_guest()
+
+    # ---
+    # --- ESTIMATIVA DE ESPERA (posição e ETA de quem está na fila)
+    # ---
+
+    def service_rate(self) -> float:
+        """Atendimentos concluídos por segundo pelos agentes deste worker.
+
+        Cada agente contribui com capacidade / duração média dos atendimentos
+        dele (ou do departamento, ou geral; ver HandlingStats). Sem agentes,
+        conta como um atendimento por vez.
+        """
+        rate = sum(slot.capacity / self.handling_stats.mean(slot.user.email, slot.department)
+                   for slot in self.router.agents.values())
+        return rate or 1 / self.handling_stats.mean()
+
+    def waiting_status(self, guest_id: str, position: int) -> dict:
+        """`transfer_status` de quem entrou (ou voltou) para a fila, com a espera estimada."""
+        seconds = estimate_wait_seconds(position, self.service_rate())
+        minutes = wait_minutes(seconds)
+        self.queue_updates.track(guest_id, position, minutes)
+        return {"type": "transfer_status", "status": "waiting", "position": position,
+                "waitTime": minutes, "waitSeconds": round(seconds)}
+
+    async def send_queue_update(self, guest_id: str, position: int, seconds: float):
+        """Nova posição/espera de um cliente na fila (chamado pelo QueueNotifier, só para quem mudou)."""
+        guest_ws = self.guest_ws_map.get(guest_id)
+        if guest_ws is None:
+            return
+        try:
+            await guest_ws.send_json({"type": "queue_update", "position": position,
+                                      "waitTime": wait_minutes(seconds), "waitSeconds": round(seconds)})
+        except Exception as e:
+            logger.warning("Erro ao atualizar a fila do cliente %s: %s", guest_id, e, extra={"event": "guest_send_error"})
+            GUEST_SEND_ERROR.inc()
+
+    def finish_handling(self, guest_id: str):
+        """Fim de um atendimento: entra na média de duração do agente e do departamento."""
+        started = self.handling.pop(guest_id, None)
+        if started is not None:
+            began, agent, department = started
+            self.handling_stats.observe(time.monotonic() - began, agent, department)
+
+    async def link_session(self, guest_ws, agent_ws: WebSocket, agent_user: User, guest_id: str):
         """Liga os dois websockets e REGISTRA quem atendeu."""
         self.sessions[guest_ws] = agent_ws
-        self.reverse_sessions[agent_ws] = guest_ws
-        
+        self.router.assign(agent_ws, guest_ws)
+        slot = self.router.get(agent_ws)
+        self.handling[guest_id] = (time.monotonic(), agent_user.email, slot.department if slot else None)
+        await self.backend.set_session(guest_id, {
+            "agent_id": self.agent_ids.get(agent_ws), "agent_worker": self.worker_id,
+            "guest_worker": guest_ws.worker_id if isinstance(guest_ws, RemotePeer) else self.worker_id
+        })
+
         # --- NOVO: Registra o atendimento e transmite a atualização ---
-        conv = fake_conversations_db.get(guest_id)
+        conv = await self.backend.get_conversation(guest_id)
         if conv:
             conv.status = 'active'
             conv.agent_name = agent_user.name # <-- REGISTRO DE QUEM ATENDEU
             conv.unread = 0
             conv.lastMessage = "Atendente conectado."
-            print(f"Agente {agent_user.name} atendeu cliente {conv.clientName}")
-            
+            await self.backend.save_conversation(conv)
+            logger.info("Agente %s atendeu cliente %s", agent_user.name, conv.clientName, extra={"event": "session_linked", "guest_id": guest_id})
+
             # Transmite para todos os agentes que esta conversa foi "reivindicada"
-            # (asyncio.create_task para não bloquear)
-            import asyncio
-            asyncio.create_task(self.broadcast_to_all_agents({
-                "type": "conversation_update",
-                "conversation": conv.dict()
-            }))
+            # (só enfileira; as tasks escritoras de cada agente fazem o envio)
+            self.broadcast_to_all_agents(
+                encode_event("conversation_update", conversation=conv),
+                key=("conversation_update", guest_id)
+            )
         # -------------------------------------------------------------
 
     def get_agent_user(self, agent_ws: WebSocket) -> Optional[User]:
@@ -457,81 +1178,261 @@ class ConnectionManager:
     async def forward_to_agent(self, guest_ws: WebSocket, message_data: dict):
         """Envia mensagem do cliente para o agente ou armazena na fila."""
         agent_ws = self.sessions.get(guest_ws)
+        guest_id = self.guest_id_map.get(guest_ws)
 
         if agent_ws:
             # --- CASO 1: Cliente está em sessão ---
             # Encaminha a mensagem completa (com timestamp) para o agente
-            await agent_ws.send_json({
+            self.send_to_agent(agent_ws, {
                 "type": "client_message",
+                "guest_id": guest_id,
                 "message": message_data.get("message"),
                 "timestamp": message_data.get("timestamp")})
+            if isinstance(agent_ws, RemotePeer):
+                # Quem grava a transcrição da sessão é o worker do agente (um escritor só por conversa)
+                self.backend.relay(agent_ws.worker_id, {
+                    "op": "record_message", "guest_id": guest_id,
+                    "content": message_data.get("message"), "sender": "client"
+                })
+            else:
+                await self.record_message(guest_id, message_data.get("message"), "client")
         else:
             # --- CASO 2: Cliente não está em sessão (está na fila) ---
-            # Procura o cliente na fila e anexa a mensagem ao histórico.
-            for i, (ws, join_data) in enumerate(self.waiting_guests):
-                if ws == guest_ws:
-                    client_name = join_data.get("userData", {}).get("name", "Cliente")
-                    print(f"Cliente '{client_name}' enviou mensagem da fila. Armazenando.")
-
-                    # Converte a mensagem do formato 'user_message' para o formato 'conversationHistory'
-                    new_history_entry = {
-                        "text": message_data.get("message"),
-                        "isBot": False, # Veio do usuário
-                        "timestamp": message_data.get("timestamp")
-                    
-                    }
-
-                    # Garante que 'conversationHistory' exista e anexa a nova mensagem
-                    history = join_data.get("conversationHistory", [])
-                    if history is None: history = [] # Proteção extra
-                    history.append(new_history_entry)
-                    join_data["conversationHistory"] = history
-
-                    # Atualiza a entrada na fila
-                    self.waiting_guests[i] = (ws, join_data)
-
-                    # Notifica o cliente que a mensagem foi recebida
-                    # (Usamos 'agent_message' pois o chat-websocket.js já sabe lidar com ele)
-                    await guest_ws.send_json({
-                        "type": "agent_message",
-                        "message": "Sua mensagem foi recebida e será entregue ao próximo agente disponível."
-                    })
-                    
-                    return
+            # Converte a mensagem do formato 'user_message' para o formato 'conversationHistory'
+            new_history_entry = {
+                "text": message_data.get("message"),
+                "isBot": False, # Veio do usuário
+                "timestamp": message_data.get("timestamp")
+            }
+
+            # Anexa ao histórico guardado na fila (lookup O(1) por guest_id)
+            if guest_id and await self.backend.append_waiting_history(guest_id, new_history_entry):
+                logger.debug("Cliente %s enviou mensagem da fila. Armazenando.", guest_id, extra={"event": "queued_message", "guest_id": guest_id})
+                await self.record_message(guest_id, message_data.get("message"), "client")
+
+                # Notifica o cliente que a mensagem foi recebida
+                # (Usamos 'agent_message' pois o chat-websocket.js já sabe lidar com ele)
+                await guest_ws.send_json({
+                    "type": "agent_message",
+                    "message": "Sua mensagem foi recebida e será entregue ao próximo agente disponível."
+                })
+                return
 
             # Se não está em sessão E não está na fila (não deve acontecer)
-            print("Erro: Cliente enviou mensagem mas não está em sessão nem na fila.")
+            logger.warning("Cliente enviou mensagem mas não está em sessão nem na fila.", extra={"event": "orphan_guest_message"})
+
+    async def record_message(self, guest_id: Optional[str], content: Any, sender: str):
+        """Acrescenta a mensagem à transcrição da conversa e atualiza a `lastMessage`.
+
+        O append é O(1) numa `Transcript` (ver chat_transcript); a gravação
+        no store continua em lote (write-behind).
+        """
+        if not guest_id or not isinstance(content, str):
+            return
+        conv = await self.backend.get_conversation(guest_id)
+        if conv is None:
+            return
+        conv.messages.add(content, sender)
+        conv.lastMessage = content
+        await self.backend.save_conversation(conv)
+
+    def get_session_guest(self, agent_ws: WebSocket, guest_id: Optional[str] = None):
+        """Resolve para qual cliente vai o evento do agente.
+
+        Com vários chats simultâneos o agente deve informar o `guest_id`; sem ele,
+        só é possível resolver quando o agente está em um único chat.
+        """
+        slot = self.router.get(agent_ws)
+        if slot is None:
+            return None
+        if guest_id is not None:
+            guest_ws = self.guest_ws_map.get(guest_id) or self.remote_peers.get(("guest", guest_id))
+            return guest_ws if guest_ws in slot.guests else None
+        if len(slot.guests) == 1:
+            return next(iter(slot.guests))
+        return None
 
-    async def forward_to_guest(self, agent_ws: WebSocket, message: str):
-        guest_ws = self.reverse_sessions.get(agent_ws)
+    def reject_agent_event(self, agent_ws: WebSocket, evt_type: str, guest_id: Optional[str] = None):
+        """Avisa o agente de que o evento não foi entregue, em vez de descartá-lo em silêncio."""
+        slot = self.router.get(agent_ws)
+        if slot is None or not slot.guests:
+            code, text = "not_in_session", "Você não está em atendimento."
+        elif guest_id is None:
+            code, text = "guest_id_required", "Informe o guest_id: você está em mais de um atendimento."
+        else:
+            code, text = "unknown_guest", "Este cliente não está em atendimento com você."
+        logger.warning("Evento %s do agente não entregue (%s).", evt_type, code,
+                       extra={"event": "orphan_agent_message", "reason": code})
+        self.send_to_agent(agent_ws, {"type": "error", "code": code, "event": evt_type,
+                                      "guest_id": guest_id, "message": text})
+
+    async def forward_to_guest(self, agent_ws: WebSocket, message: str, guest_id: Optional[str] = None):
+        guest_ws = self.get_session_guest(agent_ws, guest_id)
         if guest_ws:
-            # --- NOVO: Atualiza a "lastMessage" no DB ---
-            guest_id = self.guest_id_map.get(guest_ws)
-            if guest_id and guest_id in fake_conversations_db:
-                fake_conversations_db[guest_id].lastMessage = message
-            # --------------------------------------------
+            self.typing.forget(guest_ws) # A mensagem encerra o "digitando..." no cliente
             await guest_ws.send_json({
                 "type": "agent_message",
                 "message": message
             })
+            await self.record_message(self.guest_id_of(guest_ws), message, "agent")
         else:
-            print("Erro: Agente enviou mensagem mas não está em sessão.")
-
-    async def forward_typing_to_guest(self, agent_ws: WebSocket, typing: bool):
-        guest_ws = self.reverse_sessions.get(agent_ws)
-        if guest_ws:
+            self.reject_agent_event(agent_ws, "agent_message", guest_id)
+
+    async def forward_typing_to_guest(self, agent_ws: WebSocket, typing: bool, guest_id: Optional[str] = None):
+        """Repassa só as transições do "digitando..." (ver TypingCoalescer)."""
+        guest_ws = self.get_session_guest(agent_ws, guest_id)
+        if guest_ws is None:
+            self.reject_agent_event(agent_ws, "agent_typing", guest_id)
+            return
+        if self.typing.update(guest_ws, bool(typing)):
             await guest_ws.send_json({
                 "type": "agent_typing",
-                "typing": typing
+                "typing": True
             })
 
+    def send_typing_stopped(self, guest_ws):
+        """typing=false adiado pelo TypingCoalescer (chamado fora de uma corrotina)."""
+        frame = encode_frame({"type": "agent_typing", "typing": False})
+        if isinstance(guest_ws, RemotePeer):
+            guest_ws.send_frame(frame)
+            return
+        self.spawn(self._send_quietly(guest_ws, frame))
+
+    def spawn(self, coro):
+        """Roda uma corrotina em segundo plano, guardando a referência da task até ela terminar."""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @staticmethod
+    async def _send_quietly(websocket, frame: str):
+        try:
+            await websocket.send_text(frame)
+        except Exception:
+            GUEST_SEND_ERROR.inc()
+
+    # ---
+    # --- RELAY ENTRE WORKERS (backend Redis)
+    # ---
+
+    async def handle_relay(self, op: dict):
+        """Executa, neste worker, uma operação publicada por outro worker."""
+        kind = op.get("op")
+
+        if kind == "broadcast":
+            key = op.get("key")
+            self.broadcast_to_all_agents(op["frame"], key=tuple(key) if key else None, relay=False)
+            self.queue_updates.changed(1) # A fila é compartilhada: pode ter andado em outro worker
+
+        elif kind == "deliver":
+            if op["kind"] == "agent":
+                agent_ws = self.agent_ws_map.get(op["id"])
+                if agent_ws:
+                    self.send_to_agent(agent_ws, op["frame"])
+            else:
+                guest_ws = self.guest_ws_map.get(op["id"])
+                if guest_ws:
+                    try:
+                        await guest_ws.send_text(op["frame"])
+                    except Exception as e:
+                        logger.warning("Erro ao entregar mensagem ao cliente %s: %s", op['id'], e, extra={"event": "guest_send_error"})
+                        GUEST_SEND_ERROR.inc()
+
+        elif kind == "close":
+            target = self.guest_ws_map.get(op["id"]) if op["kind"] == "guest" else self.agent_ws_map.get(op["id"])
+            if target:
+                try:
+                    await target.close(code=op.get("code", 1000))
+                except Exception: pass
+
+        elif kind == "queue_changed":
+            self.queue_updates.changed(1)
+            # Um cliente entrou na fila em outro worker: agentes livres daqui vão buscá-lo
+            for slot in list(self.router.agents.values()):
+                if slot.has_capacity:
+                    await self.assign_waiting_guests(slot.websocket)
+
+        elif kind == "requeue_guest":
+            # O agente (em outro worker) de um cliente daqui caiu: o cliente volta para a fila
+            guest_ws = self.guest_ws_map.get(op["guest_id"])
+            if guest_ws is not None:
+                await self.requeue_guest(guest_ws)
+                await self.assign_to_free_agents()
+
+        elif kind == "record_message":
+            # Mensagem de um cliente (conectado em outro worker) de um agente daqui
+            await self.record_message(op["guest_id"], op.get("content"), op.get("sender", "client"))
+
+        elif kind == "session_linked":
+            # Um agente de outro worker pegou um cliente que está conectado aqui
+            guest_id = op["guest_id"]
+            guest_ws = self.guest_ws_map.get(guest_id)
+            agent_peer = self.remote_peer(op["origin"], "agent", op["agent_id"])
+            if guest_ws is None:
+                self.backend.relay(op["origin"], {"op": "guest_left", "guest_id": guest_id, "agent_id": op["agent_id"]})
+                return
+            self.sessions[guest_ws] = agent_peer
+            try:
+                await guest_ws.send_json({
+                    "type": "transfer_status", "status": "connected",
+                    "agentName": op.get("agent_name"), "agentRole": "Atendente"
+                })
+            except Exception:
+                GUEST_SEND_ERROR.inc()
+
+        elif kind == "guest_left":
+            # Cliente (conectado em outro worker) de um agente daqui saiu
+            guest_peer = self.remote_peers.pop(("guest", op["guest_id"]), None)
+            agent_ws = self.agent_ws_map.get(op["agent_id"])
+            if guest_peer is not None:
+                self.sessions.pop(guest_peer, None)
+                self.typing.forget(guest_peer)
+                if agent_ws:
+                    await self.release_agent_slot(agent_ws, guest_peer, op["guest_id"])
+
+        elif kind == "agent_left":
+            # Agente (conectado em outro worker) de um cliente daqui saiu
+            guest_ws = self.guest_ws_map.pop(op["guest_id"], None)
+            if guest_ws is None:
+                return
+            agent_peer = self.sessions.pop(guest_ws, None)
+            self.guest_id_map.pop(guest_ws, None)
+            if isinstance(agent_peer, RemotePeer) and agent_peer not in self.sessions.values():
+                self.remote_peers.pop(("agent", agent_peer.peer_id), None)
+            try:
+                await guest_ws.send_json({"type": "agent_left", "message": "O atendente se desconectou."})
+                await guest_ws.close()
+            except Exception: pass
+
 # Instância global do gerenciador
-manager = ConnectionManager()
+manager = ConnectionManager(create_backend(conversation_store, Conversation))
+
+# Snapshot para warm restart: só com o estado no processo (no Redis ele já sobrevive ao deploy)
+snapshotter = None
+if SNAPSHOT_PATH and not manager.backend.distributed:
+    snapshotter = Snapshotter(lambda: (manager.snapshot_state(), conversation_store.snapshot_records()))
+
+Gauge("chat_agents_connected", "Agentes conectados neste worker", lambda: len(manager.router))
+Gauge("chat_guests_connected", "Clientes conectados neste worker", lambda: len(manager.guest_ws_map))
+Gauge("chat_sessions_active", "Sessões cliente-agente com o cliente neste worker", lambda: len(manager.sessions))
+Gauge("chat_waiting_queue_length", "Clientes na fila de espera", lambda: manager.backend.queue_length())
+Gauge("chat_agent_outbox_pending", "Frames pendentes nas filas de saída dos agentes",
+      lambda: sum(len(outbox) for outbox in manager.agent_outboxes.values()))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Formato texto do Prometheus; cada worker expõe os próprios números
+    return PlainTextResponse(await REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    if manager.draining:
+        await websocket.close(code=SERVICE_RESTART_CODE, reason="Servidor reiniciando")
+        return
+    limiter = InboundLimiter() # Token bucket por tipo de evento deste socket
     
     try:
         data = await websocket.receive_json()
@@ -544,40 +1445,72 @@ async def websocket_endpoint(websocket: WebSocket):
             if not user:
                 await websocket.close(code=1008, reason="Token inválido")
                 return
+            websocket = await negotiate_socket(websocket, data) # JSON, MessagePack e/ou deflate (ver chat_wire)
             
-            await manager.connect_agent(websocket, user)
+            await manager.connect_agent(
+                websocket, user,
+                capacity=data.get("capacity", DEFAULT_AGENT_CAPACITY),
+                department=data.get("department"),
+                last_seq=data.get("last_seq"),
+                epoch=data.get("epoch")
+            )
+            # Ping/pong só para quem pediu: painéis antigos não respondem ao ping e ficam com o ping do protocolo WebSocket
+            beat = manager.heartbeat.watch(websocket, "agent") if data.get("heartbeat") else None
             
             try:
                 while True:
                     data = await websocket.receive_json()
+                    if beat is not None:
+                        beat.touch() # Qualquer frame (inclusive o "pong") conta como sinal de vida
                     evt_type = data.get("type")
+                    metric_type = evt_type if evt_type in EVENTS_RECEIVED_BY_TYPE else "other"
+                    EVENTS_RECEIVED_BY_TYPE[metric_type].value += 1
+                    if not limiter.allow(evt_type):
+                        EVENTS_LIMITED_BY_TYPE[metric_type].value += 1
+                        if limiter.exhausted:
+                            await websocket.close(code=RATE_LIMIT_CLOSE_CODE, reason="Limite de eventos excedido")
+                            raise WebSocketDisconnect(RATE_LIMIT_CLOSE_CODE)
+                        continue
                     if evt_type == "agent_message":
-                        await manager.forward_to_guest(websocket, data.get("message"))
+                        await manager.forward_to_guest(websocket, data.get("message"), data.get("guest_id"))
                     elif evt_type == "agent_typing":
-                        await manager.forward_typing_to_guest(websocket, data.get("typing"))
-            except WebSocketDisconnect:
-                await manager.disconnect(websocket)
+                        await manager.forward_typing_to_guest(websocket, data.get("typing"), data.get("guest_id"))
+            except WebSocketDisconnect as e:
+                await manager.disconnect(websocket, restarting=e.code == SERVICE_RESTART_CODE)
             
         # --- É UM CLIENTE (VISITANTE) ---
         elif msg_type == "user_join":
+            websocket = await negotiate_socket(websocket, data)
             await manager.connect_guest(websocket, data)
+            beat = manager.heartbeat.watch(websocket, "guest") if data.get("heartbeat") else None
             
             try:
                 while True:
                     data = await websocket.receive_json()
+                    if beat is not None:
+                        beat.touch()
                     evt_type = data.get("type")
+                    metric_type = evt_type if evt_type in EVENTS_RECEIVED_BY_TYPE else "other"
+                    EVENTS_RECEIVED_BY_TYPE[metric_type].value += 1
+                    if not limiter.allow(evt_type):
+                        EVENTS_LIMITED_BY_TYPE[metric_type].value += 1
+                        if limiter.exhausted:
+                            await websocket.close(code=RATE_LIMIT_CLOSE_CODE, reason="Limite de eventos excedido")
+                            raise WebSocketDisconnect(RATE_LIMIT_CLOSE_CODE)
+                        continue
                     if evt_type == "user_message":
                         await manager.forward_to_agent(websocket, data)
-            except WebSocketDisconnect:
-                await manager.disconnect(websocket)
+            except WebSocketDisconnect as e:
+                await manager.disconnect(websocket, restarting=e.code == SERVICE_RESTART_CODE,
+                                         final=e.code in GUEST_FINAL_CLOSE_CODES)
                 
         else:
             await websocket.close(code=1003, reason="Tipo de mensagem inicial inválido")
 
     except WebSocketDisconnect:
-        print("Desconectado antes da autenticação.")
+        logger.debug("Desconectado antes da autenticação.", extra={"event": "disconnect_before_auth"})
     except Exception as e:
-        print(f"Erro no WebSocket: {e}")
+        logger.exception("Erro no WebSocket: %s", e, extra={"event": "websocket_error"})
         await manager.disconnect(websocket) # Garante que a desconexão seja tratada
 
 
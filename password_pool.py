@@ -0,0 +1,82 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import argon2
+from argon2.exceptions import VerifyMismatchError
+
+# --- Configuração do pool de hashing de senhas ---
+# Cada hash/verify do argon2id usa ~64 MiB e dezenas de ms de CPU. Rodam em
+# threads (o argon2-cffi solta o GIL), no máximo PASSWORD_HASH_WORKERS por vez.
+# 0 = roda direto no event loop (comportamento antigo, só para comparação).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "64"))  # Pedidos na fila antes de recusar
+
+
+class PasswordPoolBusy(Exception):
+    """Fila de hashing cheia: o chamador deve responder 503 e pedir para tentar depois."""
+
+
+class PasswordPool:
+    """Hash e verificação de senhas fora do event loop.
+
+    As chamadas ao argon2 vão para um pool de `workers` threads; um semáforo
+    limita quantas rodam ao mesmo tempo (memória ~ workers * 64 MiB) e no
+    máximo `max_waiting` pedidos esperam na fila — além disso `hash`/`verify`
+    levantam PasswordPoolBusy em vez de acumular trabalho durante um pico
+    de logins. O WebSocket nunca espera por um hash.
+    """
+
+    def __init__(self, hasher: Optional[argon2.PasswordHasher] = None, workers: int = PASSWORD_HASH_WORKERS,
+                 max_waiting: int = PASSWORD_HASH_MAX_WAITING):
+        self.hasher = hasher or argon2.PasswordHasher()
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2") if workers > 0 else None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hasher.hash, password)
+
+    async def verify(self, hashed_password: str, password: str) -> bool:
+        return await self._run(self._verify, hashed_password, password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        # Só lê os parâmetros do hash: barato, pode rodar no loop
+        try:
+            return self.hasher.check_needs_rehash(hashed_password)
+        except Exception:
+            return False
+
+    def _verify(self, hashed_password: str, password: str) -> bool:
+        try:
+            return self.hasher.verify(hashed_password, password)
+        except VerifyMismatchError: return False
+        except Exception: return False
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            raise PasswordPoolBusy()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # A vaga só é devolvida quando a thread termina, mesmo que o pedido seja cancelado
+        future.add_done_callback(lambda _: self._slots.release())
+        return await future
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -7,6 +7,7 @@ class ChatWebSocket {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.sessionId = this.generateSessionId();
+        this.resumeToken = null; // Recebido no 'session': volta para a mesma conversa se a conexão cair
     }
 
     generateSessionId() {
@@ -60,13 +61,9 @@ class ChatWebSocket {
             type: 'user_join',
             userData: this.getUserData(),
             conversationHistory: this.chatIA.conversationContext,
-            sessionId: this.sessionId
-        });
-        
-        this.chatIA.addMessage({
-            text: "✅ Conectado! Procurando atendente disponível...",
-            isBot: true,
-            timestamp: new Date()
+            sessionId: this.sessionId,
+            resumeToken: this.resumeToken,
+            heartbeat: true // Responde aos 'ping' do servidor (ver case 'ping')
         });
     }
 
@@ -74,6 +71,22 @@ class ChatWebSocket {
         console.log('🔄 Processando mensagem:', data);
         
         switch(data.type) {
+            case 'session':
+                this.resumeToken = data.resumeToken;
+                this.chatIA.addMessage({
+                    text: data.resumed
+                        ? "✅ Conexão restabelecida!"
+                        : "✅ Conectado! Procurando atendente disponível...",
+                    isBot: true,
+                    timestamp: new Date()
+                });
+                break;
+
+            case 'ping':
+                // Heartbeat do servidor: sem resposta a conexão é considerada morta
+                this.send({ type: 'pong' });
+                break;
+
             case 'welcome':
                 this.chatIA.addMessage({
                     text: data.message,
@@ -102,6 +115,12 @@ class ChatWebSocket {
             case 'transfer_status':
                 this.handleTransferStatus(data);
                 break;
+
+            case 'queue_update':
+                // Fila andou: atualiza o status no cabeçalho em vez de mandar outra mensagem no chat
+                document.getElementById('chatAgentStatus').textContent =
+                    `Na fila • ${data.position}º • ~${data.waitTime} min`;
+                break;
                 
             case 'agent_left':
                 this.handleAgentDisconnection(data.message);
@@ -137,6 +156,8 @@ class ChatWebSocket {
             this.showHumanQuickActions();
             
         } else if (data.status === 'waiting') {
+            document.getElementById('chatAgentStatus').textContent =
+                `Na fila • ${data.position}º • ~${data.waitTime} min`;
             this.chatIA.addMessage({
                 text: `⏳ **Você está na fila de atendimento**\n\nPosição: ${data.position}º\nTempo estimado: ${data.waitTime} minutos\n\nEnquanto isso, pode me contar mais sobre seu projeto!`,
                 isBot: true,
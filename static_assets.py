@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Pipeline dos arquivos estáticos: nomes com hash do conteúdo + gzip/brotli.
+
+Roda na inicialização do `main.py` (ou manualmente: `python static_assets.py`).
+Para cada arquivo de `static/` grava em ASSETS_BUILD_DIR uma cópia
+`nome.<hash>.ext` e, para os tipos de texto, as variantes `.gz` e `.br`
+pré-comprimidas, além de um `manifest.json` (caminho original -> caminho
+com hash). Os templates referenciam os arquivos por `asset_url(...)`, então
+cada deploy que muda um arquivo muda a URL e o navegador pode guardar a
+versão anterior para sempre (`Cache-Control: immutable`).
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from typing import Dict, Optional, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+STATIC_DIR = "static"
+ASSETS_BUILD_DIR = os.getenv("ASSETS_BUILD_DIR", "static_dist")
+ASSETS_URL_PREFIX = "/assets"
+STATIC_URL_PREFIX = "/static"  # Onde o main.py monta o STATIC_DIR original (StaticFiles)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".json", ".webmanifest", ".svg", ".ico", ".txt", ".html"}
+MIN_COMPRESSION_GAIN = 0.9  # Só guarda a variante se ficar abaixo de 90% do original
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """Codificações aceitas num Accept-Encoding (ignora as com q=0)."""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _write_atomic(path: str, data: bytes):
+    """Vários workers podem gerar o mesmo arquivo ao mesmo tempo: grava e renomeia."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetManifest:
+    """Gera e serve os arquivos estáticos com hash.
+
+    - `build` (re)gera o diretório de saída e o manifesto; arquivos com o
+      mesmo hash já gerados não são reescritos e os de hashes que saíram do
+      manifesto (versões anteriores) são apagados;
+    - `url` é exposto aos templates como `asset_url`;
+    - `resolve` escolhe, para um caminho com hash, a melhor variante aceita
+      pelo cliente (br > gzip > original).
+    """
+
+    def __init__(self, source: str = STATIC_DIR, build_dir: str = ASSETS_BUILD_DIR,
+                 url_prefix: str = ASSETS_URL_PREFIX, static_prefix: str = STATIC_URL_PREFIX):
+        self.source = source
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self.static_prefix = static_prefix
+        self.manifest: Dict[str, str] = {}  # "css/styles.css" -> "css/styles.3f2a9c1b7d4e.css"
+        self.files: Dict[str, Tuple[str, Dict[str, str]]] = {}  # caminho com hash -> (media type, variantes)
+
+    def build(self) -> Dict[str, str]:
+        manifest, files = {}, {}
+        manifest_path = os.path.join(self.build_dir, "manifest.json")
+        keep = {os.path.normpath(manifest_path)}
+        for root, _, names in os.walk(self.source):
+            for name in sorted(names):
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, self.source).replace(os.sep, "/")
+                with open(src, "rb") as f:
+                    data = f.read()
+                stem, ext = os.path.splitext(rel)
+                hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+                dest = os.path.join(self.build_dir, hashed)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                variants = {"identity": dest}
+                if not os.path.exists(dest):
+                    _write_atomic(dest, data)
+                if ext.lower() in COMPRESSIBLE_SUFFIXES:
+                    variants.update(self._compress(dest, data))
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                manifest[rel] = hashed
+                files[hashed] = (media_type, variants)
+                keep.update(os.path.normpath(path) for path in variants.values())
+        os.makedirs(self.build_dir, exist_ok=True)
+        _write_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        self.manifest, self.files = manifest, files
+        self._prune(keep)
+        return manifest
+
+    def _prune(self, keep: Set[str]) -> int:
+        """Apaga do diretório de saída o que não está no manifesto novo. Devolve quantos arquivos saíram."""
+        removed = 0
+        for root, _, names in os.walk(self.build_dir):
+            for name in names:
+                path = os.path.normpath(os.path.join(root, name))
+                if path in keep or name.endswith(".tmp"):
+                    continue  # .tmp: outro worker gravando agora (ver _write_atomic)
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass  # Outro worker apagou antes
+        return removed
+
+    @staticmethod
+    def _compress(dest: str, data: bytes) -> Dict[str, str]:
+        variants = {}
+        encoders = [("gzip", ".gz", lambda raw: gzip.compress(raw, 9, mtime=0))]
+        if brotli is not None:
+            encoders.insert(0, ("br", ".br", lambda raw: brotli.compress(raw, quality=11)))
+        for encoding, suffix, encode in encoders:
+            path = dest + suffix
+            if not os.path.exists(path):
+                packed = encode(data)
+                if len(packed) > len(data) * MIN_COMPRESSION_GAIN:
+                    continue
+                _write_atomic(path, packed)
+            variants[encoding] = path
+        return variants
+
+    def url(self, path: str) -> str:
+        hashed = self.manifest.get(path)
+        if hashed is None:
+            return f"{self.static_prefix}/{path}"  # Fora do manifesto: cai no StaticFiles
+        return f"{self.url_prefix}/{hashed}"
+
+    def resolve(self, hashed: str, accept_encoding: str = "") -> Optional[Tuple[str, str, Optional[str]]]:
+        """(arquivo, media type, Content-Encoding) da melhor variante, ou None."""
+        entry = self.files.get(hashed)
+        if entry is None:
+            return None
+        media_type, variants = entry
+        if len(variants) > 1 and accept_encoding:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding in ("br", "gzip"):
+                if encoding in variants and (encoding in accepted or "*" in accepted):
+                    return variants[encoding], media_type, encoding
+        return variants["identity"], media_type, None
+
+
+if __name__ == "__main__":
+    assets = AssetManifest()
+    for original, hashed in sorted(assets.build().items()):
+        variants = assets.files[hashed][1]
+        sizes = "  ".join(f"{enc}={os.path.getsize(path)}" for enc, path in variants.items())
+        print(f"{original:40} -> {hashed:48} {sizes}")
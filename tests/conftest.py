@@ -0,0 +1,27 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+# Sem snapshot de reinício a quente nos testes (ver chat_snapshot)
+os.environ.setdefault("CHAT_SNAPSHOT_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_conversation():
+    """Fábrica de `Conversation` (o modelo da API) com valores padrão sobrescrevíveis."""
+    from main_api import ClientInfo, Conversation
+
+    ids = itertools.count(1)
+
+    def make(conv_id=None, status="active", tags=(), messages=(), client_name="Márcia Gonçalves", **fields):
+        return Conversation(
+            id=conv_id or f"conv-{next(ids)}", clientName=client_name, lastMessage="", unread=0, time="10:30",
+            status=status, clientInfo=ClientInfo(email="marcia@clinica.com.br", phone="(31) 99876-5432"),
+            messages=list(messages), tags=list(tags), **fields,
+        )
+
+    return make
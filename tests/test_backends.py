@@ -0,0 +1,359 @@
+import asyncio
+import json
+
+import pytest
+
+import chat_backend
+from chat_backend import InMemoryBackend, RedisBackend, RemotePeer
+from chat_frames import encode_frame
+from chat_store import MemoryConversationStore, WriteBehindStore
+
+try:
+    import fakeredis
+except ImportError:  # Opcional: sem ele só os cenários do backend em memória rodam
+    fakeredis = None
+
+needs_fakeredis = pytest.mark.skipif(fakeredis is None, reason="fakeredis não instalado")
+
+
+def conversation_model():
+    from main_api import Conversation
+    return Conversation
+
+
+class Worker:
+    """Um backend "worker" mais o que ele recebeu de relay."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.received = []
+        self.arrived = asyncio.Event()
+
+    async def on_relay(self, op: dict):
+        self.received.append(op)
+        self.arrived.set()
+
+    async def next_op(self, timeout: float = 2.0) -> dict:
+        while not self.received:
+            self.arrived.clear()
+            await asyncio.wait_for(self.arrived.wait(), timeout)
+        return self.received.pop(0)
+
+    async def start(self):
+        await self.backend.start(self.on_relay)
+        return self
+
+    async def presence(self) -> dict:
+        if isinstance(self.backend, RedisBackend):
+            return {agent_id: json.loads(raw) for agent_id, raw in (await self.backend.client.hgetall(self.backend.k_agents)).items()}
+        return dict(self.backend.agents)
+
+    async def sessions(self) -> dict:
+        if isinstance(self.backend, RedisBackend):
+            return {guest_id: json.loads(raw) for guest_id, raw in (await self.backend.client.hgetall(self.backend.k_sessions)).items()}
+        return dict(self.backend.sessions)
+
+
+def memory_worker(server=None) -> Worker:
+    return Worker(InMemoryBackend(WriteBehindStore(MemoryConversationStore(), conversation_model())))
+
+
+def redis_worker(server) -> Worker:
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    store = WriteBehindStore(MemoryConversationStore(), conversation_model())
+    return Worker(RedisBackend(conversation_model(), client=client, prefix="test", store=store))
+
+
+@pytest.fixture(params=["memory", pytest.param("redis", marks=needs_fakeredis)])
+def make_worker(request):
+    """Fábrica de workers do mesmo backend (os do Redis compartilham o mesmo servidor falso)."""
+    server = fakeredis.FakeServer() if request.param == "redis" else None
+    factory = memory_worker if request.param == "memory" else redis_worker
+    return lambda: factory(server)
+
+
+def run(scenario):
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_queue_order_priority_and_positions(make_worker):
+    async def scenario():
+        worker = await make_worker().start()
+        backend = worker.backend
+        try:
+            assert await backend.enqueue_guest("g1", {"userData": {"name": "Ana"}}) == 1
+            assert await backend.enqueue_guest("g2", {"userData": {"name": "Bruno"}}) == 2
+            assert await backend.enqueue_guest("vip", {"userData": {"name": "Carla"}}, priority=1) == 1
+            assert await backend.queue_length() == 3
+            assert await backend.queue_positions_from(1) == {"vip": 1, "g1": 2, "g2": 3}
+            assert await backend.queue_positions_from(2) == {"g1": 2, "g2": 3}
+            assert backend.take_queue_changes() == 2  # O vip passou na frente de g1 e g2
+            assert backend.take_queue_changes() is None
+
+            assert await backend.append_waiting_history("g2", {"text": "oi", "isBot": False})
+            assert not await backend.append_waiting_history("nope", {"text": "oi", "isBot": False})
+
+            removed = await backend.remove_waiting_guest("g1")
+            assert removed.guest_id == "g1" and removed.join_data["userData"]["name"] == "Ana"
+            assert await backend.remove_waiting_guest("g1") is None
+            assert await backend.queue_position("g2") == 2
+            assert backend.take_queue_changes() == 2  # g1 estava na 2ª posição
+
+            first, second = await backend.dequeue_guest(), await backend.dequeue_guest()
+            assert (first.guest_id, first.priority) == ("vip", 1)
+            assert second.guest_id == "g2"
+            assert second.join_data["conversationHistory"] == [{"text": "oi", "isBot": False}]
+            assert second.worker_id == backend.worker_id
+            assert await backend.dequeue_guest() is None
+            assert await backend.queue_length() == 0
+        finally:
+            await backend.stop()
+
+    run(scenario)
+
+
+def test_sessions_and_agent_presence(make_worker):
+    async def scenario():
+        worker = await make_worker().start()
+        backend = worker.backend
+        try:
+            await backend.register_agent("a1", {"email": "ana@wpwebsolucoes.com.br", "worker_id": backend.worker_id})
+            await backend.register_agent("a2", {"email": "bruno@wpwebsolucoes.com.br", "worker_id": backend.worker_id})
+            await backend.unregister_agent("a1")
+            assert list(await worker.presence()) == ["a2"]
+
+            await backend.set_session("g1", {"agent_id": "a2", "worker_id": backend.worker_id})
+            assert await worker.sessions() == {"g1": {"agent_id": "a2", "worker_id": backend.worker_id}}
+            await backend.clear_session("g1")
+            assert await worker.sessions() == {}
+        finally:
+            await backend.stop()
+
+    run(scenario)
+
+
+def test_conversations_round_trip(make_worker, make_conversation):
+    async def scenario():
+        worker = await make_worker().start()
+        backend = worker.backend
+        try:
+            conv = make_conversation("c1", status="waiting", tags=["orçamento"])
+            await backend.save_conversation(conv)
+            await backend.save_conversation(make_conversation("c2", status="active"))
+            assert (await backend.get_conversation("c1")).tags == ["orçamento"]
+            assert await backend.get_conversation("nope") is None
+
+            items, _, version, _ = await backend.query_conversations({"status": "waiting"})
+            assert [c.id for c in items] == ["c1"]
+            conv.status = "active"
+            conv.messages.add("Preciso de um orçamento", "client")
+            await backend.save_conversation(conv)
+            items, _, _, _ = await backend.query_conversations(since=version)
+            assert [c.id for c in items] == ["c1"]
+            assert items[0].messages[-1]["content"] == "Preciso de um orçamento"
+
+            found, total = await backend.search_conversations("orcamento")
+            assert [c.id for c in found] == ["c1"] and total == 1
+            assert {c.id for c in await backend.list_conversations()} == {"c1", "c2"}
+        finally:
+            await backend.stop()
+
+    run(scenario)
+
+
+def test_memory_backend_has_no_remote_workers():
+    async def scenario():
+        worker = await memory_worker().start()
+        try:
+            worker.backend.broadcast(encode_frame({"type": "conversation_update"}))
+            worker.backend.announce_waiting()
+            with pytest.raises(RuntimeError):
+                RemotePeer(worker.backend, "outro", "guest", "g1").send_frame("{}")
+            await asyncio.sleep(0)
+            assert worker.received == []
+        finally:
+            await worker.backend.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_relay_between_workers():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        one, two = await redis_worker(server).start(), await redis_worker(server).start()
+        try:
+            await asyncio.sleep(0.05)  # Inscrições nos canais
+            frame = encode_frame({"type": "agent_message", "message": "Olá!"})
+            peer = RemotePeer(one.backend, two.backend.worker_id, "guest", "g1")
+            await peer.send_text(frame)
+            op = await two.next_op()
+            assert (op["op"], op["kind"], op["id"], op["frame"]) == ("deliver", "guest", "g1", frame)
+            assert op["origin"] == one.backend.worker_id
+
+            await peer.close(code=4000)
+            op = await two.next_op()
+            assert (op["op"], op["kind"], op["id"], op["code"]) == ("close", "guest", "g1", 4000)
+
+            one.backend.broadcast(frame, key="c1")
+            op = await two.next_op()
+            assert (op["op"], op["frame"], op["key"]) == ("broadcast", frame, "c1")
+            one.backend.announce_waiting()
+            assert (await two.next_op())["op"] == "queue_changed"
+
+            await asyncio.sleep(0.05)
+            assert one.received == []  # O próprio worker ignora o que publicou
+        finally:
+            await one.backend.stop()
+            await two.backend.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_listener_resubscribes_after_a_dropped_connection(monkeypatch):
+    monkeypatch.setattr(chat_backend, "REDIS_RECONNECT_MIN", 0.01)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        one, two = await redis_worker(server).start(), await redis_worker(server).start()
+        try:
+            await asyncio.sleep(0.05)  # Inscrições nos canais
+
+            async def dropped(*args, **kwargs):
+                raise ConnectionError("Connection reset by peer")
+
+            two.backend._pubsub.parse_response = dropped  # A leitura depois da próxima mensagem falha
+            before = encode_frame({"type": "agent_message", "message": "antes da queda"})
+            one.backend.broadcast(before)
+            assert (await two.next_op())["frame"] == before
+            assert (await two.next_op())["op"] == "queue_changed"  # Reassinou: fila revista
+
+            after = encode_frame({"type": "agent_message", "message": "de volta"})
+            one.backend.broadcast(after)
+            op = await two.next_op()
+            assert (op["op"], op["frame"]) == ("broadcast", after)
+        finally:
+            await one.backend.stop()
+            await two.backend.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_queue_is_shared_between_workers():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        one, two = await redis_worker(server).start(), await redis_worker(server).start()
+        try:
+            await one.backend.enqueue_guest("g1", {"userData": {"name": "Ana"}})
+            assert await two.backend.queue_position("g1") == 1
+            entry = await two.backend.dequeue_guest()
+            assert (entry.guest_id, entry.worker_id) == ("g1", one.backend.worker_id)
+            assert await one.backend.dequeue_guest() is None
+        finally:
+            await one.backend.stop()
+            await two.backend.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_appends_messages_instead_of_rewriting(make_conversation):
+    async def scenario():
+        backend = redis_worker(fakeredis.FakeServer()).backend
+        client = backend.client
+        conv = make_conversation("c1", messages=[{"text": "Olá!", "isBot": True, "timestamp": None}])
+        conv.messages.add("Quero um orçamento", "client")
+        await backend.save_conversation(conv)
+        first = await client.lrange(backend.messages_key("c1"), 0, -1)
+        conv.messages.add("Claro!", "agent")
+        conv.lastMessage = "Claro!"
+        await backend.save_conversation(conv)
+
+        stored = await client.lrange(backend.messages_key("c1"), 0, -1)
+        assert stored[:2] == first and len(stored) == 3
+        assert "messages" not in json.loads(await client.hget(backend.k_conversations, "c1"))
+        loaded = await backend.get_conversation("c1")
+        assert loaded == conv and loaded.messages.to_list() == conv.messages.to_list()
+
+        # Registro gravado antes da lista existir: JSON completo no hash
+        legacy = make_conversation("old", messages=[{"text": "Oi", "isBot": False, "timestamp": None}])
+        await client.hset(backend.k_conversations, "old", legacy.model_dump_json())
+        assert await backend.get_conversation("old") == legacy
+        assert {c.id for c in await backend.list_conversations()} == {"c1", "old"}
+        await backend.store.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_save_from_a_stale_copy_never_drops_messages(make_conversation):
+    async def scenario():
+        backend = redis_worker(fakeredis.FakeServer()).backend
+        conv = make_conversation("c1")
+        conv.messages.add("Olá", "client")
+        await backend.save_conversation(conv)
+
+        # Dois workers leem a mesma conversa; os dois gravam depois
+        closing, replying = await backend.get_conversation("c1"), await backend.get_conversation("c1")
+        fresh = await backend.get_conversation("c1")
+        fresh.messages.add("Mensagem do agente", "agent")
+        fresh.lastMessage = "Mensagem do agente"
+        await backend.save_conversation(fresh)
+
+        closing.status = "closed"
+        await backend.save_conversation(closing)  # Cópia atrasada, sem mensagens próprias
+        replying.messages.add("Resposta do cliente", "client")
+        replying.lastMessage = "Resposta do cliente"
+        await backend.save_conversation(replying)  # Cópia atrasada com uma mensagem nova
+        rebuilt = make_conversation("c1", status="closed")  # Montada do zero: não sabe o que está gravado
+        await backend.save_conversation(rebuilt)
+
+        loaded = await backend.get_conversation("c1")
+        assert [m["content"] for m in loaded.messages] == ["Olá", "Mensagem do agente", "Resposta do cliente"]
+        assert loaded.status == "closed" and loaded.lastMessage == "Resposta do cliente"
+
+        await backend.replace_messages(rebuilt)  # Encurtar só de propósito
+        assert len((await backend.get_conversation("c1")).messages) == 0
+        await backend.store.stop()
+
+    run(scenario)
+
+
+@needs_fakeredis
+def test_redis_archives_closed_conversations(make_conversation):
+    async def scenario():
+        backend = redis_worker(fakeredis.FakeServer()).backend
+        client = backend.client
+        closed = make_conversation("closed", status="closed", tags=["orçamento"])
+        closed.messages.add("Obrigado!", "client")
+        await backend.save_conversation(closed)
+        await backend.save_conversation(make_conversation("open", tags=["orçamento"]))
+        reopened = make_conversation("reopened", status="closed")
+        await backend.save_conversation(reopened)
+        reopened.status = "active"
+        await backend.save_conversation(reopened)
+
+        later = make_conversation("later", status="closed")
+        await backend.save_conversation(later)
+
+        assert await backend.archive_closed(max_closed=10) == 0  # Dentro da retenção
+        assert await backend.archive_closed(max_closed=1) == 1  # Além da quantidade: a mais antiga sai
+        assert await client.zrange(backend.k_conv_closed, 0, -1) == ["later"]
+        assert await backend.archive_closed(max_closed=10, max_age=0) == 1  # Além da idade
+
+        assert set(await client.hkeys(backend.k_conversations)) == {"open", "reopened"}
+        assert not await client.exists(backend.messages_key("closed"))
+        assert await client.zscore(backend.k_conv_versions, "closed") is None
+        assert await client.smembers(backend.conversation_index_key("tag", "orçamento")) == {"open"}
+        assert await client.zcard(backend.k_conv_closed) == 0
+
+        archived = await backend.get_conversation("closed")  # Agora vem do store
+        assert archived == closed
+        found, _ = await backend.search_conversations("obrigado")
+        assert [c.id for c in found] == ["closed"]
+        assert await backend.archive_closed(max_closed=0) == 0
+        await backend.store.stop()
+
+    run(scenario)
@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main_api
+
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Um ciclo de vida só: o desligamento drena o `manager`, que é global do módulo
+    with TestClient(main_api.app) as client:
+        yield client
+
+
+def receive(ws, frame_type: str, limit: int = 20) -> dict:
+    """Próximo frame do tipo pedido, pulando os demais (broadcasts, sync...)."""
+    for _ in range(limit):
+        frame = ws.receive_json()
+        if frame["type"] == frame_type:
+            return frame
+    raise AssertionError(f"nenhum frame {frame_type!r} em {limit} frames")
+
+
+def join(ws, name: str, message: str) -> str:
+    ws.send_json({"type": "user_join", "userData": {"name": name, "message": message}})
+    return receive(ws, "session")["guest_id"]
+
+
+def test_guest_queue_agent_message_flow(client):
+    token = main_api.create_access_token({"sub": AGENT_EMAIL})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with client.websocket_connect("/ws/chat") as ana, client.websocket_connect("/ws/chat") as bruno, \
+            client.websocket_connect("/ws/chat") as agent:
+        # Sem atendente: o cliente espera na fila
+        ana_id = join(ana, "Ana", "Quero um orçamento")
+        waiting = receive(ana, "transfer_status")
+        assert (waiting["status"], waiting["position"]) == ("waiting", 1)
+        bruno_id = join(bruno, "Bruno", "Qual o prazo?")
+        assert receive(bruno, "transfer_status")["position"] == 2
+
+        agent.send_json({"type": "agent_auth", "token": token, "capacity": 2})
+        # O atendente livre puxa a fila, na ordem de chegada
+        assert receive(agent, "new_conversation")["guest_id"] == ana_id
+        assert receive(agent, "new_conversation")["guest_id"] == bruno_id
+        assert receive(ana, "transfer_status")["status"] == "connected"
+        assert receive(bruno, "transfer_status")["status"] == "connected"
+
+        ana.send_json({"type": "user_message", "message": "Site institucional, 5 páginas"})
+        forwarded = receive(agent, "client_message")
+        assert forwarded["guest_id"] == ana_id
+
+        # Dois chats e nenhum guest_id: o atendente recebe um erro em vez de a mensagem sumir
+        agent.send_json({"type": "agent_message", "message": "Para quem?"})
+        error = receive(agent, "error")
+        assert (error["code"], error["event"]) == ("guest_id_required", "agent_message")
+
+        agent.send_json({"type": "agent_message", "message": "Olá, Ana!", "guest_id": ana_id})
+        assert receive(ana, "agent_message")["message"] == "Olá, Ana!"
+
+        conv = client.get(f"/conversations/{ana_id}", headers=headers).json()
+        assert [(m["sender"], m["content"]) for m in conv["messages"]] == [
+            ("client", "Quero um orçamento"),
+            ("client", "Site institucional, 5 páginas"),
+            ("agent", "Olá, Ana!"),
+        ]
+        assert conv["status"] == "active" and conv["lastMessage"] == "Olá, Ana!"
+
+
+def test_agent_without_capacity_takes_one_chat(client):
+    token = main_api.create_access_token({"sub": AGENT_EMAIL})
+    with client.websocket_connect("/ws/chat") as agent, client.websocket_connect("/ws/chat") as ana, \
+            client.websocket_connect("/ws/chat") as bruno:
+        agent.send_json({"type": "agent_auth", "token": token})  # Painel antigo: sem capacity nem guest_id
+        receive(agent, "status")
+        ana_id = join(ana, "Ana", "Oi")
+        assert receive(ana, "transfer_status")["status"] == "connected"
+        join(bruno, "Bruno", "Oi")
+        assert receive(bruno, "transfer_status")["status"] == "waiting"
+
+        # Um chat só: a mensagem sem guest_id tem destino certo
+        agent.send_json({"type": "agent_message", "message": "Olá!"})
+        assert receive(ana, "agent_message")["message"] == "Olá!"
+        assert receive(agent, "new_conversation")["guest_id"] == ana_id
+        assert len(main_api.manager.heartbeat) == 0  # Ninguém pediu o heartbeat da aplicação
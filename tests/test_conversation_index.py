@@ -0,0 +1,83 @@
+import asyncio
+
+from chat_backend import InMemoryBackend
+from chat_index import ConversationIndex
+from chat_store import MemoryConversationStore, WriteBehindStore
+
+
+def test_since_returns_only_changes_after_version(make_conversation):
+    index = ConversationIndex()
+    a, b, c = make_conversation("a"), make_conversation("b"), make_conversation("c")
+    for conv in (a, b, c):
+        index.update(conv)
+    assert index.query(since=0) == (["a", "b", "c"], None)
+    version = index.version
+    index.update(a)
+    assert index.query(since=version) == (["a"], None)
+    assert index.query(since=index.version) == ([], None)
+
+
+def test_cursor_pages_newest_first(make_conversation):
+    index = ConversationIndex()
+    for conv_id in "abcde":
+        index.update(make_conversation(conv_id))
+    page, cursor = index.query(limit=2)
+    assert page == ["e", "d"]
+    page, cursor = index.query(cursor=cursor, limit=2)
+    assert page == ["c", "b"]
+    assert index.query(cursor=cursor, limit=2) == (["a"], None)
+
+
+def test_filters_follow_updates(make_conversation):
+    index = ConversationIndex()
+    conv = make_conversation("a", status="waiting", tags=["orçamento"])
+    index.update(conv)
+    index.update(make_conversation("b", status="active"))
+    assert index.query({"status": "waiting", "tag": "orçamento"}) == (["a"], None)
+    conv.status = "closed"
+    index.update(conv)
+    assert index.query({"status": "waiting"}) == ([], None)
+    assert index.query({"status": "closed"}) == (["a"], None)
+    index.discard("a")
+    assert index.query({"tag": "orçamento"}) == ([], None)
+
+
+def test_each_index_has_its_own_epoch():
+    assert ConversationIndex().epoch != ConversationIndex().epoch
+
+
+def test_reading_an_archived_conversation_is_not_a_delta(make_conversation):
+    async def scenario():
+        store = WriteBehindStore(MemoryConversationStore(), type(make_conversation()))
+        archived = make_conversation("old", status="closed", messages=[
+            {"text": "Preciso de um orçamento", "isBot": False, "timestamp": None}])
+        store.save(archived)
+        await store.flush()
+        store.evict(["old"])
+        version = store.index.version
+
+        assert (await store.get("old")).id == "old"
+        found, total = await store.search("orcamento")
+        assert [conv.id for conv in found] == ["old"] and total == 1
+        assert store.index.version == version
+        assert store.index.query(since=version) == ([], None)
+        await store.stop()
+
+    asyncio.run(scenario())
+
+
+def test_since_from_another_epoch_returns_everything(make_conversation):
+    async def scenario():
+        backend = InMemoryBackend(WriteBehindStore(MemoryConversationStore(), type(make_conversation())))
+        for conv_id in "abc":
+            await backend.save_conversation(make_conversation(conv_id))
+        items, _, version, epoch = await backend.query_conversations(since=0)
+        assert [conv.id for conv in items] == ["a", "b", "c"]
+
+        items, _, _, _ = await backend.query_conversations(since=version, epoch=epoch)
+        assert items == []
+        items, _, _, current = await backend.query_conversations(since=version, epoch="outro-epoch")
+        assert current == epoch
+        assert [conv.id for conv in items] == ["a", "b", "c"]
+
+    asyncio.run(scenario())
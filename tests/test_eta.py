@@ -0,0 +1,57 @@
+import asyncio
+
+from chat_eta import QueueNotifier
+from chat_queue import WaitingQueue
+
+
+def make_notifier(queue: WaitingQueue, sent: list) -> QueueNotifier:
+    async def positions_from(start):
+        read.append(start)
+        return queue.positions_from(start)
+
+    async def send(guest_id, position, seconds):
+        sent.append((guest_id, position))
+
+    read = []
+    notifier = QueueNotifier(positions_from, queue.take_changed, lambda: 1 / 60, send)
+    notifier.reads = read
+    return notifier
+
+
+def test_flush_only_visits_guests_behind_the_change():
+    async def scenario():
+        queue, sent = WaitingQueue(), []
+        notifier = make_notifier(queue, sent)
+        for i, guest_id in enumerate("abcde"):
+            queue.push(f"ws-{guest_id}", {}, guest_id)
+            notifier.track(guest_id, i + 1, i + 1)
+        assert await notifier.flush() == 0 and notifier.reads == []  # Nada mudou
+
+        queue.remove_guest("d")
+        assert await notifier.flush() == 1
+        assert notifier.reads == [4] and sent == [("e", 4)]
+        assert "d" in notifier.sent  # Fora do trecho lido: fica até uma rodada completa
+
+        queue.pop()
+        assert await notifier.flush() == 3
+        assert notifier.reads == [4, 1]
+        assert sent[1:] == [("b", 1), ("c", 2), ("e", 3)]
+        assert set(notifier.sent) == {"b", "c", "e"}
+
+    asyncio.run(scenario())
+
+
+def test_changed_one_rechecks_the_whole_queue():
+    async def scenario():
+        queue, sent = WaitingQueue(), []
+        notifier = make_notifier(queue, sent)
+        for i, guest_id in enumerate("ab"):
+            queue.push(f"ws-{guest_id}", {}, guest_id)
+            notifier.track(guest_id, i + 1, i + 1)
+        notifier.changed(1)  # Ex.: um agente entrou e o ritmo de atendimento mudou
+        notifier.throughput = lambda: 2 / 60
+        assert await notifier.flush() == 1  # Só "b" teve a espera alterada (1 min em vez de 2)
+        assert notifier.reads == [1] and sent == [("b", 2)]
+        notifier.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import json
+
+from chat_events import EventLog
+from chat_frames import encode_frame
+
+
+def event(log: EventLog, n: int, key=None) -> str:
+    return log.append(encode_frame({"type": "conversation_update", "n": n}), key)
+
+
+def numbers(events) -> list:
+    return [json.loads(frame)["n"] for _, frame in events]
+
+
+def test_append_stamps_increasing_seq():
+    log = EventLog()
+    frames = [json.loads(event(log, n)) for n in range(3)]
+    assert [frame["seq"] for frame in frames] == [1, 2, 3]
+    assert frames[0] == {"seq": 1, "type": "conversation_update", "n": 0}
+    assert log.seq == 3 and len(log) == 3
+
+
+def test_since_replays_only_what_was_missed():
+    log = EventLog()
+    for n in range(5):
+        event(log, n)
+    assert numbers(log.since(0)) == [0, 1, 2, 3, 4]
+    assert numbers(log.since(3)) == [3, 4]
+    assert log.since(5) == []
+    assert log.since(6) is None  # seq do futuro: outro processo
+    assert log.since(None) is None
+
+
+def test_since_rejects_other_epoch_and_gaps_beyond_the_buffer():
+    log = EventLog(size=3)
+    for n in range(5):
+        event(log, n)
+    assert log.since(2, log.epoch) is not None
+    assert log.since(2, "outro-epoch") is None
+    assert log.since(1) is None  # O evento 2 já saiu do buffer
+    assert numbers(log.since(2)) == [2, 3, 4]
+
+
+def test_replay_coalesces_by_key():
+    log = EventLog()
+    event(log, 0, ("conversation_update", "c1"))
+    event(log, 1)
+    event(log, 2, ("conversation_update", "c1"))
+    event(log, 3, ("conversation_update", "c2"))
+    replay = log.since(0)
+    assert numbers(replay) == [1, 2, 3]
+    assert [key for key, _ in replay] == [None, ("conversation_update", "c1"), ("conversation_update", "c2")]
+
+
+def test_restore_continues_epoch_and_numbering():
+    log = EventLog()
+    event(log, 0, ("conversation_update", "c1"))
+    event(log, 1)
+    state = json.loads(json.dumps(log.dump()))  # Como vai no snapshot: tuplas viram listas
+
+    restored = EventLog()
+    restored.restore(state)
+    assert (restored.epoch, restored.seq) == (log.epoch, log.seq)
+    assert restored.since(0, log.epoch) == log.since(0, log.epoch)
+    assert json.loads(event(restored, 2))["seq"] == 3
+    restored.restore(None)
+    assert restored.seq == 3
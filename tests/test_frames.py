@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import chat_frames
+import main_api
+from chat_frames import Frame, encode_event, encode_frame, stamp_frame
+from chat_outbox import AgentOutbox
+from tests.test_outbox import FakeSocket, settle
+from tests.test_snapshot import new_manager
+
+
+def test_encode_event_matches_the_json_of_the_message(make_conversation, monkeypatch):
+    monkeypatch.setattr(chat_frames, "_retain_messages", False)
+    conv = make_conversation("c1", tags=["orçamento"])
+    frame = encode_event("conversation_update", conversation=conv, guest_id="c1")
+
+    assert type(frame) is str  # Sem clientes MessagePack, nada de mensagem junto
+    assert json.loads(frame) == {
+        "type": "conversation_update", "conversation": json.loads(conv.model_dump_json()), "guest_id": "c1"}
+    assert json.loads(encode_frame({"type": "status", "message": "ação"})) == {"type": "status", "message": "ação"}
+
+
+def test_stamp_frame_adds_seq_without_decoding(make_conversation, monkeypatch):
+    monkeypatch.setattr(chat_frames, "_retain_messages", False)
+    frame = encode_event("conversation_update", conversation=make_conversation("c1"))
+    stamped = stamp_frame(frame, 7)
+    assert stamped.startswith('{"seq":7,"type":"conversation_update"')
+    assert json.loads(stamped) == {"seq": 7, **json.loads(frame)}
+
+    monkeypatch.setattr(chat_frames, "_retain_messages", True)
+    retained = stamp_frame(encode_event("conversation_update", conversation=make_conversation("c2")), 8)
+    assert isinstance(retained, Frame) and retained.message == json.loads(retained)
+
+
+def test_broadcast_encodes_once_and_reuses_the_frame_for_every_agent(make_conversation, monkeypatch):
+    monkeypatch.setattr(chat_frames, "_retain_messages", False)
+
+    async def scenario():
+        _, manager = new_manager()
+        sockets = [FakeSocket() for _ in range(3)]
+        for socket in sockets:
+            manager.agent_outboxes[socket] = AgentOutbox(socket)
+        encoded = []
+        dump = main_api.Conversation.model_dump_json
+        monkeypatch.setattr(main_api.Conversation, "model_dump_json",
+                            lambda self, **kw: encoded.append(self.id) or dump(self, **kw))
+
+        manager.broadcast_to_all_agents(encode_event("conversation_update", conversation=make_conversation("c1")))
+        await settle()
+
+        assert encoded == ["c1"]  # Serializada uma vez, não uma por agente
+        frames = [socket.sent[0] for socket in sockets]
+        assert all(frame is frames[0] for frame in frames)  # O mesmo objeto em todas as filas
+        assert [frame for _, frame in manager.events.since(0)] == [frames[0]]  # E no buffer de replay
+        assert json.loads(frames[0])["seq"] == 1
+        for outbox in manager.agent_outboxes.values():
+            outbox.close()
+
+    asyncio.run(scenario())
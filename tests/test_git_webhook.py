@@ -0,0 +1,173 @@
+import asyncio
+import importlib.util
+import os
+import stat
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_webhook():
+    # git-webhook.py não é importável pelo nome (hífen) e configura o log num arquivo ao ser importado
+    os.environ.setdefault("WEBHOOK_LOG_FILE", os.path.join(tempfile.gettempdir(), "webhook-test.log"))
+    spec = importlib.util.spec_from_file_location("git_webhook", os.path.join(ROOT, "git-webhook.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+webhook = load_webhook()
+
+
+def stub_script(tmp_path, body: str) -> str:
+    path = tmp_path / "deploy.sh"
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condição não atingida a tempo"
+        await asyncio.sleep(0.01)
+
+
+def test_pushes_during_a_deploy_are_coalesced(tmp_path):
+    gate = tmp_path / "gate"
+    script = stub_script(tmp_path, f'echo "deploy $DEPLOY_ID $DEPLOY_SHA por $1 em $2"\n'
+                                   f'while [ ! -f "{gate}" ]; do sleep 0.01; done\n')
+
+    async def scenario():
+        queue = webhook.DeployQueue(script=script, work_dir=str(tmp_path), timeout=10)
+        queue.start()
+        try:
+            first = queue.submit("sha1", "ana")
+            assert first.status == "queued"
+            await wait_for(lambda: first.status == "running")
+            assert queue.submit("sha1", "ana") is first  # Reentrega do push que já está rodando
+
+            second = queue.submit("sha2", "bruno")
+            assert queue.submit("sha3", "carla") is second
+            assert (second.status, second.sha, second.pushes) == ("queued", "sha3", 2)
+            assert second.pushers == ["bruno", "carla"]
+
+            gate.touch()
+            await wait_for(lambda: second.done)
+            assert (first.status, first.returncode) == ("succeeded", 0)
+            assert (second.status, second.returncode) == ("succeeded", 0)
+            assert first.output == ["deploy 1 sha1 por ana em refs/heads/main"]
+            assert second.output == ["deploy 2 sha3 por carla em refs/heads/main"]
+            assert first.started_at <= first.finished_at <= second.started_at
+            assert list(queue.jobs) == [1, 2]
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_follow_reports_status_transitions_and_failure(tmp_path):
+    script = stub_script(tmp_path, 'echo "migrando"\necho "erro" >&2\nexit 3\n')
+
+    async def scenario():
+        queue = webhook.DeployQueue(script=script, work_dir=str(tmp_path), timeout=10)
+        queue.start()
+        try:
+            job = queue.submit("abc", "ana")
+            lines = [line async for line in job.follow()]
+        finally:
+            await queue.stop()
+        return job, lines
+
+    job, lines = asyncio.run(scenario())
+    assert (job.status, job.returncode) == ("failed", 3)
+    assert lines[0] == "# deploy 1 queued sha=abc pusher=ana"
+    assert "# deploy 1 running sha=abc pusher=ana" in lines
+    assert lines[-3:] == ["migrando", "erro", "# deploy 1 failed (exit 3)"]
+
+
+def test_timeout_kills_the_script(tmp_path):
+    script = stub_script(tmp_path, "exec sleep 5\n")
+
+    async def scenario():
+        queue = webhook.DeployQueue(script=script, work_dir=str(tmp_path), timeout=0.2)
+        queue.start()
+        try:
+            job = queue.submit("abc", "ana")
+            await wait_for(lambda: job.done)
+        finally:
+            await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.returncode) == ("failed", None)
+    assert job.output[-1].startswith("Deploy excedeu")
+
+
+def test_timeout_covers_the_exit_not_just_the_output(tmp_path):
+    script = stub_script(tmp_path, 'echo "fechando a saída"\nexec sleep 5 >/dev/null 2>&1\n')
+
+    async def scenario():
+        queue = webhook.DeployQueue(script=script, work_dir=str(tmp_path), timeout=0.3)
+        queue.start()
+        try:
+            job = queue.submit("abc", "ana")
+            await wait_for(lambda: job.done, timeout=2)
+        finally:
+            await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.returncode) == ("failed", None)
+    assert job.output == ["fechando a saída", "Deploy excedeu 0s e foi interrompido"]
+
+
+def test_stop_kills_and_reaps_the_running_script(tmp_path):
+    pid_file = tmp_path / "pid"
+    script = stub_script(tmp_path, f'echo $$ > "{pid_file}"\nexec sleep 5\n')
+
+    async def scenario():
+        queue = webhook.DeployQueue(script=script, work_dir=str(tmp_path), timeout=10)
+        queue.start()
+        job = queue.submit("abc", "ana")
+        await wait_for(lambda: pid_file.exists() and pid_file.read_text().strip())
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.output[-1]) == ("failed", "Deploy interrompido (webhook encerrado)")
+    with pytest.raises(ProcessLookupError):  # Morto e recolhido: nem zumbi sobrou
+        os.kill(int(pid_file.read_text()), 0)
+
+
+@pytest.fixture
+def deploys_token(monkeypatch):
+    monkeypatch.setattr(webhook, "DEPLOYS_TOKEN", "token-dos-deploys")
+    return "token-dos-deploys"
+
+
+@pytest.mark.parametrize("path", ["/deploys", "/deploys/1", "/deploys/1?follow=false"])
+def test_deploys_require_token(path, deploys_token):
+    client = TestClient(webhook.app)
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer errado"}).status_code == 401
+    assert client.get(path, headers={"Authorization": f"Bearer {webhook.SECRET}"}).status_code == 401
+    response = client.get(path, headers={"Authorization": f"Bearer {deploys_token}"})
+    assert response.status_code in (200, 404)
+
+
+def test_deploys_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(webhook, "DEPLOYS_TOKEN", "")
+    client = TestClient(webhook.app)
+    for headers in ({}, {"Authorization": "Bearer "}, {"Authorization": f"Bearer {webhook.SECRET}"}):
+        assert client.get("/deploys", headers=headers).status_code == 404
+
+
+def test_deploys_list_with_token(deploys_token):
+    client = TestClient(webhook.app)
+    response = client.get("/deploys", headers={"Authorization": f"Bearer {deploys_token}"})
+    assert response.status_code == 200
+    assert response.json() == {"deploys": []}
@@ -0,0 +1,144 @@
+import asyncio
+import types
+
+import pytest
+
+import chat_heartbeat
+from chat_heartbeat import PING_FRAME, HeartbeatMonitor, TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Relógio manual só para o módulo (o asyncio continua com o relógio de verdade)
+    clock = Clock()
+    monkeypatch.setattr(chat_heartbeat, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def run(scenario):
+    asyncio.run(scenario())
+
+
+def test_wheel_fires_on_the_due_tick(clock):
+    async def scenario():
+        fired = []
+        wheel = TimerWheel(lambda key: fired.append(key), tick=1.0, slots=8)
+        wheel.schedule("a", 3)
+        wheel.schedule("b", 5)
+        wheel.schedule("c", 3)
+        wheel.cancel("c")
+        assert len(wheel) == 2
+        assert wheel.advance(2) == 0
+        assert wheel.advance(3) == 1 and fired == ["a"]
+        assert wheel.advance(10) == 1 and fired == ["a", "b"]
+        assert len(wheel) == 0
+        wheel.close()
+
+    run(scenario)
+
+
+def test_wheel_waits_for_remaining_revolutions(clock):
+    async def scenario():
+        fired = []
+        wheel = TimerWheel(lambda key: fired.append(key), tick=1.0, slots=4)
+        wheel.schedule("far", 10)  # Mesma posição dos ticks 2 e 6
+        assert wheel.advance(9) == 0
+        assert wheel.advance(10) == 1 and fired == ["far"]
+        wheel.close()
+
+    run(scenario)
+
+
+def test_wheel_reschedules_with_returned_delay(clock):
+    async def scenario():
+        fired = []
+
+        def on_due(key):
+            fired.append(clock.now)
+            return 2 if len(fired) < 3 else None
+
+        wheel = TimerWheel(on_due, tick=1.0, slots=8)
+        wheel.schedule("k", 2)
+        for tick in range(1, 12):
+            clock.now = 1000.0 + tick
+            wheel.advance(wheel._now_tick())
+        assert fired == [1002.0, 1004.0, 1006.0]
+        assert len(wheel) == 0
+        wheel.close()
+
+    run(scenario)
+
+
+def test_wheel_survives_callback_errors(clock):
+    async def scenario():
+        fired = []
+
+        def on_due(key):
+            if key == "bad":
+                raise RuntimeError("boom")
+            fired.append(key)
+
+        wheel = TimerWheel(on_due, tick=1.0, slots=8)
+        wheel.schedule("bad", 1)
+        wheel.schedule("good", 1)
+        assert wheel.advance(1) == 2
+        assert fired == ["good"]
+        wheel.close()
+
+    run(scenario)
+
+
+def test_monitor_pings_quiet_peers_and_expires_silent_ones(clock):
+    async def scenario():
+        pings, expired = [], []
+        monitor = HeartbeatMonitor(lambda ws, frame: pings.append((ws, frame)),
+                                   lambda ws, kind: expired.append((ws, kind)),
+                                   policies={"agent": (2, 5)}, tick=1.0)
+        busy = monitor.watch("ws-busy", "agent")
+        monitor.watch("ws-quiet", "agent")
+        monitor.watch("ws-gone", "agent")
+        monitor.forget("ws-gone")
+
+        def step(seconds: int):
+            for _ in range(seconds):
+                clock.now += 1
+                busy.touch()  # Frame a cada segundo: nunca recebe ping
+                monitor.wheel.advance(monitor.wheel._now_tick())
+
+        step(2)
+        assert pings == [("ws-quiet", PING_FRAME)]
+        step(2)
+        assert pings == [("ws-quiet", PING_FRAME)]  # Um ping por silêncio
+        step(1)
+        assert expired == [("ws-quiet", "agent")]
+        assert list(monitor.peers) == ["ws-busy"] and monitor.expired == 1
+        monitor.close()
+        assert len(monitor) == 0 and len(monitor.wheel) == 0
+
+    run(scenario)
+
+
+def test_pong_restarts_the_silence(clock):
+    async def scenario():
+        pings, expired = [], []
+        monitor = HeartbeatMonitor(lambda ws, frame: pings.append(ws), lambda ws, kind: expired.append(ws),
+                                   policies={"guest": (2, 5)}, tick=1.0)
+        peer = monitor.watch("ws", "guest")
+        for second in range(1, 13):
+            clock.now += 1
+            if second in (3, 7):
+                peer.touch()  # "pong"
+            monitor.wheel.advance(monitor.wheel._now_tick())
+        assert pings == ["ws", "ws", "ws"]
+        assert expired == ["ws"]  # 5s sem nada depois do último pong (segundo 7)
+        monitor.close()
+
+    run(scenario)
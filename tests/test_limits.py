@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import chat_limits
+from chat_limits import InboundLimiter, TypingCoalescer
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Relógio manual só para o chat_limits (o event loop continua no relógio real)."""
+    now = [100.0]
+    monkeypatch.setattr(chat_limits, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_bucket_allows_the_burst_then_refills_at_the_rate(clock):
+    limiter = InboundLimiter({"user_message": (2.0, 3.0)}, max_drops=3)
+    assert [limiter.allow("user_message") for _ in range(4)] == [True, True, True, False]
+
+    clock[0] += 0.5  # 2/s: meio segundo devolve uma ficha
+    assert limiter.allow("user_message") and not limiter.allow("user_message")
+    clock[0] += 60  # Parado muito tempo: enche só até a rajada
+    assert [limiter.allow("user_message") for _ in range(4)] == [True, True, True, False]
+    assert limiter.dropped == 3 and limiter.exhausted
+
+
+def test_each_event_type_has_its_own_bucket(clock):
+    limiter = InboundLimiter({"agent_typing": (1.0, 1.0), "agent_message": (1.0, 1.0)})
+    assert limiter.allow("agent_typing") and not limiter.allow("agent_typing")
+    assert limiter.allow("agent_message")  # A rajada de typing não gastou a cota de mensagens
+    # Tipos fora da tabela dividem o balde padrão
+    burst = int(chat_limits.DEFAULT_INBOUND_RATE_LIMIT[1])
+    assert sum(limiter.allow(t) for t in ["x", "y"] * burst) == burst
+    assert not limiter.exhausted
+
+
+def test_typing_coalescer_forwards_transitions_and_refreshes(clock):
+    async def scenario():
+        stopped = []
+        typing = TypingCoalescer(stopped.append, refresh_interval=3.0, stop_delay=0.01)
+        assert typing.update("s1", True)
+        assert not any(typing.update("s1", True) for _ in range(50))  # Uma tecla por evento: só o 1º passa
+        assert typing.update("s2", True)  # Outra sessão, outro estado
+
+        clock[0] += 3.0
+        assert typing.update("s1", True)  # Ainda digitando: reforça a cada intervalo
+
+        # Pausa curta: o typing=false é cancelado ao voltar a digitar
+        assert not typing.update("s1", False)
+        assert not typing.update("s1", True)
+        await asyncio.sleep(0.03)
+        assert stopped == []
+
+        assert not typing.update("s1", False)
+        assert not typing.update("s1", False)  # Um typing=false só
+        await asyncio.sleep(0.03)
+        assert stopped == ["s1"] and len(typing) == 1
+
+        typing.update("s2", False)
+        typing.forget("s2")  # Sessão acabou: nada é enviado
+        await asyncio.sleep(0.03)
+        assert stopped == ["s1"] and len(typing) == 0
+        assert not typing.update("s3", False)  # typing=false sem ter digitado não agenda nada
+        assert len(typing) == 0
+
+    asyncio.run(scenario())
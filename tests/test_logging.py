@@ -0,0 +1,65 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import chat_logging
+
+
+@pytest.fixture
+def log_stream():
+    """Pipeline de logs escrevendo num buffer; no fim volta ao stdout, como o main_api deixa."""
+    chat_logging.stop_logging()
+    stream = io.StringIO()
+    yield stream
+    chat_logging.stop_logging()
+    logging.getLogger("chat.test.quiet").setLevel(logging.NOTSET)
+    chat_logging.setup_logging()
+
+
+def lines(stream) -> list:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_reach_the_writer_thread_as_json(log_stream):
+    listener = chat_logging.setup_logging(levels="chat.test.quiet=WARNING", sampling="tick=0.5", stream=log_stream)
+    assert chat_logging.setup_logging(stream=io.StringIO()) is listener  # Chamada repetida não duplica
+    handlers = [h for h in logging.getLogger("chat").handlers if isinstance(h, chat_logging._LoopQueueHandler)]
+    assert len(handlers) == 1
+
+    written_by = []
+    listener.handlers[0].addFilter(lambda record: written_by.append(threading.current_thread()) or True)
+    logger = logging.getLogger("chat.test")
+    logger.info("Cliente %s na fila", "g1", extra={"event": "guest_queued", "position": 2})
+    for n in range(4):
+        logger.info("tick %d", n, extra={"event": "tick"})
+    logging.getLogger("chat.test.quiet").info("não sai", extra={"event": "quiet"})
+    try:
+        raise ValueError("falhou")
+    except ValueError:
+        logger.exception("Erro", extra={"event": "boom"})
+    chat_logging.stop_logging()  # Esvazia a fila antes de parar
+
+    records = lines(log_stream)
+    assert [r["event"] for r in records] == ["guest_queued", "tick", "tick", "boom"]
+    first = records[0]
+    assert (first["level"], first["logger"], first["msg"], first["position"]) == ("INFO", "chat.test", "Cliente g1 na fila", 2)
+    assert [r["msg"] for r in records[1:3]] == ["tick 0", "tick 2"] and records[1]["sampled"] == 2
+    assert "ValueError: falhou" in records[-1]["exc"]
+    assert written_by and threading.main_thread() not in written_by
+
+
+def test_stop_logging_stops_the_listener_thread(log_stream):
+    listener = chat_logging.setup_logging(stream=log_stream)
+    thread = listener._thread
+    assert thread.is_alive()
+
+    chat_logging.stop_logging()
+    thread.join(1)
+    assert not thread.is_alive() and chat_logging._listener is None
+    assert not any(isinstance(h, chat_logging._LoopQueueHandler) for h in logging.getLogger("chat").handlers)
+    logging.getLogger("chat.test").warning("depois do shutdown", extra={"event": "late"})
+    assert log_stream.getvalue() == ""
+    chat_logging.stop_logging()  # Segunda chamada (atexit) é inócua
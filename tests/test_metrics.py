@@ -0,0 +1,101 @@
+import asyncio
+import math
+import re
+
+from fastapi.testclient import TestClient
+
+import main_api
+from chat_metrics import Counter, Gauge, Histogram, Registry
+
+# Formato texto 0.0.4: https://prometheus.io/docs/instrumenting/exposition_formats/
+NAME = r"[a-zA-Z_:][a-zA-Z0-9_:]*"
+SAMPLE = re.compile(r'(%s)(?:\{((?:[a-zA-Z_]\w*="(?:[^"\\\n]|\\[\\"n])*",?)*)\})? (\S+)' % NAME)
+LABEL = re.compile(r'([a-zA-Z_]\w*)="((?:[^"\\\n]|\\[\\"n])*)"')
+SUFFIXES = {"counter": ("",), "gauge": ("",), "untyped": ("",), "histogram": ("_bucket", "_sum", "_count")}
+
+
+def parse_exposition(text: str) -> dict:
+    """Valida a exposição e devolve {família: (tipo, [(nome, labels, valor)])}."""
+    assert text.endswith("\n")
+    families, family = {}, None
+    for line in text[:-1].split("\n"):
+        if line.startswith("# HELP "):
+            family = line.split(" ", 3)[2]
+            assert re.fullmatch(NAME, family) and family not in families, line
+            families[family] = (None, [])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name == family and families[name] == (None, []) and kind in SUFFIXES, line
+            families[name] = (kind, [])
+        else:
+            match = SAMPLE.fullmatch(line)
+            assert match, f"linha inválida: {line!r}"
+            name, labels, value = match.groups()
+            kind, samples = families[family]
+            assert name in {family + suffix for suffix in SUFFIXES[kind]}, line
+            float(value)  # "+Inf", "-Inf" e "NaN" também são aceitos pelo float()
+            samples.append((name, dict(LABEL.findall(labels or "")), value))
+    for name, (kind, samples) in families.items():
+        if kind == "histogram":
+            check_histogram(name, samples)
+    return families
+
+
+def check_histogram(name: str, samples: list):
+    series = {}
+    for sample, labels, value in samples:
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+        series.setdefault(key, {"buckets": []})
+        if sample == name + "_bucket":
+            series[key]["buckets"].append((float(labels["le"]), float(value)))
+        else:
+            series[key][sample[len(name):]] = float(value)
+    for values in series.values():
+        bounds = [le for le, _ in values["buckets"]]
+        counts = [count for _, count in values["buckets"]]
+        assert bounds == sorted(bounds) and bounds[-1] == math.inf
+        assert counts == sorted(counts), "buckets têm que ser cumulativos"
+        assert counts[-1] == values["_count"] and "_sum" in values
+
+
+def test_render_is_valid_exposition_for_every_metric_type():
+    registry = Registry()
+    requests = Counter("app_requests_total", "Requisições", ["path"], registry=registry)
+    requests.labels('/a"b\\c\nd').inc()
+    requests.labels("/").inc(2)
+    Counter("app_errors_total", "Erros", registry=registry).inc()
+    latency = Histogram("app_latency_seconds", "Latência", ["route"], buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels("x").observe(value)
+
+    async def pending():
+        return 7
+
+    Gauge("app_pending", "Pendentes", pending, registry=registry)
+    Gauge("app_unknown", "Sem leitura", lambda: None, registry=registry)
+
+    families = parse_exposition(asyncio.run(registry.render()))
+    assert families["app_requests_total"] == ("counter", [
+        ("app_requests_total", {"path": '/a\\"b\\\\c\\nd'}, "1"), ("app_requests_total", {"path": "/"}, "2")])
+    assert families["app_errors_total"][1] == [("app_errors_total", {}, "1")]
+    buckets = [(labels["le"], value) for name, labels, value in families["app_latency_seconds"][1]
+               if name.endswith("_bucket")]
+    assert buckets == [("0.1", "2"), ("1", "3"), ("+Inf", "4")]
+    assert families["app_pending"] == ("gauge", [("app_pending", {}, "7")])
+    assert families["app_unknown"][1] == [("app_unknown", {}, "NaN")]
+
+
+def test_metrics_endpoint_scrapes_cleanly():
+    client = TestClient(main_api.app)  # Sem lifespan: não drena o `manager` global
+    client.post("/token", data={"username": "ninguem@x.com", "password": "errada"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    families = parse_exposition(response.text)
+    assert families["http_token_requests_total"][0] == "counter"
+    invalid = [value for _, labels, value in families["http_token_requests_total"][1] if labels == {"result": "invalid"}]
+    assert float(invalid[0]) >= 1
+    assert families["http_token_seconds"][0] == "histogram"
+    assert families["chat_waiting_queue_length"][0] == "gauge"
+    assert families["chat_send_failures_total"][0] == "counter"
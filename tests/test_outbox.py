@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import chat_outbox
+from chat_events import EventLog
+from chat_frames import encode_frame
+from chat_outbox import SLOW_CONSUMER_CLOSE_CODE, AgentOutbox, DetachedGuest
+
+
+class FakeSocket:
+    """WebSocket de mentira: `send_text` espera o `gate` abrir, como um agente lento."""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def send_text(self, frame: str):
+        await self.gate.wait()
+        self.sent.append(frame)
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = code
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_coalesced_frames_keep_seq_order_and_replay_is_lossless():
+    async def scenario():
+        log, socket = EventLog(), FakeSocket()
+        outbox = AgentOutbox(socket)
+
+        def broadcast(n, key=None):
+            outbox.put(log.append(encode_frame({"type": "conversation_update", "n": n}), key), key=key)
+
+        socket.gate.clear()  # O primeiro envio fica preso: o resto acumula na fila
+        broadcast(1)
+        await settle()
+        broadcast(2, ("conversation_update", "c1"))
+        broadcast(3)
+        broadcast(4, ("conversation_update", "c1"))
+        assert len(outbox) == 2  # O 2 foi substituído pelo 4
+        socket.gate.set()
+        await settle()
+
+        seqs = [json.loads(frame)["seq"] for frame in socket.sent]
+        assert seqs == [1, 3, 4]
+        assert seqs == sorted(seqs)
+        for last_seen in seqs:
+            # Reconectando com o último seq visto, o replay traz exatamente o que faltou
+            replay = [json.loads(frame)["seq"] for _, frame in log.since(last_seen)]
+            assert replay == [seq for seq in seqs if seq > last_seen]
+        outbox.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_disconnects_the_slow_consumer():
+    async def scenario():
+        socket = FakeSocket()
+        outbox = AgentOutbox(socket, max_pending=3)
+        socket.gate.clear()
+        assert outbox.put("f0")
+        await settle()  # f0 está sendo enviado; os próximos esperam na fila
+        assert all(outbox.put(f"f{n}") for n in (1, 2, 3))
+        assert len(outbox) == 3
+
+        assert not outbox.put("f4")
+        await settle()
+        assert outbox.closed and len(outbox) == 0
+        assert socket.closed == SLOW_CONSUMER_CLOSE_CODE
+        assert not outbox.put("f5")
+
+    asyncio.run(scenario())
+
+
+def test_keyed_updates_coalesce_instead_of_filling_the_queue():
+    async def scenario():
+        socket = FakeSocket()
+        outbox = AgentOutbox(socket, max_pending=3)
+        socket.gate.clear()
+        outbox.put("f0")
+        await settle()
+        outbox.put("outro", key=("conversation_update", "c2"))
+        for n in range(50):  # Muito mais que max_pending, mas é sempre a mesma conversa
+            assert outbox.put(f"c1 v{n}", key=("conversation_update", "c1"))
+        assert len(outbox) == 2 and outbox.dropped == 49
+        assert len(outbox._pending) <= 2 * outbox.max_pending  # As substituídas não se acumulam
+
+        socket.gate.set()
+        await settle()
+        assert socket.sent == ["f0", "outro", "c1 v49"]
+        assert not outbox.closed and socket.closed is None
+        outbox.close()
+
+    asyncio.run(scenario())
+
+
+def test_stuck_send_disconnects_after_the_timeout(monkeypatch):
+    monkeypatch.setattr(chat_outbox, "OUTBOX_SEND_TIMEOUT", 0.01)
+
+    async def scenario():
+        socket = FakeSocket()
+        outbox = AgentOutbox(socket)
+        socket.gate.clear()  # O envio nunca termina
+        outbox.put("f0")
+        await asyncio.sleep(0.05)
+        await settle()
+        assert outbox.closed and socket.closed == SLOW_CONSUMER_CLOSE_CODE
+
+    asyncio.run(scenario())
+
+
+def test_detached_guest_keeps_the_newest_frames_in_order():
+    async def scenario():
+        detached, socket = DetachedGuest("g1", max_pending=3), FakeSocket()
+        for n in range(5):
+            await detached.send_json({"type": "agent_message", "n": n})
+        assert detached.dropped == 2
+
+        await detached.flush_to(socket)
+        assert [json.loads(frame)["n"] for frame in socket.sent] == [2, 3, 4]
+        assert not detached.frames
+
+    asyncio.run(scenario())
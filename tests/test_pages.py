@@ -0,0 +1,46 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def client():
+    cwd = os.getcwd()
+    os.chdir(ROOT)  # templates/ e static/ são relativos à raiz do projeto
+    try:
+        import main
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+def test_known_page_answers_304_for_its_etag(client):
+    first = client.get("/")
+    assert first.status_code == 200 and first.headers["etag"]
+    again = client.get("/index", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.headers["etag"] == first.headers["etag"]
+
+
+def test_unknown_page_is_404_even_with_if_none_match(client):
+    import main
+
+    missing = client.get("/nao-existe")
+    assert missing.status_code == 404 and "etag" not in missing.headers
+    not_found_html, not_found_etag = main.page_cache.error_page("404")
+    assert missing.content == not_found_html
+    for tag in (not_found_etag, "*"):
+        assert client.get("/nao-existe", headers={"If-None-Match": tag}).status_code == 404
+
+
+def test_error_page_is_not_routable(client):
+    import main
+
+    assert "404" not in main.page_cache.allowed
+    for headers in ({}, {"If-None-Match": "*"}):
+        direct = client.get("/404", headers=headers)
+        assert direct.status_code == 404 and "etag" not in direct.headers
+        assert direct.content == main.page_cache.error_page("404")[0]
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+import argon2
+import pytest
+
+from password_pool import PasswordPool, PasswordPoolBusy
+
+
+def cheap_hasher() -> argon2.PasswordHasher:
+    return argon2.PasswordHasher(time_cost=1, memory_cost=8, parallelism=1)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_hash_and_verify(workers):
+    async def scenario():
+        pool = PasswordPool(cheap_hasher(), workers=workers)
+        try:
+            hashed = await pool.hash("s3nh@")
+            assert await pool.verify(hashed, "s3nh@")
+            assert not await pool.verify(hashed, "errada")
+            assert not await pool.verify("não é um hash", "s3nh@")
+            assert not pool.needs_rehash(hashed)
+            assert PasswordPool(argon2.PasswordHasher(), workers=0).needs_rehash(hashed)
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        pool = PasswordPool(cheap_hasher(), workers=1, max_waiting=1)
+        release = threading.Event()
+        try:
+            running = asyncio.create_task(pool._run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            waiting = asyncio.create_task(pool._run(lambda: "ok"))
+            await asyncio.sleep(0.05)
+            assert pool.waiting == 1
+            with pytest.raises(PasswordPoolBusy):
+                await pool.hash("s3nh@")
+            release.set()
+            assert await running is True
+            assert await waiting == "ok"
+            assert pool.waiting == 0
+            assert await pool.verify(await pool.hash("s3nh@"), "s3nh@")
+        finally:
+            release.set()
+            pool.shutdown()
+
+    asyncio.run(scenario())
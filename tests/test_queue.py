@@ -0,0 +1,100 @@
+import random
+
+from chat_queue import WaitingQueue, _Fenwick
+
+
+def positions(queue: WaitingQueue) -> dict:
+    return {entry.guest_id: queue.position(entry.guest_id) for entry in queue}
+
+
+def test_fenwick_prefix_sums():
+    tree = _Fenwick(16)
+    values = [3, 0, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9]
+    for i, value in enumerate(values):
+        tree.add(i, value)
+    assert [tree.prefix(i) for i in range(16)] == [sum(values[:i + 1]) for i in range(16)]
+    tree.add(3, -4)
+    assert tree.prefix(3) == 4 and tree.prefix(15) == sum(values) - 4
+
+
+def test_fifo_and_positions_after_removal():
+    queue = WaitingQueue()
+    for guest_id in "abcde":
+        queue.push(f"ws-{guest_id}", {}, guest_id)
+    assert positions(queue) == {"a": 1, "b": 2, "c": 3, "d": 4, "e": 5}
+
+    assert queue.remove("ws-c").guest_id == "c"
+    assert queue.remove("ws-c") is None
+    assert queue.remove_guest("zzz") is None
+    assert positions(queue) == {"a": 1, "b": 2, "d": 3, "e": 4}
+    assert queue.pop().guest_id == "a"
+    assert positions(queue) == {"b": 1, "d": 2, "e": 3}
+    assert queue.position("a") is None
+    assert "ws-a" not in queue and "ws-b" in queue
+    assert len(queue) == 3
+
+
+def test_priority_lanes_are_served_first():
+    queue = WaitingQueue()
+    queue.push("ws-1", {}, "normal-1")
+    queue.push("ws-2", {}, "urgent-1", priority=2)
+    queue.push("ws-3", {}, "normal-2")
+    queue.push("ws-4", {}, "high-1", priority=1)
+    queue.push("ws-5", {}, "urgent-2", priority=2)
+    assert [entry.guest_id for entry in queue] == ["urgent-1", "urgent-2", "high-1", "normal-1", "normal-2"]
+    assert queue.position("normal-1") == 4
+    assert [queue.pop().guest_id for _ in range(5)] == ["urgent-1", "urgent-2", "high-1", "normal-1", "normal-2"]
+    assert queue.pop() is None and not queue
+
+
+def test_attach_swaps_the_websocket():
+    queue = WaitingQueue()
+    queue.push(None, {}, "a")  # Restaurado de um snapshot, sem socket
+    assert queue.get_by_websocket("ws-new") is None
+    assert queue.attach("a", "ws-new").guest_id == "a"
+    assert queue.get_by_websocket("ws-new").guest_id == "a"
+    queue.attach("a", None)
+    assert "ws-new" not in queue
+    assert queue.attach("zzz", "ws") is None
+
+
+def test_positions_stay_exact_through_reindexing():
+    # Capacidade pequena força renumerações e crescimento da árvore
+    queue = WaitingQueue(initial_capacity=4)
+    expected = []
+    rng = random.Random(7)
+    for i in range(400):
+        roll = rng.random()
+        if roll < 0.55 or not expected:
+            guest_id = f"g{i}"
+            queue.push(f"ws-{guest_id}", {}, guest_id)
+            expected.append(guest_id)
+        elif roll < 0.8:
+            assert queue.pop().guest_id == expected.pop(0)
+        else:
+            guest_id = rng.choice(expected)
+            queue.remove_guest(guest_id)
+            expected.remove(guest_id)
+        assert positions(queue) == {guest_id: i + 1 for i, guest_id in enumerate(expected)}
+
+
+def test_take_changed_reports_the_first_position_that_moved():
+    queue = WaitingQueue()
+    for guest_id in "abcde":
+        queue.push(f"ws-{guest_id}", {}, guest_id)
+    assert queue.take_changed() is None  # Entrar no fim não tira ninguém do lugar
+
+    queue.remove_guest("d")
+    assert queue.take_changed() == 4
+    assert queue.positions_from(4) == {"e": 4}
+
+    queue.push("ws-vip", {}, "vip", priority=1)
+    queue.remove_guest("e")
+    assert queue.take_changed() == 2  # O vip passou na frente de todos
+    assert queue.take_changed() is None
+
+    queue.pop()
+    assert queue.take_changed() == 1
+    assert queue.positions_from(1) == {"a": 1, "b": 2, "c": 3}
+    assert queue.positions_from(3) == {"c": 3}
+    assert queue.positions_from(9) == {}
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import timedelta
+
+import main_api
+from chat_outbox import DetachedGuest
+from tests.test_snapshot import AGENT_EMAIL, FakeSocket, join_data, new_manager
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def agent_with_guests(manager, capacity=1):
+    """Agente com `capacity` vagas, Ana em atendimento e Bruno na fila."""
+    agent, ana, bruno = FakeSocket(), FakeSocket(), FakeSocket()
+    await manager.connect_agent(agent, main_api.get_user(main_api.fake_users_db, AGENT_EMAIL), capacity=capacity)
+    await manager.connect_guest(ana, join_data("Ana", "sess-ana"))
+    await manager.connect_guest(bruno, join_data("Bruno", "sess-bruno"))
+    await settle()
+    return agent, ana, bruno
+
+
+def test_verify_resume_token_rejects_tampered_expired_and_foreign_tokens():
+    token = main_api.create_resume_token("guest-1")
+    assert main_api.verify_resume_token(token) == "guest-1"
+
+    head, payload, signature = token.split(".")
+    forged = main_api.create_resume_token("guest-2").split(".")[1]
+    assert main_api.verify_resume_token(f"{head}.{forged}.{signature}") is None
+    assert main_api.verify_resume_token(f"{head}.{payload}.{signature[::-1]}") is None
+
+    expired = main_api.create_access_token({"gid": "guest-1", "typ": "resume"}, timedelta(seconds=-1))
+    assert main_api.verify_resume_token(expired) is None
+    # Token de login do agente não serve para retomar conversa
+    assert main_api.verify_resume_token(main_api.create_access_token({"sub": AGENT_EMAIL, "gid": "guest-1"})) is None
+    assert main_api.verify_resume_token(None) is None and main_api.verify_resume_token(42) is None
+
+
+def test_reattach_within_grace_keeps_guest_and_agent_without_broadcasts():
+    async def scenario():
+        _, manager = new_manager()
+        agent, ana, bruno = await agent_with_guests(manager)
+        session = ana.last("session")
+        guest_id, agent_frames, bruno_frames = session["guest_id"], len(agent.frames), len(bruno.frames)
+        broadcasts, queue_changes = [], []
+        manager.broadcast_to_all_agents = lambda *args, **kwargs: broadcasts.append(args)
+        manager.queue_updates.changed = lambda *args: queue_changes.append(args)
+
+        await manager.disconnect(ana, final=False)
+        detached = manager.guest_ws_map[guest_id]
+        assert isinstance(detached, DetachedGuest)
+        assert manager.sessions[detached] is agent
+        assert detached in manager.router.get(agent).guests  # A vaga continua reservada
+        # O que o agente manda enquanto o cliente está fora fica guardado
+        await detached.send_json({"type": "agent_message", "message": "Ainda está aí?"})
+
+        # Token adulterado não recupera a conversa de ninguém
+        stranger = FakeSocket()
+        await manager.connect_guest(stranger, join_data("Outro", "sess-x", resumeToken=session["resumeToken"][:-2] + "xx"))
+        assert stranger.last("session")["guest_id"] != guest_id
+        assert manager.guest_ws_map[guest_id] is detached
+        broadcasts.clear()  # Os do estranho, que entrou na fila
+        queue_changes.clear()
+
+        back = FakeSocket()
+        await manager.connect_guest(back, join_data("Ana", "sess-ana", resumeToken=session["resumeToken"]))
+        await settle()
+        assert (back.last("session")["guest_id"], back.last("session")["resumed"]) == (guest_id, True)
+        assert back.last("agent_message")["message"] == "Ainda está aí?"
+        assert manager.sessions[back] is agent and manager.guest_ws_map[guest_id] is back
+        assert guest_id not in manager._expiry
+        assert (broadcasts, queue_changes) == ([], [])
+        assert len(agent.frames) == agent_frames and len(bruno.frames) == bruno_frames
+
+    asyncio.run(scenario())
+
+
+def test_detached_guest_expires_after_grace_and_frees_the_slot(monkeypatch):
+    monkeypatch.setattr(main_api, "GUEST_RESUME_GRACE_SECONDS", 0.01)
+
+    async def scenario():
+        _, manager = new_manager()
+        agent, ana, bruno = await agent_with_guests(manager)
+        guest_id = ana.last("session")["guest_id"]
+        await manager.disconnect(ana, final=False)
+        assert bruno.last("transfer_status")["status"] == "waiting"
+
+        await asyncio.sleep(0.05)
+        await settle()
+        assert guest_id not in manager.guest_ws_map and guest_id not in manager.session_keys
+        assert (await manager.backend.get_conversation(guest_id)).status == "closed"
+        # A vaga voltou ao agente, que puxou o próximo da fila
+        assert bruno.last("transfer_status")["status"] == "connected"
+        assert [slot.load for slot in manager.router.agents.values()] == [1]
+        assert agent.last("guest_left")["guest_id"] == guest_id
+
+        # Depois da carência o token não traz a conversa de volta
+        late = FakeSocket()
+        await manager.connect_guest(late, join_data("Ana", "sess-ana", resumeToken=ana.last("session")["resumeToken"]))
+        assert late.last("session")["guest_id"] != guest_id
+
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+from chat_search import SearchIndex, normalize_text, tokenize
+
+
+def test_normalization_and_tokens():
+    assert normalize_text("Orçamento JOÃO") == "orcamento joao"
+    assert "de" not in tokenize("Site de vendas")
+
+
+def test_prefix_and_all_terms(make_conversation):
+    index = SearchIndex()
+    index.update(make_conversation("a", client_name="João Silva", messages=[
+        {"text": "Preciso de um orçamento", "isBot": False, "timestamp": None}]))
+    index.update(make_conversation("b", client_name="Maria Souza"))
+    assert index.search("joao orc") == (["a"], 1)
+    assert index.search("joao maria") == ([], 0)
+    assert index.search("") == ([], 0)
+
+
+def test_ties_page_in_the_final_order(make_conversation):
+    index = SearchIndex()
+    for i in range(30):
+        index.update(make_conversation(f"c{i:02d}", client_name="Cliente Orçamento"))
+    everything, total = index.search("orcamento", 0, 30)
+    assert total == 30
+    assert everything == [f"c{i:02d}" for i in reversed(range(30))]  # Empate: a atualizada por último primeiro
+    pages = [index.search("orcamento", offset, 7)[0] for offset in range(0, 30, 7)]
+    assert [conv_id for page in pages for conv_id in page] == everything
+
+    index.update(make_conversation("c05", client_name="Cliente Orçamento"))  # Atualizada: sobe entre os empatados
+    assert index.search("orcamento", 0, 1) == (["c05"], 30)
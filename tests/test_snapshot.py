@@ -0,0 +1,126 @@
+import asyncio
+import json
+import zlib
+
+import main_api
+from chat_backend import InMemoryBackend
+from chat_snapshot import Snapshot, write_snapshot
+from chat_store import MemoryConversationStore, WriteBehindStore
+
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+class FakeSocket:
+    """WebSocket de mentira: guarda os frames recebidos (já decodificados) e o código de fechamento."""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+
+    async def send_json(self, message: dict):
+        self.frames.append(message)
+
+    async def send_text(self, frame: str):
+        self.frames.append(json.loads(frame))
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = code
+
+    def last(self, frame_type: str) -> dict:
+        return [frame for frame in self.frames if frame["type"] == frame_type][-1]
+
+
+def new_manager():
+    store = WriteBehindStore(MemoryConversationStore(), main_api.Conversation)
+    return store, main_api.ConnectionManager(InMemoryBackend(store))
+
+
+def join_data(name: str, session_key: str, **extra) -> dict:
+    return {"userData": {"name": name, "message": f"Oi, aqui é {name}"}, "sessionId": session_key, **extra}
+
+
+def test_snapshot_round_trip_and_rejects_expired_or_corrupted(tmp_path):
+    path = str(tmp_path / "chat.snapshot")
+    packed = zlib.compress(b'{"id":"b"}')
+    write_snapshot(path, '{"queue":[1]}', [("a", '{"id":"a"}', True), ("b", packed, False)], clean=True)
+
+    snapshot = Snapshot.open(path)
+    try:
+        assert snapshot.clean and snapshot.state == {"queue": [1]}
+        (a_id, a_offset, a_len, a_hot), (b_id, b_offset, b_len, b_hot) = snapshot.records
+        assert (a_id, a_hot, b_id, b_hot) == ("a", 1, "b", 0)
+        assert snapshot.load(a_offset, a_len) == '{"id":"a"}'
+        assert snapshot.packed(b_offset, b_len) == packed  # Já comprimido: copiado como veio
+    finally:
+        snapshot.close()
+
+    assert Snapshot.open(path, max_age=-1) is None
+    with open(path, "r+b") as f:
+        f.write(b"XXXXXXXX")
+    assert Snapshot.open(path) is None
+    assert Snapshot.open(str(tmp_path / "nenhum.snapshot")) is None
+
+
+def test_drain_closes_with_service_restart_and_parks_everyone():
+    async def scenario():
+        store, manager = new_manager()
+        agent, ana, bruno = FakeSocket(), FakeSocket(), FakeSocket()
+        await manager.connect_agent(agent, main_api.get_user(main_api.fake_users_db, AGENT_EMAIL), capacity=1)
+        await manager.connect_guest(ana, join_data("Ana", "sess-ana"))
+        await manager.connect_guest(bruno, join_data("Bruno", "sess-bruno"))
+        ana_id, bruno_id = ana.last("session")["guest_id"], bruno.last("session")["guest_id"]
+        assert ana.last("transfer_status")["status"] == "connected"
+        assert bruno.last("transfer_status")["status"] == "waiting"
+
+        await manager.drain(timeout=0)
+
+        assert (agent.closed, ana.closed, bruno.closed) == (main_api.SERVICE_RESTART_CODE,) * 3
+        assert not manager.guest_ws_map and not manager.sessions and len(manager.router) == 0
+        # Soltos, não encerrados: as conversas seguem abertas e retomáveis, sem timer (o processo vai sair)
+        assert manager.session_keys == {ana_id: "sess-ana", bruno_id: "sess-bruno"}
+        assert not manager._expiry
+        assert [entry["guest_id"] for entry in manager.backend.export_queue()] == [bruno_id]
+        assert (await manager.backend.get_conversation(ana_id)).status == "active"
+
+        # O `disconnect` que o endpoint faz depois do drain só solta: não encerra a conversa
+        await manager.disconnect(ana)
+        assert ana_id in manager.session_keys
+
+    asyncio.run(scenario())
+
+
+def test_restore_after_restart_requires_the_resume_token(tmp_path, monkeypatch):
+    async def scenario():
+        old_store, old = new_manager()
+        ana = FakeSocket()
+        await old.connect_guest(ana, join_data("Ana", "sess-ana"))
+        session = ana.last("session")
+        await old.drain(timeout=0)
+        path = str(tmp_path / "chat.snapshot")
+        write_snapshot(path, json.dumps(old.snapshot_state(), default=str), old_store.snapshot_records(), clean=True)
+
+        # Processo novo: estado vazio, restaurado do snapshot
+        store, manager = new_manager()
+        monkeypatch.setattr(main_api, "SNAPSHOT_PATH", path)
+        monkeypatch.setattr(main_api, "conversation_store", store)
+        monkeypatch.setattr(main_api, "manager", manager)
+        main_api.restore_snapshot()
+        assert manager.session_keys == {session["guest_id"]: "sess-ana"}
+        assert [entry["guest_id"] for entry in manager.backend.export_queue()] == [session["guest_id"]]
+
+        # Só o sessionId (gerado no navegador) não basta: vira outra conversa
+        intruder = FakeSocket()
+        await manager.connect_guest(intruder, join_data("Intruso", "sess-ana"))
+        assert intruder.last("session")["guest_id"] != session["guest_id"]
+        assert not intruder.last("session")["resumed"]
+
+        back = FakeSocket()
+        await manager.connect_guest(back, join_data("Ana", "sess-ana", resumeToken=session["resumeToken"]))
+        resumed = back.last("session")
+        assert (resumed["guest_id"], resumed["resumed"]) == (session["guest_id"], True)
+        assert back.last("transfer_status")["position"] == 1  # Manteve o lugar na fila
+        conv = await manager.backend.get_conversation(session["guest_id"])
+        assert [m["content"] for m in conv.messages] == ["Oi, aqui é Ana"]
+        assert session["guest_id"] not in manager._expiry
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import static_assets
+from static_assets import IMMUTABLE_CACHE_CONTROL, AssetManifest, accepted_encodings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSS = "body { color: #333; }\n" * 200
+
+
+@pytest.fixture
+def assets(tmp_path):
+    source = tmp_path / "static"
+    (source / "css").mkdir(parents=True)
+    (source / "css" / "site.css").write_text(CSS)
+    (source / "logo.png").write_bytes(os.urandom(256))  # Binário: sem variantes comprimidas
+    assets = AssetManifest(str(source), str(tmp_path / "dist"))
+    assets.build()
+    return assets
+
+
+def test_build_writes_hashed_files_and_manifest(assets):
+    hashed = assets.manifest["css/site.css"]
+    assert re.fullmatch(r"css/site\.[0-9a-f]{12}\.css", hashed)
+    with open(os.path.join(assets.build_dir, "manifest.json")) as f:
+        assert json.load(f) == assets.manifest
+    media_type, variants = assets.files[hashed]
+    assert media_type == "text/css"
+    expected = {"identity", "gzip"} | ({"br"} if static_assets.brotli is not None else set())
+    assert set(variants) == expected
+    with open(variants["identity"]) as f:
+        assert f.read() == CSS
+    assert set(assets.files[assets.manifest["logo.png"]][1]) == {"identity"}
+
+    assert assets.url("css/site.css") == f"/assets/{hashed}"
+    assert assets.url("js/nao-existe.js") == "/static/js/nao-existe.js"  # Fora do manifesto: o original
+
+
+def test_rebuild_prunes_files_of_previous_hashes(assets, tmp_path):
+    old = assets.files[assets.manifest["css/site.css"]][1]
+    in_flight = os.path.join(assets.build_dir, "css", "site.abc.css.999.tmp")
+    open(in_flight, "wb").close()
+
+    (tmp_path / "static" / "css" / "site.css").write_text(CSS + "a { color: red; }\n")
+    assets.build()
+
+    new = assets.files[assets.manifest["css/site.css"]][1]
+    assert not any(os.path.exists(path) for path in old.values())
+    assert all(os.path.exists(path) for path in new.values())
+    assert os.path.exists(in_flight)  # Gravação de outro worker em andamento fica
+    kept = {os.path.join(root, name) for root, _, names in os.walk(assets.build_dir) for name in names}
+    assert len(kept) == 1 + len(new) + 1 + 1  # manifesto + site.css + logo.png + o .tmp
+
+
+@pytest.mark.parametrize("header, encoding", [
+    ("", None),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "br"),
+    ("br, gzip", "br"),
+])
+def test_resolve_negotiates_the_best_variant(assets, header, encoding):
+    if encoding == "br" and static_assets.brotli is None:
+        encoding = "gzip"
+    hashed = assets.manifest["css/site.css"]
+    path, media_type, chosen = assets.resolve(hashed, header)
+    assert chosen == encoding and path == assets.files[hashed][1][encoding or "identity"]
+    assert assets.resolve("css/site.000000000000.css", header) is None
+
+
+def test_accepted_encodings_ignores_q_zero():
+    assert accepted_encodings("gzip;q=0.5, br;q=0, Deflate") == {"gzip", "deflate"}
+
+
+@pytest.fixture
+def client(assets, monkeypatch):
+    cwd = os.getcwd()
+    os.chdir(ROOT)  # templates/ e static/ são relativos à raiz do projeto
+    try:
+        import main
+        monkeypatch.setattr(main, "assets", assets)
+        yield TestClient(main.app)
+    finally:
+        os.chdir(cwd)
+
+
+def test_assets_are_served_immutable_and_precompressed(client, assets):
+    url = assets.url("css/site.css")
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.text == CSS  # O cliente descomprime
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["content-type"].startswith("text/css")
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.text == CSS
+    assert client.get("/assets/css/site.000000000000.css").status_code == 404
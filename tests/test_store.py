@@ -0,0 +1,273 @@
+import asyncio
+import copy
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+
+import pytest
+
+import chat_store
+from chat_store import (FileConversationStore, MemoryConversationStore, MongoConversationStore,
+                        SQLiteConversationStore, WriteBehindStore)
+
+# mongod local para o store do MongoDB; sem ele, o FakeMongoClient faz o papel do servidor
+MONGO_TEST_URI = os.getenv("CHAT_TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+def conversation_model():
+    from main_api import Conversation
+    return Conversation
+
+
+class FakeCollection:
+    """Coleção em memória com a parte da API do pymongo que o `MongoConversationStore` usa."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:  # Só ReplaceOne com upsert
+            self.docs[op._filter["_id"]] = copy.deepcopy(op._doc)
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def find(self):
+        return [copy.deepcopy(doc) for doc in self.docs.values()]
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self.databases = defaultdict(lambda: defaultdict(FakeCollection))  # client[banco][coleção]
+
+    def __getitem__(self, database):
+        return self.databases[database]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="module")
+def mongod():
+    """Cliente de um mongod local, ou None se não há nenhum respondendo."""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=300)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        yield None
+        return
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "file", "mongo"])
+def open_store(request, tmp_path, monkeypatch):
+    """Abre o store; os duráveis reabrem o mesmo arquivo (simula um restart)."""
+    opened = []
+    if request.param == "mongo":
+        database = f"chat_test_{uuid.uuid4().hex[:8]}"
+        server = request.getfixturevalue("mongod")
+        if server is not None:
+            request.addfinalizer(lambda: server.drop_database(database))
+        else:
+            # Um "servidor" só para todas as instâncias: o store reaberto vê o que o anterior gravou
+            fake = FakeMongoClient()
+            monkeypatch.setattr("pymongo.MongoClient", lambda uri: fake)
+
+    def open_():
+        if request.param == "mongo":
+            store = MongoConversationStore(MONGO_TEST_URI, database)
+        elif request.param == "sqlite":
+            store = SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"))
+        elif request.param == "file":
+            store = FileConversationStore(str(tmp_path / "conversations.jsonl"))
+        else:
+            store = opened[0] if opened else MemoryConversationStore()
+        opened.append(store)
+        return store
+
+    return open_
+
+
+class FlakyStore:
+    """Store que falha nas primeiras `failures` gravações."""
+
+    durable = True
+
+    def __init__(self, store, failures: int = 1):
+        self.store = store
+        self.failures = failures
+        self.attempts = 0
+
+    def write_batch(self, docs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("banco fora do ar")
+        self.store.write_batch(docs)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def run(scenario):
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condição não atingida a tempo"
+        await asyncio.sleep(0.01)
+
+
+def test_save_get_list_round_trip(open_store, make_conversation):
+    async def scenario():
+        store = WriteBehindStore(open_store(), conversation_model())
+        await store.start()
+        conv = make_conversation("c1", tags=["orçamento"], messages=[
+            {"text": "Olá! Como posso ajudar?", "isBot": True, "timestamp": "2026-10-17T13:45:00.123Z"}])
+        conv.messages.add("Quero um site institucional", "client")
+        store.save(conv)
+        store.save(make_conversation("c2", status="closed"))
+        assert await store.get("c1") is conv  # Do cache, antes de qualquer gravação
+
+        await store.flush()
+        assert json.loads(store.store.load("c1")) == json.loads(conv.model_dump_json())
+
+        assert store.evict(["c1", "c2"]) == 2
+        assert await store.list() == []
+        loaded = await store.get("c1")
+        assert loaded is not conv and loaded == conv
+        assert loaded.messages.to_list() == conv.messages.to_list()
+        assert {c.id for c in await store.list(include_archived=True)} == {"c1", "c2"}
+        assert await store.get("nope") is None
+        await store.stop()
+
+    run(scenario)
+
+
+def test_search_covers_hot_and_archived(open_store, make_conversation):
+    async def scenario():
+        store = WriteBehindStore(open_store(), conversation_model())
+        await store.start()
+        archived = make_conversation("old", status="closed", client_name="João Orçamento")
+        store.save(archived)
+        store.save(make_conversation("hot", messages=[
+            {"text": "Qual o prazo do orçamento?", "isBot": False, "timestamp": None}]))
+        await store.flush()
+        store.evict(["old"])
+
+        found, total = await store.search("orcamento")
+        assert total == 2
+        assert {c.id for c in found} == {"old", "hot"}
+        assert [c.id for c in (await store.search("joao"))[0]] == ["old"]
+        assert await store.search("inexistente") == ([], 0)
+        await store.stop()
+
+    run(scenario)
+
+
+def test_stop_flushes_pending_writes(open_store, make_conversation):
+    async def scenario():
+        store = WriteBehindStore(open_store(), conversation_model(), flush_interval=60)
+        await store.start()
+        conv = make_conversation("c1")
+        store.save(conv)
+        assert store.store.load("c1") is None  # Ainda só no cache
+        await store.stop()
+
+        reopened = WriteBehindStore(open_store(), conversation_model())
+        await reopened.start()
+        assert await reopened.get("c1") == conv
+        await wait_for(lambda: len(reopened.text_index) == 1)  # Indexada para a busca ao subir
+        assert [c.id for c in (await reopened.search("marcia"))[0]] == ["c1"]
+        await reopened.stop()
+
+    run(scenario)
+
+
+def test_failed_write_is_retried(open_store, make_conversation):
+    async def scenario():
+        flaky = FlakyStore(open_store(), failures=2)
+        store = WriteBehindStore(flaky, conversation_model(), flush_interval=0.01)
+        conv = make_conversation("c1")
+        store.save(conv)
+        with pytest.raises(ConnectionError):
+            await store.flush()
+        assert "c1" in store._dirty and flaky.store.load("c1") is None
+
+        await store.start()  # O flusher tenta de novo depois da falha
+        await wait_for(lambda: flaky.store.load("c1") is not None)
+        assert flaky.attempts == 3
+        assert not store._dirty and not store._inflight
+        conv.status = "closed"
+        store.save(conv)
+        await store.stop()
+        assert json.loads(open_store().load("c1"))["status"] == "closed"
+
+    run(scenario)
+
+
+def test_sweep_applies_count_and_age_limits(make_conversation, monkeypatch):
+    store = WriteBehindStore(MemoryConversationStore(), conversation_model(), max_closed=2, max_closed_age=60)
+
+    async def save_all():
+        for i in range(4):
+            store.save(make_conversation(f"closed-{i}", status="closed"))
+        store.save(make_conversation("active"))
+        await store.flush()
+        store.save(make_conversation("unsaved", status="closed"))  # Ainda não gravada: não pode sair
+
+    run(save_all)
+    assert store.sweep() == 3  # Além da quantidade: as mais antigas saem
+    assert set(store.cache) == {"closed-3", "unsaved", "active"}
+    assert store.sweep() == 0  # "unsaved" ainda está suja
+
+    later = time.monotonic() + 61  # Depois da idade máxima (fora do loop: o asyncio também usa o relógio)
+    monkeypatch.setattr(chat_store.time, "monotonic", lambda: later)
+    assert store.sweep() == 1
+    assert set(store.cache) == {"unsaved", "active"}
+    assert store.store.load("closed-0") is not None  # Fora do cache, ainda no store
+
+
+def test_memory_store_keeps_at_most_max_docs(make_conversation):
+    async def scenario():
+        store = WriteBehindStore(MemoryConversationStore(max_docs=2), conversation_model())
+        for i in range(3):
+            store.save(make_conversation(f"c{i}", status="closed", client_name=f"Cliente {i}"))
+            await store.flush()
+        store.evict(["c0", "c1", "c2"])
+        assert list(store.store.docs) == ["c1", "c2"]
+        assert await store.get("c0") is None
+        assert (await store.search("cliente"))[1] == 2  # A descartada saiu também da busca
+        await store.stop()
+
+    run(scenario)
+
+
+def test_file_store_compacts_old_versions(tmp_path, make_conversation):
+    path = str(tmp_path / "conversations.jsonl")
+    store = FileConversationStore(path, compact_min_bytes=0)
+    conv = make_conversation("c1")
+    for i in range(10):
+        conv.messages.add(f"mensagem {i}", "client")
+        store.write_batch({"c1": conv.model_dump_json(), "c2": make_conversation("c2").model_dump_json()})
+    assert os.path.getsize(path) == store.size <= 2 * store.live
+    assert json.loads(store.load("c1")) == json.loads(conv.model_dump_json())
+    store.close()
+
+    with open(path, "ab") as f:  # Versões antigas deixadas por um processo sem compactação
+        for _ in range(5):
+            f.write(make_conversation("c2").model_dump_json().encode() + b"\n")
+    reopened = FileConversationStore(path, compact_min_bytes=0)  # Compacta ao abrir
+    assert os.path.getsize(path) == reopened.live
+    assert sorted(json.loads(doc)["id"] for doc in reopened.load_all()) == ["c1", "c2"]
+    assert json.loads(reopened.load("c1")) == json.loads(conv.model_dump_json())
+    reopened.close()
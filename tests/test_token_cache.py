@@ -0,0 +1,72 @@
+import asyncio
+from datetime import timedelta
+
+import main_api
+import token_cache
+from token_cache import TokenCache
+
+AGENT_EMAIL = "atendente@wpwebsolucoes.com.br"
+
+
+def test_hit_miss_and_lru_eviction(monkeypatch):
+    monkeypatch.setattr(token_cache.time, "time", lambda: 1000.0)
+    cache = TokenCache(max_size=2)
+    assert cache.get("a") is None
+    cache.put("a", "ana", "ana@x", expires_at=2000)
+    cache.put("sem-exp", "bruno", "bruno@x", expires_at=None)  # Sem `exp`: não guarda
+    assert cache.get("a") == "ana" and cache.get("sem-exp") is None
+
+    cache.put("b", "bruno", "bruno@x", expires_at=2000)
+    assert cache.get("a") == "ana"  # `a` passa a ser o mais recente
+    cache.put("c", "carla", "carla@x", expires_at=2000)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("ana", None, "carla")
+    assert len(cache) == 2
+    assert all(len(key) == 16 for key in cache._entries)  # Só o digest do token fica guardado
+
+
+def test_entry_expires_with_the_token(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(token_cache.time, "time", lambda: now[0])
+    cache = TokenCache()
+    cache.put("a", "ana", "ana@x", expires_at=1010)
+    now[0] = 1009.9
+    assert cache.get("a") == "ana"
+    now[0] = 1010
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_invalidate_user_drops_only_that_users_tokens():
+    cache = TokenCache()
+    far = 2 ** 40
+    cache.put("a1", "ana", "ana@x", far)
+    cache.put("a2", "ana", "ana@x", far)
+    cache.put("b1", "bruno", "bruno@x", far)
+    cache.invalidate_user("ana@x")
+    assert (cache.get("a1"), cache.get("a2"), cache.get("b1")) == (None, None, "bruno")
+    cache.put("a3", "ana nova", "ana@x", far)  # Token resolvido depois da mudança vale normalmente
+    assert cache.get("a3") == "ana nova"
+
+
+def test_changed_credentials_are_resolved_again(monkeypatch):
+    monkeypatch.setattr(main_api, "token_cache", TokenCache())
+    monkeypatch.setitem(main_api.fake_users_db, AGENT_EMAIL, dict(main_api.fake_users_db[AGENT_EMAIL]))
+    token = main_api.create_access_token({"sub": AGENT_EMAIL}, timedelta(minutes=5))
+
+    async def scenario():
+        first = await main_api.get_current_user_from_token(token)
+        assert await main_api.get_current_user_from_token(token) is first  # Do cache, sem decode
+        assert await main_api.get_current_user_from_token(token + "x") is None
+
+        # Senha trocada: quem altera o usuário invalida o que estava em cache
+        main_api.fake_users_db[AGENT_EMAIL]["hashed_password"] = "outro-hash"
+        main_api.fake_users_db[AGENT_EMAIL]["name"] = "Atendente Renomeado"
+        assert (await main_api.get_current_user_from_token(token)).name == first.name  # Ainda em cache
+        main_api.token_cache.invalidate_user(AGENT_EMAIL)
+        again = await main_api.get_current_user_from_token(token)
+        assert again is not first and again.name == "Atendente Renomeado"
+
+        del main_api.fake_users_db[AGENT_EMAIL]
+        main_api.token_cache.invalidate_user(AGENT_EMAIL)
+        assert await main_api.get_current_user_from_token(token) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+import json
+import uuid
+
+import pytest
+
+from chat_transcript import MAX_INTERNED, SHAPE_MESSAGE, SHAPE_RAW, Transcript
+
+MESSAGE = {"id": "5b1f1c8e-8a51-4c2e-9a55-0f3d2a1b7c6d", "content": "Quero um orçamento", "sender": "client",
+           "timestamp": "2026-10-17T10:30:00.123456", "status": "sent"}
+HISTORY = {"text": "Olá! Como posso ajudar?", "isBot": True, "timestamp": "2026-10-17T13:45:00.123Z"}
+
+
+@pytest.mark.parametrize("message", [
+    MESSAGE,
+    HISTORY,
+    dict(HISTORY, isBot=False, timestamp=None),
+    dict(MESSAGE, id="msg-1"),  # id que não é uuid
+    dict(MESSAGE, id=MESSAGE["id"].upper()),  # uuid que não volta idêntico
+    dict(MESSAGE, timestamp="2026-10-17T10:30:00+00:00"),  # fuso que não é "Z"
+    dict(MESSAGE, timestamp="2026-10-17T13:45:00.1Z"),
+    dict(MESSAGE, content=None),
+    dict(MESSAGE, sender=1),
+    dict(MESSAGE, extra="campo a mais"),
+    {"type": "qualquer", "payload": [1, 2]},
+])
+def test_messages_come_back_identical(message):
+    transcript = Transcript([message])
+    assert transcript[0] == message
+    assert transcript.to_list() == [message]
+    assert [type(value) for value in transcript[0].values()] == [type(value) for value in message.values()]
+
+
+def test_add_generates_id_and_server_time():
+    transcript = Transcript()
+    message_id = transcript.add("Olá, Ana!", "agent")
+    assert uuid.UUID(message_id).version == 4
+    message = transcript[-1]
+    assert message == {"id": message_id, "content": "Olá, Ana!", "sender": "agent",
+                       "timestamp": message["timestamp"], "status": "sent"}
+    assert "T" in message["timestamp"] and not message["timestamp"].endswith("Z")
+
+
+def test_sequence_protocol():
+    transcript = Transcript([HISTORY, MESSAGE])
+    transcript.add("Terceira", "client")
+    transcript.extend([dict(MESSAGE, content="Quarta")])
+    assert len(transcript) == 4
+    assert [m.get("content") for m in transcript[1:]] == ["Quero um orçamento", "Terceira", "Quarta"]
+    assert transcript[-1]["content"] == "Quarta"
+    with pytest.raises(IndexError):
+        transcript[4]
+    assert transcript == Transcript(transcript.to_list())
+    assert transcript == transcript.to_list()
+    assert transcript != [HISTORY]
+
+
+def test_returned_dicts_are_copies():
+    raw = {"type": "qualquer"}
+    transcript = Transcript([raw, MESSAGE])
+    transcript[0]["type"] = "alterado"
+    transcript[1]["content"] = "alterado"
+    raw["type"] = "alterado"
+    assert transcript.to_list() == [{"type": "qualquer"}, MESSAGE]
+
+
+def test_conversation_serializes_as_a_list(make_conversation):
+    conv = make_conversation(messages=[HISTORY, MESSAGE])
+    assert isinstance(conv.messages, Transcript)
+    conv.messages.add("Olá!", "agent")
+    dumped = json.loads(conv.model_dump_json())
+    assert dumped["messages"][:2] == [HISTORY, MESSAGE]
+    assert conv.model_dump()["messages"] == dumped["messages"]
+    restored = type(conv).model_validate_json(conv.model_dump_json())
+    assert restored.messages == conv.messages
+    assert type(conv).model_json_schema()["properties"]["messages"]["type"] == "array"
+
+
+def test_intern_table_is_per_transcript():
+    # Remetentes inventados pelo cliente enchem só a tabela da própria conversa
+    noisy = Transcript(dict(MESSAGE, sender=f"remetente-{i}") for i in range(MAX_INTERNED + 10))
+    assert [m["sender"] for m in noisy][-1] == f"remetente-{MAX_INTERNED + 9}"
+    assert noisy[-1] == dict(MESSAGE, sender=f"remetente-{MAX_INTERNED + 9}")  # Guardada como veio
+
+    other = Transcript()
+    other.add("Olá!", "agent")
+    assert noisy._shapes[-1] == SHAPE_RAW and other._shapes[0] == SHAPE_MESSAGE
+    assert other[0]["sender"] == "agent" and other[0]["status"] == "sent"
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+import chat_frames
+import chat_wire
+from chat_frames import encode_event, encode_frame, stamp_frame
+from chat_wire import FLAG_DEFLATE, FLAG_MSGPACK, WireSocket, decode_payload, encode_payload, negotiate, negotiate_socket
+
+needs_msgpack = pytest.mark.skipif(chat_wire.msgpack is None, reason="msgpack não instalado")
+BIG = {"type": "conversation_update", "text": "orçamento " * 200}
+
+
+class FakeSocket:
+    def __init__(self, incoming=()):
+        self.sent = []
+        self.incoming = list(incoming)
+
+    async def send_text(self, frame):
+        self.sent.append(frame)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def receive(self):
+        return self.incoming.pop(0)
+
+
+@pytest.fixture
+def retain(monkeypatch):
+    monkeypatch.setattr(chat_frames, "_retain_messages", False)
+    return monkeypatch
+
+
+def test_negotiate_falls_back_to_the_defaults(monkeypatch):
+    assert negotiate({}) == ("json", "none")
+    assert negotiate({"protocol": "xml", "compression": "gzip"}) == ("json", "none")
+    assert negotiate({"compression": "deflate"}) == ("json", "deflate")
+    monkeypatch.setattr(chat_wire, "PROTOCOLS", ("json",))  # Sem msgpack no ambiente
+    assert negotiate({"protocol": "msgpack"}) == ("json", "none")
+
+
+def test_deflate_round_trip_and_small_frames_stay_text():
+    small = encode_frame({"type": "ping"})
+    assert encode_payload(small, "json", True) == small
+    payload = encode_payload(encode_frame(BIG), "json", True)
+    assert payload[0] == FLAG_DEFLATE and len(payload) < len(encode_frame(BIG))
+    assert decode_payload(payload) == BIG
+
+
+@needs_msgpack
+def test_msgpack_is_encoded_from_the_message_not_from_json(retain):
+    chat_frames.retain_messages()
+    frame = stamp_frame(encode_event("conversation_update", text=BIG["text"]), 7)
+    assert json.loads(frame) == {"seq": 7, **BIG}
+
+    def no_decode(_):
+        raise AssertionError("o JSON não deveria ser decodificado")
+
+    retain.setattr(chat_wire.json, "loads", no_decode)
+    payload = encode_payload(frame, "msgpack", True)
+    assert payload[0] == FLAG_MSGPACK | FLAG_DEFLATE
+    retain.undo()
+    assert decode_payload(payload) == {"seq": 7, **BIG}
+    # Frame sem a mensagem (ex.: veio de outro worker): decodifica o JSON
+    assert decode_payload(encode_payload(str(frame), "msgpack", False)) == {"seq": 7, **BIG}
+
+
+def test_negotiate_socket_confirms_and_wraps(retain):
+    async def scenario():
+        plain = FakeSocket()
+        assert await negotiate_socket(plain, {"type": "user_join"}) is plain and plain.sent == []
+        assert await negotiate_socket(plain, {"protocol": "json"}) is plain  # Pediu o padrão
+
+        raw = FakeSocket([{"type": "websocket.receive", "text": '{"type":"pong"}'}])
+        wire = await negotiate_socket(raw, {"compression": "deflate"})
+        assert isinstance(wire, WireSocket)
+        assert json.loads(raw.sent[-1]) == {"type": "protocol", "protocol": "json", "compression": "deflate"}
+        await wire.send_json({"type": "ping"})  # Pequeno: continua texto
+        await wire.send_json(BIG)
+        assert raw.sent[-2] == '{"type":"ping"}' and decode_payload(raw.sent[-1]) == BIG
+        assert await wire.receive_json() == {"type": "pong"}
+
+    asyncio.run(scenario())
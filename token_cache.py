@@ -0,0 +1,59 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# --- Configuração do cache de tokens verificados ---
+TOKEN_CACHE_SIZE = 4096  # Tokens distintos mantidos (LRU)
+
+
+class TokenCache:
+    """Cache LRU de tokens JWT já verificados -> usuário resolvido.
+
+    - A chave é o digest (blake2b) do token, então o token em si não fica
+      guardado em memória;
+    - cada entrada vale até o `exp` do token: depois disso o `get` descarta
+      e o chamador volta a decodificar (e rejeitar) normalmente;
+    - `invalidate_user` incrementa a geração do e-mail, o que invalida de uma
+      vez todas as entradas daquele usuário sem percorrer o cache.
+    Só resultados válidos são guardados; token inválido sempre passa pelo decode.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[Any, float, str, int]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, token: str) -> Optional[Any]:
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        user, expires_at, email, generation = entry
+        if expires_at <= time.time() or self._generations.get(email, 0) != generation:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user
+
+    def put(self, token: str, user: Any, email: str, expires_at: Optional[float]):
+        if expires_at is None:
+            return  # Sem `exp` não há como saber até quando vale
+        key = self._digest(token)
+        self._entries[key] = (user, float(expires_at), email, self._generations.get(email, 0))
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, email: str):
+        self._generations[email] = self._generations.get(email, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)